@@ -1,766 +1,139 @@
-import base64
-import datetime
-import io
-import json
-import os
-import shlex
-import subprocess
-from ldap3 import Server, Connection, ALL, SUBTREE, Tls
-from ldap3.core.exceptions import LDAPBindError
-
-import jwt
-import pyotp
-import qrcode
-from dotenv import load_dotenv
-from flask import (Flask, jsonify, make_response, redirect,
-                   render_template_string, request, session)
-from flask_cors import CORS
-from flask_sqlalchemy import SQLAlchemy
-from werkzeug.security import check_password_hash, generate_password_hash
+"""
+Flask application factory.
+
+create_app() builds the app from the blueprints in routes/. Importing this
+module only loads Flask, SQLAlchemy and the models; ldap3, qrcode/PIL,
+pyotp and sshpool are imported by the routes that need them. Nothing here
+touches the database or starts threads, so gunicorn can import the app once
+with --preload and fork workers from it. The health scheduler, probe loop and
+SSH/LDAP/password pools all start on first use inside each worker.
+
+GET /api/health reports the worker pid, how long the import took, which of
+the lazily imported modules have been loaded so far, whether the worker is
+cooperative (gevent) and the outbound dependency limits from limits.py.
+GET /metrics serves Prometheus metrics (see metrics.py); admins can profile
+requests on demand through /api/profiling (see profiling.py).
+"""
 
-load_dotenv()
+import time
 
+_import_started = time.perf_counter()
 
-# --- Flask App Setup ---
-app = Flask(__name__)
-
-# Use environment-provided secrets; fall back to unsafe defaults for local dev only
-app.secret_key = os.getenv('FLASK_SECRET_KEY', 'change-me-in-prod')
-CORS(app, resources={
-    r"/*": {
-        "origins": [
-            "http://127.0.0.1:5173",
-            "http://localhost:5173",
-            "http://127.0.0.1:8080",
-            "http://localhost:8080",
-        ],
-        "supports_credentials": True,
-        "methods": ["GET", "POST", "PUT", "DELETE", "OPTIONS"],
-        "allow_headers": ["Content-Type", "Authorization"]
-    }
-})
-# JWT signing key
-SECRET_KEY = os.getenv('JWT_SECRET_KEY', 'change-me-jwt-in-prod')
-# PostgreSQL database config (adjust this!)
-app.config['SQLALCHEMY_DATABASE_URI'] = os.getenv("DATABASE_URI")
-app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
-
-# Initialize SQLAlchemy AFTER config is set
-db = SQLAlchemy(app)
-
-
-# --- User Model ---
-class User(db.Model):
-    id = db.Column(db.Integer, primary_key=True)
-    email = db.Column(db.String(120), unique=True, nullable=False)
-    username = db.Column(db.String(120), nullable=True)
-    password_hash = db.Column(db.Text, nullable=False)
-    user_group = db.Column(db.Text, nullable=True)
-    otp_secret = db.Column(db.String(32), nullable=True)
-    is_2fa_enabled = db.Column(db.Boolean, default=False)
-    _2fa_completed = db.Column(db.Boolean, default=False)
-
-    def set_password(self, password):
-        self.password_hash = generate_password_hash(password)
-
-    def set_user_group(self, user_group):
-        self.user_group = user_group
-
-    def set_username(self, username):  
-        self.username = username
-
-    def check_password(self, password):
-        return check_password_hash(self.password_hash, password)
-
-# --- Dashboard Model ---
-class Dashboard(db.Model):
-    id = db.Column(db.Integer, primary_key=True)
-    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
-    panels = db.Column(db.Text, nullable=False)  # JSON string of panel configurations
-    pinned_panels = db.Column(db.Text, nullable=True)  # JSON string of pinned panel configurations
-    dashboard_layouts = db.Column(db.Text, nullable=True)  # JSON string of dashboard layouts
-    created_at = db.Column(db.DateTime, default=datetime.datetime.now(datetime.UTC))
-    updated_at = db.Column(db.DateTime, default=datetime.datetime.now(datetime.UTC), onupdate=datetime.datetime.now(datetime.UTC))
-    
-    # Relationship
-    user = db.relationship('User', backref=db.backref('dashboards', lazy=True))
-
-# --- Server Model (for infrastructure endpoints) ---
-class ServerHost(db.Model):
-    __tablename__ = 'server'
-    id = db.Column(db.Integer, primary_key=True)
-    hostname = db.Column(db.String(255), unique=True, nullable=False)
-    bmc_ip = db.Column(db.String(255), nullable=True)
-    auth_method = db.Column(db.String(32), nullable=False)  # 'ssh-key' | 'root-password'
-    ssh_key = db.Column(db.Text, nullable=True)             # plain storage (consider encrypting)
-    root_password_hash = db.Column(db.Text, nullable=True)  # hashed root password
-    state = db.Column(db.String(32), nullable=False, default='Unconfigured')  # Up | Down | Unconfigured
-    created_at = db.Column(db.DateTime, default=datetime.datetime.utcnow)
-    updated_at = db.Column(db.DateTime, default=datetime.datetime.utcnow, onupdate=datetime.datetime.utcnow)
-
-    def to_dict(self):
-        return {
-            'id': self.id,
-            'hostname': self.hostname,
-            'bmc_ip': self.bmc_ip,
-            'auth_method': self.auth_method,
-            'state': self.state,
-            'created_at': self.created_at.isoformat() if self.created_at else None,
-            'updated_at': self.updated_at.isoformat() if self.updated_at else None,
-        }
+import os
+import sys
 
-def generate_token(user):
-    payload = {
-        'user_id': user.id,
-        'exp': datetime.datetime.now(datetime.UTC) + datetime.timedelta(hours=12)
-    }
-    return jwt.encode(payload, SECRET_KEY, algorithm='HS256')
-
-# Ensure tables exist on startup (container may restart until DB is ready)
-with app.app_context():
-    try:
-        db.create_all()
-        
-        # Check if we need to add the dashboard_layouts column
-        from sqlalchemy import text
-        try:
-            # Check if the column exists using a raw SQL query
-            result = db.session.execute(text("""
-                SELECT column_name
-                FROM information_schema.columns
-                WHERE table_name = 'dashboard' AND column_name = 'dashboard_layouts'
-            """))
-            
-            if result.fetchone() is None:
-                # Column doesn't exist, add it
-                db.session.execute(text("ALTER TABLE dashboard ADD COLUMN dashboard_layouts TEXT"))
-                db.session.commit()
-                print("[startup] Added dashboard_layouts column to dashboard table")
-            else:
-                print("[startup] dashboard_layouts column already exists")
-        except Exception as e:
-            # Handle case where information_schema query fails (different database type)
-            print("[startup] Error checking for dashboard_layouts column:", str(e))
-            try:
-                # Try to add the column anyway, might fail if it exists
-                db.session.execute(text("ALTER TABLE dashboard ADD COLUMN dashboard_layouts TEXT"))
-                db.session.commit()
-                print("[startup] Added dashboard_layouts column to dashboard table")
-            except Exception as e2:
-                print("[startup] dashboard_layouts column might already exist:", str(e2))
-    except Exception:
-        # Avoid crashing on import logs; container orchestration will retry
-        pass
+from dotenv import load_dotenv
+from flask import Flask, jsonify
+from flask_cors import CORS
 
-"""
-ORIGINAL LOGIN ROUTE (DB-auth only)
-"""
+import limits
+import metrics
+import profiling
+from extensions import db
+from models import ServerHost, ServerStateHistory, User
+from passwords import HashPoolBusy
+from probe import engine as probe_engine
+from routes import register_blueprints
+from scheduler import HealthScheduler
 
-@app.route('/app/login', methods=['POST'])
-def input_form():
-    data = request.get_json()
-    identifier = data.get("email")
-    password = data.get("password")
+load_dotenv()
+
+# Imported on first use by the routes; /api/health shows which are loaded
+LAZY_MODULES = ('ldap3', 'ldappool', 'qrcode', 'PIL', 'pyotp', 'sshpool')
 
-    if not identifier or not password:
-        return jsonify({'error': 'Email/Username and password are required'}), 400
 
-    user = User.query.filter((User.email == identifier) | (User.username == identifier)).first()
+def _monkey_patched():
+    """True when running under gevent workers (see gunicorn.conf.py)."""
+    if 'gevent.monkey' not in sys.modules:
+        return False
+    return sys.modules['gevent.monkey'].is_module_patched('socket')
+
+
+def create_app(config=None):
+    app = Flask(__name__)
+
+    # Use environment-provided secrets; fall back to unsafe defaults for local dev only
+    app.secret_key = os.getenv('FLASK_SECRET_KEY', 'change-me-in-prod')
+    CORS(app, resources={
+        r"/*": {
+            "origins": [
+                "http://127.0.0.1:5173",
+                "http://localhost:5173",
+                "http://127.0.0.1:8080",
+                "http://localhost:8080",
+            ],
+            "supports_credentials": True,
+            "methods": ["GET", "POST", "PUT", "PATCH", "DELETE", "OPTIONS"],
+            "allow_headers": ["Content-Type", "Authorization", "If-Match", "If-None-Match"],
+            "expose_headers": ["ETag"]
+        }
+    })
+    # PostgreSQL database config (adjust this!)
+    app.config['SQLALCHEMY_DATABASE_URI'] = os.getenv("DATABASE_URI")
+    app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+    if config:
+        app.config.update(config)
+
+    db.init_app(app)
+    # Profiling hooks go first so they wrap every other hook, metrics included
+    profiling.init_app(app)
+    metrics.init_app(app)
+    register_blueprints(app)
+
+    health_scheduler = HealthScheduler(app, db, ServerHost, ServerStateHistory, probe_engine)
+    app.extensions['health_scheduler'] = health_scheduler
+
+    @app.before_request
+    def _start_health_scheduler():
+        # Started lazily so it runs inside the serving (post-fork) worker process
+        health_scheduler.start()
+
+    @app.errorhandler(HashPoolBusy)
+    def _hash_pool_busy(e):
+        # Shed load fast rather than queue password hashing without limit
+        response = jsonify({'error': str(e)})
+        response.headers['Retry-After'] = str(e.retry_after)
+        return response, 503
+
+    @app.errorhandler(limits.DependencyBusy)
+    def _dependency_busy(e):
+        # A saturated LDAP/SSH/ping dependency fails fast instead of tying up the worker
+        response = jsonify({'error': str(e), 'dependency': e.dependency})
+        response.headers['Retry-After'] = str(e.retry_after)
+        return response, 503
+
+    @app.route('/api/health', methods=['GET'])
+    def health():
+        return jsonify({
+            'status': 'ok',
+            'pid': os.getpid(),
+            'cold_start_ms': COLD_START_MS,
+            'lazy_modules': {name: name in sys.modules for name in LAZY_MODULES},
+            'cooperative': _monkey_patched(),
+            'outbound': limits.stats(),
+        }), 200
 
-    if not user or not user.check_password(password):
-        return jsonify({'error': 'Invalid username or password'}), 401
+    if hasattr(os, 'register_at_fork'):
+        def _dispose_engines():
+            # Pooled connections opened before a --preload fork must not be shared
+            with app.app_context():
+                for engine in db.engines.values():
+                    engine.dispose(close=False)
 
-    token = generate_token(user)
-    session['user'] = user.email
-    session['role'] = user.user_group
+        os.register_at_fork(after_in_child=_dispose_engines)
 
-    return jsonify({
-        'message': 'Login successful',
-        'user': user.email,
-        'username': user.username,
-        'role': user.user_group,
-        'token': token,
-        '2fa_required': user.is_2fa_enabled,
-        'user_id': user.id
-    }), 200
+    return app
 
-"""
-NEW: API ROUTE FOR REMOTE FILE LISTING VIA SSH
-"""
 
-@app.route('/api/list-ldap-server-files', methods=['GET'])
-def list_ldap_server_files():
-    """
-    List files on a remote server using password-based SSH.
-    Configure credentials via env vars:
-      SSH_HOST, SSH_USER, SSH_PASSWORD (or SSH_PASS), SSH_COMMAND (optional)
-    """
-    LDAP_SERVER_IP = request.args.get('host') or os.getenv("SSH_HOST", "")
-    LDAP_SERVER_USER = request.args.get('user') or os.getenv("SSH_USER", "")
-    LDAP_SERVER_PASSWORD = request.args.get('password') or os.getenv("SSH_PASSWORD", os.getenv("SSH_PASS", ""))
-    command_to_run = request.args.get('cmd') or os.getenv("SSH_COMMAND", "ls -la /home")
-    # Allow overriding execution timeout (seconds)
-    try:
-        exec_timeout = float(request.args.get('timeout') or os.getenv('SSH_TIMEOUT', '25'))
-    except ValueError:
-        exec_timeout = 25.0
-
-    if not LDAP_SERVER_IP or not LDAP_SERVER_USER or not LDAP_SERVER_PASSWORD:
-        return jsonify({
-            'status': 'error',
-            'message': 'Missing SSH env vars. Require SSH_HOST, SSH_USER, SSH_PASSWORD.'
-        }), 400
-
-    try:
-        ssh_command = [
-            "sshpass", "-p", LDAP_SERVER_PASSWORD,
-            "ssh",
-            "-o", "StrictHostKeyChecking=no",
-            "-o", "UserKnownHostsFile=/dev/null",
-            "-o", "PreferredAuthentications=password",
-            "-o", "PubkeyAuthentication=no",
-            "-o", "NumberOfPasswordPrompts=1",
-            "-o", "ConnectTimeout=8",
-            f"{LDAP_SERVER_USER}@{LDAP_SERVER_IP}",
-            # Run via bash -lc so compound commands (cd && ls) work reliably
-            f"bash -lc {shlex.quote(command_to_run)}"
-        ]
-
-        result = subprocess.run(
-            ssh_command,
-            capture_output=True,
-            text=True,
-            check=True,
-            timeout=exec_timeout
-        )
-        return jsonify({'status': 'success', 'files': result.stdout.splitlines()})
-    except subprocess.TimeoutExpired:
-        return jsonify({'status': 'error', 'message': f'SSH command timed out after {exec_timeout} seconds'}), 504
-    except subprocess.CalledProcessError as e:
-        stderr = (e.stderr or '').strip()
-        return jsonify({'status': 'error', 'message': f"Command failed on remote server: {stderr}"}), 500
-    except Exception as e:
-        return jsonify({'status': 'error', 'message': str(e)}), 500
-
-
-@app.route('/api/ldap/users', methods=['GET'])
-def ldap_list_users():
-    """Query an LDAP server for user entries.
-    Query params:
-      base (required)      : Base DN, e.g. dc=example,dc=com
-      uri  (required)      : ldap://host[:port] or ldaps://host[:port]
-      bind_dn (optional)   : Explicit bind DN overrides env LDAP_BIND_DN
-      bind_password        : Overrides env LDAP_BIND_PASSWORD
-      filter (optional)    : LDAP filter (default matches person / inetOrgPerson)
-      attrs (optional)     : Comma-separated attributes (default cn,sn,uid,mail)
-      starttls=1           : Perform StartTLS after connecting (ldap:// only)
-      ssl=1                : Force use_ssl on server (equivalent to ldaps://)
-      debug=1              : Include debug info in error responses
-    Env fallbacks:
-      LDAP_BIND_DN, LDAP_BIND_PASSWORD
-    """
-    base_dn = request.args.get('base')
-    uri = request.args.get('uri')
-    flt = request.args.get('filter', '(|(objectClass=person)(objectClass=inetOrgPerson))')
-    attrs_param = request.args.get('attrs')
-    attr_list = [a.strip() for a in attrs_param.split(',')] if attrs_param else ['cn', 'sn', 'uid', 'mail']
-    debug = request.args.get('debug') == '1' or os.getenv('LDAP_DEBUG') == '1'
-
-    if not base_dn or not uri:
-        return jsonify({'status': 'error', 'message': 'Missing required params base, uri'}), 400
-
-    bind_dn = request.args.get('bind_dn') or os.getenv('LDAP_BIND_DN')
-    bind_pw = request.args.get('bind_password') or os.getenv('LDAP_BIND_PASSWORD')
-    want_starttls = request.args.get('starttls') == '1'
-    force_ssl = request.args.get('ssl') == '1'
-
-    # Determine SSL usage: ldaps:// URI OR ssl=1
-    use_ssl = uri.lower().startswith('ldaps://') or force_ssl
-
-    try:
-        server = Server(uri, get_info=ALL, use_ssl=use_ssl)
-        # Manual bind for better error handling
-        conn = Connection(server, user=bind_dn, password=bind_pw, auto_bind=False) if bind_dn and bind_pw else Connection(server, auto_bind=False)
-        if want_starttls and not use_ssl:
-            if not conn.start_tls():
-                return jsonify({'status': 'error', 'message': 'StartTLS failed', 'result': conn.result}), 502
-        if not conn.bind():
-            code = conn.result.get('description') if conn.result else 'bindFailed'
-            http_code = 401 if 'invalidCredentials' in code else 502
-            payload = {'status': 'error', 'message': f'Bind failed: {code}'}
-            if debug:
-                payload['detail'] = conn.result
-            return jsonify(payload), http_code
-        success = conn.search(search_base=base_dn, search_filter=flt, search_scope=SUBTREE, attributes=attr_list)
-        if not success:
-            return jsonify({'status': 'success', 'users': [], 'count': 0})
-        users = []
-        for entry in conn.entries:
-            data = {'dn': entry.entry_dn}
-            for attr in attr_list:
-                try:
-                    val = entry[attr].value
-                    if isinstance(val, (list, tuple)):
-                        data[attr] = list(val)
-                    else:
-                        data[attr] = val
-                except Exception:
-                    pass
-            users.append(data)
-        return jsonify({'status': 'success', 'count': len(users), 'users': users})
-    except LDAPBindError as e:
-        msg = 'Invalid credentials'
-        payload = {'status': 'error', 'message': msg}
-        if debug:
-            payload['detail'] = str(e)
-        return jsonify(payload), 401
-    except Exception as e:
-        payload = {'status': 'error', 'message': 'LDAP query failed'}
-        if debug:
-            payload['detail'] = str(e)
-        return jsonify(payload), 500
-
-# -------------------- Server CRUD & State Routes --------------------
-def _ping_host(host: str, count: int = 1, timeout: int = 2) -> bool:
-    """Simple ICMP reachability check. If ping not permitted, returns False."""
-    try:
-        result = subprocess.run(
-            ["ping", "-c", str(count), "-W", str(timeout), host],
-            stdout=subprocess.DEVNULL,
-            stderr=subprocess.DEVNULL,
-            check=False,
-        )
-        return result.returncode == 0
-    except Exception:
-        return False
+app = create_app()
 
-@app.route('/api/servers', methods=['GET'])
-def list_servers():
-    records = ServerHost.query.order_by(ServerHost.created_at.desc()).all()
-    return jsonify({'servers': [r.to_dict() for r in records]}), 200
-
-@app.route('/api/servers', methods=['POST'])
-def create_server():
-    data = request.get_json() or {}
-    hostname = (data.get('hostname') or '').strip()
-    bmc_ip = (data.get('bmc_ip') or '').strip() or None
-    auth_method = data.get('auth_method')
-    ssh_key = data.get('ssh_key')
-    root_password = data.get('root_password')
-
-    if not hostname or not auth_method:
-        return jsonify({'error': 'hostname and auth_method are required'}), 400
-    if auth_method not in ('ssh-key', 'root-password'):
-        return jsonify({'error': 'Invalid auth_method'}), 400
-    if ServerHost.query.filter_by(hostname=hostname).first():
-        return jsonify({'error': 'Server already exists'}), 409
-
-    host_obj = ServerHost(
-        hostname=hostname,
-        bmc_ip=bmc_ip,
-        auth_method=auth_method,
-    )
-    if auth_method == 'ssh-key':
-        host_obj.ssh_key = ssh_key.strip() if ssh_key else None
-    else:
-        if not root_password:
-            return jsonify({'error': 'root_password required for root-password auth'}), 400
-        host_obj.root_password_hash = generate_password_hash(root_password)
-
-    # Initial reachability state
-    reachable = _ping_host(hostname)
-    host_obj.state = 'Up' if reachable else 'Down'
-
-    db.session.add(host_obj)
-    try:
-        db.session.commit()
-    except Exception as e:
-        db.session.rollback()
-        return jsonify({'error': f'Database error: {str(e)}'}), 500
-    return jsonify({'message': 'Server created', 'server': host_obj.to_dict()}), 201
-
-@app.route('/api/servers/<int:server_id>', methods=['DELETE'])
-def delete_server(server_id: int):
-    host_obj = ServerHost.query.get(server_id)
-    if not host_obj:
-        return jsonify({'error': 'Server not found'}), 404
-    db.session.delete(host_obj)
-    db.session.commit()
-    return jsonify({'message': 'Server deleted'}), 200
-
-@app.route('/api/servers/<int:server_id>/refresh', methods=['POST'])
-def refresh_server(server_id: int):
-    host_obj = ServerHost.query.get(server_id)
-    if not host_obj:
-        return jsonify({'error': 'Server not found'}), 404
-    host_obj.state = 'Up' if _ping_host(host_obj.hostname) else 'Down'
-    db.session.commit()
-    return jsonify({'message': 'State refreshed', 'server': host_obj.to_dict()}), 200
-
-
-@app.route('/protected')
-def protected():
-	if 'user' in session:
-		return f"Welcome, {session['user']}! <a href='/logout'>Logout</a>"
-	return redirect('/')
-
-@app.route('/logout')
-def logout():
-	session.clear()
-	return redirect('/')
-
-@app.route('/app/2fa', methods=['POST'])
-def setup_2fa():
-    try:
-        data = request.get_json()
-        if not data:
-            return jsonify({'error': 'No data provided'}), 400
-
-        identifier = data.get('email')  # can be email or username
-        if not identifier:
-            return jsonify({'error': 'Email/Username is required'}), 400
-
-        user = User.query.filter((User.email == identifier) | (User.username == identifier)).first()
-        if not user:
-            return jsonify({'error': 'User not found'}), 404
-
-        # Only generate a new secret if not already set
-        if not user.otp_secret:
-            secret = pyotp.random_base32()
-            user.otp_secret = secret
-            db.session.commit()
-        else:
-            secret = user.otp_secret
-
-        # Generate the provisioning URI
-        uri = pyotp.totp.TOTP(secret).provisioning_uri(
-            name=user.email,
-            issuer_name="MyApp"
-        )
-        # Generate QR code
-        qr = qrcode.make(uri)
-        buf = io.BytesIO()
-        qr.save(buf, format='PNG')
-        img_b64 = base64.b64encode(buf.getvalue()).decode()
-
-        return jsonify({'qr_code': img_b64}), 200
-
-    except Exception as e:
-        import traceback
-        traceback.print_exc()
-        return jsonify({'error': 'Failed to generate QR code'}), 500
-
-@app.route('/app/user', methods=['GET'])
-def verify_user():
-	token = None
-	# Get token from Authorization header
-	auth_header = request.headers.get('Authorization')
-	if auth_header and auth_header.startswith('Bearer '):
-		token = auth_header.split(" ")[1]
-
-	if not token:
-		return jsonify({'message': 'Token is missing!'}), 401
-
-	try:
-		decoded = jwt.decode(token, SECRET_KEY, algorithms=['HS256'])
-		current_user = User.query.filter_by(id=decoded['user_id']).first()
-		return jsonify({'message': 'User verified!',"user_group": current_user.user_group}), 200
-	except jwt.ExpiredSignatureError:
-		return jsonify({'message': 'Token has expired!'}), 401
-	except jwt.InvalidTokenError:
-		return jsonify({'message': 'Invalid token!'}), 401
-
-@app.route('/app/verify-2fa', methods=['POST'])
-def verify_2fa():
-    try:
-        data = request.get_json()
-        if not data:
-            return jsonify({'error': 'No data provided'}), 400
-
-        identifier = data.get('email')  # can be email or username
-        code = data.get('code')
-
-        if not identifier or not code:
-            return jsonify({'error': 'Email/Username and code are required'}), 400
-
-        user = User.query.filter((User.email == identifier) | (User.username == identifier)).first()
-        if not user:
-            return jsonify({'error': 'User not found'}), 404
-
-        if not user.otp_secret:
-            return jsonify({'error': '2FA not set up'}), 400
-
-        totp = pyotp.TOTP(user.otp_secret)
-        if totp.verify(code):
-            user._2fa_completed = True
-            db.session.commit()
-            return jsonify({
-                'status': 'success',
-                'user_group': user.user_group
-            }), 200
-        else:
-            return jsonify({'error': 'Invalid code'}), 401
-
-    except Exception as e:
-        return jsonify({'error': 'Internal server error'}), 500
-
-@app.route('/app/2fa-status', methods=['GET'])
-def get_2fa_status():
-	token = None
-	auth_header = request.headers.get('Authorization')
-	if auth_header and auth_header.startswith('Bearer '):
-		token = auth_header.split(" ")[1]
-
-	if not token:
-		return jsonify({'error': 'Token is missing!'}), 401
-
-	try:
-		decoded = jwt.decode(token, SECRET_KEY, algorithms=['HS256'])
-		user = User.query.filter_by(id=decoded['user_id']).first()
-		if not user:
-			return jsonify({'error': 'User not found'}), 404
-		return jsonify({
-			'is_2fa_enabled': user.is_2fa_enabled,
-			'email': user.email,
-			'2fa_completed': user._2fa_completed
-		}), 200
-	except jwt.ExpiredSignatureError:
-		return jsonify({'error': 'Token has expired!'}), 401
-	except jwt.InvalidTokenError:
-		return jsonify({'error': 'Invalid token!'}), 401
-
-@app.route('/app/update-2fa-status', methods=['POST'])
-def update_2fa_status():
-	data = request.get_json()
-	email = data.get('email')
-	is_2fa_enabled = data.get('is_2fa_enabled')
-
-	user = User.query.filter_by(email=email).first()
-	if not user:
-		return jsonify({'error': 'User not found'}), 404
-
-	user.is_2fa_enabled = True if is_2fa_enabled else False
-	db.session.commit()
-
-	return jsonify({'message': '2FA status updated successfully'}), 200
-
-@app.route('/api/users', methods=['GET'])
-def get_users():
-    users = User.query.all()
-    user_list = [{'email': u.email, 'username': u.username, 'user_group': u.user_group, 'password': '*'} for u in users]
-    print(f"[DEBUG] Returning {len(user_list)} users")
-    print(f"[DEBUG] Users: {user_list}")
-    return jsonify(user_list), 200
-
-@app.route('/api/users', methods=['POST'])
-def add_user():
-    data = request.get_json()
-    email = data.get('email')
-    password = data.get('password')
-    username = data.get('username')
-    user_group = data.get('user_group', 'viewer')
-
-    if not email or not password or not username or not user_group:
-        return jsonify({'error': 'Email, username, password, and user group are required'}), 400
-
-    # Check local DB
-    if User.query.filter_by(email=email).first():
-        return jsonify({'error': 'User already exists'}), 409
-
-    # Add to local DB
-    user = User(email=email)
-    user.set_password(password)
-    user.set_user_group(user_group)
-    user.set_username(username)
-    db.session.add(user)
-    try:
-        db.session.commit()
-    except Exception as e:
-        db.session.rollback()
-        import traceback
-        traceback.print_exc()
-        return jsonify({'error': f'Database error: {str(e)}'}), 500
-
-    return jsonify({'message': 'User added'}), 201
-
-@app.route('/api/users/<path:identifier>', methods=['DELETE'])
-def delete_user(identifier):
-    user = User.query.filter((User.email == identifier) | (User.username == identifier)).first()
-    if not user:
-        return jsonify({'error': 'User not found'}), 404
-
-    # Remove from local DB
-    db.session.delete(user)
-    db.session.commit()
-
-    return jsonify({'message': 'User deleted'}), 200
-
-# --- Dashboard Routes ---
-@app.route('/app/dashboard', methods=['GET'])
-def get_dashboard():
-    """Get the current user's dashboard configuration"""
-    token = None
-    auth_header = request.headers.get('Authorization')
-    if auth_header and auth_header.startswith('Bearer '):
-        token = auth_header.split(" ")[1]
-
-    if not token:
-        return jsonify({'error': 'Token is missing!'}), 401
-
-    try:
-        decoded = jwt.decode(token, SECRET_KEY, algorithms=['HS256'])
-        user_id = decoded['user_id']
-        
-        # Get user's dashboard
-        dashboard = Dashboard.query.filter_by(user_id=user_id).first()
-        
-        if dashboard:
-            return jsonify({
-                'panels': json.loads(dashboard.panels),
-                'pinned_panels': json.loads(dashboard.pinned_panels) if dashboard.pinned_panels else [],
-                'dashboard_layouts': json.loads(dashboard.dashboard_layouts) if dashboard.dashboard_layouts else {},
-                'created_at': dashboard.created_at.isoformat(),
-                'updated_at': dashboard.updated_at.isoformat()
-            }), 200
-        else:
-            # Return empty dashboard if none exists
-            return jsonify({'panels': [], 'pinned_panels': [], 'dashboard_layouts': {}}), 200
-            
-    except jwt.ExpiredSignatureError:
-        return jsonify({'error': 'Token has expired!'}), 401
-    except jwt.InvalidTokenError:
-        return jsonify({'error': 'Invalid token!'}), 401
-    except Exception as e:
-        return jsonify({'error': f'Internal server error: {str(e)}'}), 500
-
-@app.route('/app/dashboard', methods=['POST'])
-def save_dashboard():
-    """Save the current user's dashboard configuration"""
-    token = None
-    auth_header = request.headers.get('Authorization')
-    if auth_header and auth_header.startswith('Bearer '):
-        token = auth_header.split(" ")[1]
-
-    if not token:
-        return jsonify({'error': 'Token is missing!'}), 401
-
-    try:
-        decoded = jwt.decode(token, SECRET_KEY, algorithms=['HS256'])
-        user_id = decoded['user_id']
-        
-        data = request.get_json()
-        if not data or 'panels' not in data:
-            return jsonify({'error': 'Panels data is required'}), 400
-        
-        panels = data['panels']
-        pinned_panels = data.get('pinned_panels', []) # Get pinned panels from request
-        dashboard_layouts = data.get('dashboard_layouts', {}) # Get dashboard layouts from request
-        
-        # Check if dashboard exists for this user
-        dashboard = Dashboard.query.filter_by(user_id=user_id).first()
-        
-        if dashboard:
-            # Update existing dashboard
-            dashboard.panels = json.dumps(panels)
-            dashboard.pinned_panels = json.dumps(pinned_panels) # Update pinned panels
-            dashboard.dashboard_layouts = json.dumps(dashboard_layouts) # Update dashboard layouts
-            dashboard.updated_at = datetime.datetime.now(datetime.UTC)
-        else:
-            # Create new dashboard
-            dashboard = Dashboard(
-                user_id=user_id,
-                panels=json.dumps(panels),
-                pinned_panels=json.dumps(pinned_panels), # Initialize pinned panels
-                dashboard_layouts=json.dumps(dashboard_layouts) # Initialize dashboard layouts
-            )
-            db.session.add(dashboard)
-        
-        db.session.commit()
-        
-        return jsonify({
-            'message': 'Dashboard saved successfully',
-            'panels': panels,
-            'pinned_panels': pinned_panels,
-            'dashboard_layouts': dashboard_layouts
-        }), 200
-        
-    except jwt.ExpiredSignatureError:
-        return jsonify({'error': 'Token has expired!'}), 401
-    except jwt.InvalidTokenError:
-        return jsonify({'error': 'Invalid token!'}), 401
-    except Exception as e:
-        db.session.rollback()
-        return jsonify({'error': f'Internal server error: {str(e)}'}), 500
-
-@app.route('/app/dashboard/pin', methods=['POST'])
-def pin_panel():
-    """Pin or unpin a panel to/from dashboard"""
-    token = None
-    auth_header = request.headers.get('Authorization')
-    if auth_header and auth_header.startswith('Bearer '):
-        token = auth_header.split(" ")[1]
-
-    if not token:
-        return jsonify({'error': 'Token is missing!'}), 401
-
-    try:
-        decoded = jwt.decode(token, SECRET_KEY, algorithms=['HS256'])
-        user_id = decoded['user_id']
-        
-        data = request.get_json()
-        if not data or 'panel' not in data or 'action' not in data:
-            return jsonify({'error': 'Panel data and action are required'}), 400
-        
-        panel = data['panel']
-        action = data['action']  # 'pin' or 'unpin'
-        
-        # Get user's dashboard
-        dashboard = Dashboard.query.filter_by(user_id=user_id).first()
-        
-        if not dashboard:
-            return jsonify({'error': 'Dashboard not found'}), 404
-        
-        # Get current pinned panels
-        current_pinned = json.loads(dashboard.pinned_panels) if dashboard.pinned_panels else []
-        
-        if action == 'pin':
-            # Check if panel is already pinned
-            if not any(p['id'] == panel['id'] for p in current_pinned):
-                current_pinned.append(panel)
-                message = 'Panel pinned successfully'
-            else:
-                return jsonify({'error': 'Panel is already pinned'}), 400
-        elif action == 'unpin':
-            # Remove panel from pinned list
-            current_pinned = [p for p in current_pinned if p['id'] != panel['id']]
-            message = 'Panel unpinned successfully'
-        else:
-            return jsonify({'error': 'Invalid action. Use "pin" or "unpin"'}), 400
-        
-        # Update dashboard
-        dashboard.pinned_panels = json.dumps(current_pinned)
-        dashboard.updated_at = datetime.datetime.now(datetime.UTC)
-        db.session.commit()
-        
-        return jsonify({
-            'message': message,
-            'pinned_panels': current_pinned
-        }), 200
-        
-    except jwt.ExpiredSignatureError:
-        return jsonify({'error': 'Token has expired!'}), 401
-    except jwt.InvalidTokenError:
-        return jsonify({'error': 'Invalid token!'}), 401
-    except Exception as e:
-        db.session.rollback()
-        return jsonify({'error': f'Internal server error: {str(e)}'}), 500
+COLD_START_MS = round((time.perf_counter() - _import_started) * 1000, 1)
+print(f"[startup] App ready in {COLD_START_MS} ms (pid {os.getpid()})")
 
 
 def seed_database():
-    """Create tables and seed default users exactly once."""
+    """Seed default users exactly once (run migrations.py first)."""
     with app.app_context():
-        db.create_all()
-        
         if User.query.first():
             print("[seed] Users already exist; skipping.")
             return
@@ -784,5 +157,7 @@ def seed_database():
 
 # driver function
 if __name__ == '__main__':
+    import migrations
+    migrations.upgrade(app.config['SQLALCHEMY_DATABASE_URI'])
     seed_database()
-    app.run(host='0.0.0.0', port=5000, debug=True)
\ No newline at end of file
+    app.run(host='0.0.0.0', port=5000, debug=True)
@@ -0,0 +1,309 @@
+"""
+Small in-process TTL cache with LRU eviction.
+
+- Entries are fresh for `ttl` seconds, then may be served stale for another
+  `stale_ttl` seconds while a background thread reloads them
+  (stale-while-revalidate).
+- Memory is bounded by `max_bytes` (an estimate from `sizer`) and
+  `max_entries`; least recently used entries are evicted first.
+- Concurrent misses for one key share a single load.
+- Caches live per process. With several gunicorn workers, pass
+  `generation_file`: invalidate(), invalidate_keys() and invalidate_prefix()
+  append an event to it, and every worker replays the events it has not
+  seen yet on its next lookup. The read offset only grows, so two events in
+  quick succession are never mistaken for one. Once the file passes
+  GENERATION_LOG_MAX_BYTES it is replaced, and workers that notice the new
+  file drop everything once.
+"""
+
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+
+MISS = 'MISS'
+HIT = 'HIT'
+STALE = 'STALE'
+
+GENERATION_LOG_MAX_BYTES = 1024 * 1024
+
+
+def json_size(value):
+    """Approximate the memory cost of a JSON-like value by its encoded length."""
+    return len(json.dumps(value, default=str, separators=(',', ':')))
+
+
+class _Entry:
+    __slots__ = ('value', 'size', 'fresh_until', 'stale_until', 'refreshing')
+
+    def __init__(self, value, size, fresh_until, stale_until):
+        self.value = value
+        self.size = size
+        self.fresh_until = fresh_until
+        self.stale_until = stale_until
+        self.refreshing = False
+
+
+class TTLCache:
+    def __init__(self, ttl, stale_ttl=0.0, max_bytes=None, max_entries=None, sizer=json_size,
+                 generation_file=None, name='cache'):
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self.max_bytes = max_bytes
+        self.max_entries = max_entries
+        self.sizer = sizer
+        self.generation_file = generation_file
+        self.name = name
+        self._data = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.RLock()
+        self._loading = {}
+        self._generation = self._read_generation()
+        self.hits = self.misses = self.stale_hits = self.evictions = 0
+
+    # --- cross-process invalidation ---
+    def _log_position(self):
+        """(inode, size) of the generation file, (None, 0) while it doesn't exist."""
+        try:
+            st = os.stat(self.generation_file)
+        except FileNotFoundError:
+            return None, 0
+        return st.st_ino, st.st_size
+
+    def _read_generation(self):
+        # New caches start at the end of the log: older events predate their entries.
+        # Create it now so a replacement is always seen as a change of inode.
+        if not self.generation_file:
+            return None
+        open(self.generation_file, 'ab').close()
+        return self._log_position()
+
+    def _check_generation(self):
+        if not self.generation_file:
+            return
+        inode, size = self._log_position()
+        seen_inode, offset = self._generation
+        if seen_inode is None and inode is not None:
+            seen_inode = inode  # created since we last looked: every event in it is new
+        if inode != seen_inode or size < offset:
+            # Replaced or truncated: the events in between are gone, so drop everything
+            self._data.clear()
+            self._bytes = 0
+            self._generation = (inode, size)
+            return
+        if size == offset:
+            return
+        try:
+            with open(self.generation_file, 'rb') as f:
+                f.seek(offset)
+                chunk = f.read(size - offset)
+        except FileNotFoundError:
+            return
+        complete = chunk.rfind(b'\n') + 1  # a line still being written waits for the next check
+        for line in chunk[:complete].splitlines():
+            try:
+                event = json.loads(line)
+            except ValueError:
+                continue
+            self._apply_event(event)
+        self._generation = (inode, offset + complete)
+
+    def _apply_event(self, event):
+        if 'keys' in event:
+            for key in event['keys']:
+                self._remove(_from_json(key))
+        elif 'prefix' in event:
+            prefix = _from_json(event['prefix'])
+            for key in [k for k in self._data if _matches_prefix(k, prefix)]:
+                self._remove(key)
+        else:
+            self._data.clear()
+            self._bytes = 0
+
+    def _broadcast(self, event):
+        """Append one event for the other workers, then catch up on the log (ours included)."""
+        if not self.generation_file:
+            return
+        line = (json.dumps(event, separators=(',', ':')) + '\n').encode()
+        for _ in range(2):
+            # O_APPEND writes of one short line don't interleave with other writers
+            fd = os.open(self.generation_file, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+            try:
+                os.write(fd, line)
+                written_to = os.fstat(fd)
+            finally:
+                os.close(fd)
+            inode, size = self._log_position()
+            if inode == written_to.st_ino:
+                break
+            # Replaced while we wrote: readers that already switched never saw the line
+        if size > GENERATION_LOG_MAX_BYTES:
+            tmp = f'{self.generation_file}.{os.getpid()}.{threading.get_ident()}.tmp'
+            open(tmp, 'wb').close()
+            os.replace(tmp, self.generation_file)
+        self._check_generation()
+
+    # --- internals ---
+    def _remove(self, key):
+        entry = self._data.pop(key, None)
+        if entry is not None:
+            self._bytes -= entry.size
+
+    def _evict(self):
+        while self._data and ((self.max_bytes and self._bytes > self.max_bytes) or
+                              (self.max_entries and len(self._data) > self.max_entries)):
+            _key, entry = self._data.popitem(last=False)
+            self._bytes -= entry.size
+            self.evictions += 1
+
+    def _store(self, key, value, ttl=None):
+        size = self.sizer(value) if self.sizer else 0
+        if self.max_bytes and size > self.max_bytes:
+            return  # never cache something that would evict everything else
+        now = time.monotonic()
+        ttl = self.ttl if ttl is None else ttl
+        with self._lock:
+            self._remove(key)
+            self._data[key] = _Entry(value, size, now + ttl, now + ttl + self.stale_ttl)
+            self._bytes += size
+            self._evict()
+
+    def _load(self, key, loader):
+        """Single-flight load: concurrent callers for one key wait for one loader call."""
+        with self._lock:
+            event = self._loading.get(key)
+            owner = event is None
+            if owner:
+                event = self._loading[key] = threading.Event()
+        if not owner:
+            event.wait()
+            with self._lock:
+                entry = self._data.get(key)
+                if entry is not None:
+                    return entry.value
+            return self._load(key, loader)  # owner failed; try ourselves
+        try:
+            value = loader()
+            self._store(key, value)
+            return value
+        finally:
+            with self._lock:
+                self._loading.pop(key, None)
+            event.set()
+
+    def _refresh_in_background(self, key, loader):
+        def run():
+            try:
+                self._store(key, loader())
+            except Exception as e:
+                print(f"[{self.name}] Background refresh failed: {e}")
+            finally:
+                with self._lock:
+                    entry = self._data.get(key)
+                    if entry is not None:
+                        entry.refreshing = False
+
+        threading.Thread(target=run, name=f'{self.name}-refresh', daemon=True).start()
+
+    # --- public API ---
+    def get(self, key, default=None):
+        now = time.monotonic()
+        with self._lock:
+            self._check_generation()
+            entry = self._data.get(key)
+            if entry is None or now >= entry.fresh_until:
+                return default
+            self._data.move_to_end(key)
+            return entry.value
+
+    def set(self, key, value, ttl=None):
+        with self._lock:
+            self._check_generation()
+        self._store(key, value, ttl)
+
+    def get_or_load(self, key, loader):
+        """Return (value, status) where status is HIT, STALE or MISS."""
+        now = time.monotonic()
+        with self._lock:
+            self._check_generation()
+            entry = self._data.get(key)
+            if entry is not None and now < entry.stale_until:
+                self._data.move_to_end(key)
+                if now < entry.fresh_until:
+                    self.hits += 1
+                    return entry.value, HIT
+                self.stale_hits += 1
+                if not entry.refreshing:
+                    entry.refreshing = True
+                    self._refresh_in_background(key, loader)
+                return entry.value, STALE
+            self.misses += 1
+        return self._load(key, loader), MISS
+
+    def invalidate(self, predicate=None):
+        """Drop entries whose key matches predicate, in this process only. Without a
+        predicate every entry goes, in every worker. Returns the local count."""
+        with self._lock:
+            self._check_generation()
+            keys = [k for k in self._data if predicate is None or predicate(k)]
+            for key in keys:
+                self._remove(key)
+            if predicate is None:
+                self._broadcast({'all': True})
+        return len(keys)
+
+    def invalidate_keys(self, keys):
+        """Drop these keys (JSON-serializable) in every worker. Returns the local count."""
+        keys = list(keys)
+        with self._lock:
+            self._check_generation()
+            removed = sum(1 for key in keys if key in self._data)
+            for key in keys:
+                self._remove(key)
+            if keys:
+                self._broadcast({'keys': keys})
+        return removed
+
+    def invalidate_prefix(self, prefix):
+        """Drop tuple keys starting with prefix in every worker; None in prefix
+        matches any value. Returns the local count."""
+        prefix = tuple(prefix)
+        with self._lock:
+            self._check_generation()
+            keys = [k for k in self._data if _matches_prefix(k, prefix)]
+            for key in keys:
+                self._remove(key)
+            self._broadcast({'prefix': prefix})
+        return len(keys)
+
+    def discard(self, key):
+        """Drop one key in this process only (no cross-worker broadcast)."""
+        with self._lock:
+            self._remove(key)
+
+    def stats(self):
+        with self._lock:
+            return {
+                'entries': len(self._data),
+                'bytes': self._bytes,
+                'max_bytes': self.max_bytes,
+                'ttl': self.ttl,
+                'stale_ttl': self.stale_ttl,
+                'hits': self.hits,
+                'stale_hits': self.stale_hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+            }
+
+
+def _from_json(value):
+    """Undo JSON's tuple-to-list conversion so broadcast keys compare equal again."""
+    if isinstance(value, list):
+        return tuple(_from_json(v) for v in value)
+    return value
+
+
+def _matches_prefix(key, prefix):
+    return (isinstance(key, tuple) and len(key) >= len(prefix) and
+            all(want is None or have == want for have, want in zip(key, prefix)))
@@ -0,0 +1,5 @@
+"""Flask extensions, created unbound and attached to the app in create_app()."""
+
+from flask_sqlalchemy import SQLAlchemy
+
+db = SQLAlchemy()
@@ -0,0 +1,70 @@
+"""
+gunicorn settings (start.sh runs `gunicorn -c gunicorn.conf.py app:app`).
+
+GUNICORN_WORKER_CLASS=gevent (the default) serves each worker's requests as
+greenlets. A request waiting on SSH, LDAP or a ping then only parks its own
+greenlet, and the worker keeps answering dashboard calls. The stdlib is
+monkey-patched here, before --preload imports the app, so every module
+(sockets, subprocess, threading, selectors) sees the cooperative versions.
+psycopg2 gets a gevent wait callback so queries yield too. Outbound calls are
+capped per dependency in limits.py, which keeps one slow host from taking the
+whole worker. GUNICORN_WORKER_CLASS=sync restores one request per process.
+
+Config via env vars:
+  GUNICORN_WORKER_CLASS        gevent | sync (default gevent)
+  WEB_CONCURRENCY              worker processes (default 1)
+  GUNICORN_WORKER_CONNECTIONS  concurrent requests per gevent worker (default 1000)
+  GUNICORN_TIMEOUT             seconds before a silent worker is restarted (default 60)
+  PROMETHEUS_MULTIPROC_DIR     per-worker metric files (default: <tmp>/prometheus-metrics)
+"""
+
+import os
+import tempfile
+
+# Each worker writes its metric samples here; /metrics sums them (see metrics.py).
+# Set before --preload imports prometheus_client, and emptied on every start.
+_metrics_dir = os.environ.setdefault('PROMETHEUS_MULTIPROC_DIR',
+                                     os.path.join(tempfile.gettempdir(), 'prometheus-metrics'))
+os.makedirs(_metrics_dir, exist_ok=True)
+for _name in os.listdir(_metrics_dir):
+    if _name.endswith('.db'):
+        os.remove(os.path.join(_metrics_dir, _name))
+
+worker_class = os.getenv('GUNICORN_WORKER_CLASS', 'gevent')
+
+if worker_class == 'gevent':
+    from gevent import monkey
+    monkey.patch_all()
+
+    def _gevent_wait_callback(conn, timeout=None):
+        from gevent.socket import wait_read, wait_write
+        from psycopg2 import OperationalError, extensions
+        while True:
+            state = conn.poll()
+            if state == extensions.POLL_OK:
+                return
+            if state == extensions.POLL_READ:
+                wait_read(conn.fileno(), timeout=timeout)
+            elif state == extensions.POLL_WRITE:
+                wait_write(conn.fileno(), timeout=timeout)
+            else:
+                raise OperationalError(f'Bad result from poll: {state!r}')
+
+    try:
+        from psycopg2 import extensions as _pg_extensions
+    except ImportError:
+        pass
+    else:
+        _pg_extensions.set_wait_callback(_gevent_wait_callback)
+
+bind = '0.0.0.0:5000'
+preload_app = True
+workers = int(os.getenv('WEB_CONCURRENCY', '1'))
+worker_connections = int(os.getenv('GUNICORN_WORKER_CONNECTIONS', '1000'))
+timeout = int(os.getenv('GUNICORN_TIMEOUT', '60'))
+
+
+def child_exit(server, worker):
+    # Drop the dead worker's in-flight gauge samples
+    from prometheus_client import multiprocess
+    multiprocess.mark_process_dead(worker.pid)
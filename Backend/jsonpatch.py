@@ -0,0 +1,149 @@
+"""
+Minimal RFC 6902 JSON Patch with RFC 6901 JSON Pointers.
+
+Supports add, remove, replace, move, copy and test. apply_patch() works on a
+deep copy and only returns the result if every operation succeeds, so a
+failing patch never leaves a half-applied document.
+"""
+
+import copy
+
+OPERATIONS = ('add', 'remove', 'replace', 'move', 'copy', 'test')
+
+
+class JsonPatchError(Exception):
+    def __init__(self, message, index=None):
+        super().__init__(message if index is None else f'Operation {index}: {message}')
+        self.index = index
+
+
+class JsonPatchConflict(JsonPatchError):
+    """A 'test' operation did not match."""
+
+
+def parse_pointer(pointer):
+    if not isinstance(pointer, str) or (pointer and not pointer.startswith('/')):
+        raise JsonPatchError(f'Invalid JSON pointer: {pointer!r}')
+    if pointer == '':
+        return []
+    return [part.replace('~1', '/').replace('~0', '~') for part in pointer[1:].split('/')]
+
+
+def _array_index(container, token, allow_end=False):
+    if allow_end and token == '-':
+        return len(container)
+    if not token.isdigit() or (token != '0' and token.startswith('0')):
+        raise JsonPatchError(f'Invalid array index: {token!r}')
+    index = int(token)
+    limit = len(container) if allow_end else len(container) - 1
+    if index > limit:
+        raise JsonPatchError(f'Array index out of range: {index}')
+    return index
+
+
+def _resolve_parent(doc, parts):
+    node = doc
+    for token in parts[:-1]:
+        if isinstance(node, list):
+            node = node[_array_index(node, token)]
+        elif isinstance(node, dict):
+            if token not in node:
+                raise JsonPatchError(f'Path not found: /{"/".join(parts)}')
+            node = node[token]
+        else:
+            raise JsonPatchError(f'Path not found: /{"/".join(parts)}')
+    return node
+
+
+def _get(doc, parts):
+    node = doc
+    for token in parts:
+        if isinstance(node, list):
+            node = node[_array_index(node, token)]
+        elif isinstance(node, dict) and token in node:
+            node = node[token]
+        else:
+            raise JsonPatchError(f'Path not found: /{"/".join(parts)}')
+    return node
+
+
+def _add(doc, parts, value):
+    if not parts:
+        return value
+    parent = _resolve_parent(doc, parts)
+    token = parts[-1]
+    if isinstance(parent, list):
+        parent.insert(_array_index(parent, token, allow_end=True), value)
+    elif isinstance(parent, dict):
+        parent[token] = value
+    else:
+        raise JsonPatchError(f'Cannot add to a scalar at /{"/".join(parts)}')
+    return doc
+
+
+def _remove(doc, parts):
+    if not parts:
+        raise JsonPatchError('Cannot remove the whole document')
+    parent = _resolve_parent(doc, parts)
+    token = parts[-1]
+    if isinstance(parent, list):
+        return doc, parent.pop(_array_index(parent, token))
+    if isinstance(parent, dict) and token in parent:
+        return doc, parent.pop(token)
+    raise JsonPatchError(f'Path not found: /{"/".join(parts)}')
+
+
+def apply_patch(document, operations):
+    """Apply a list of operations to a copy of document and return the copy."""
+    if not isinstance(operations, list):
+        raise JsonPatchError('A JSON Patch must be an array of operations')
+    doc = copy.deepcopy(document)
+    for index, operation in enumerate(operations):
+        if not isinstance(operation, dict) or operation.get('op') not in OPERATIONS:
+            raise JsonPatchError(f'Unsupported operation {operation!r}', index)
+        op = operation['op']
+        try:
+            parts = parse_pointer(operation.get('path'))
+            if op in ('add', 'replace', 'test') and 'value' not in operation:
+                raise JsonPatchError(f"'{op}' requires a value")
+            if op == 'add':
+                doc = _add(doc, parts, copy.deepcopy(operation['value']))
+            elif op == 'remove':
+                doc, _ = _remove(doc, parts)
+            elif op == 'replace':
+                doc, _ = _remove(doc, parts) if parts else (doc, None)
+                doc = _add(doc, parts, copy.deepcopy(operation['value']))
+            elif op in ('move', 'copy'):
+                source = parse_pointer(operation.get('from'))
+                if op == 'move':
+                    if parts[:len(source)] == source and len(parts) > len(source):
+                        raise JsonPatchError('Cannot move a value into one of its children')
+                    doc, value = _remove(doc, source)
+                else:
+                    value = copy.deepcopy(_get(doc, source))
+                doc = _add(doc, parts, value)
+            elif op == 'test':
+                if _get(doc, parts) != operation['value']:
+                    raise JsonPatchConflict(f'Test failed at {operation["path"]}')
+        except JsonPatchError as e:
+            if e.index is not None:
+                raise
+            raise type(e)(str(e), index) from None
+    return doc
+
+
+def touched_roots(operations):
+    """Top-level member names a patch reads or writes (None = whole document)."""
+    roots = set()
+    for operation in operations if isinstance(operations, list) else []:
+        if not isinstance(operation, dict):
+            continue
+        for key in ('path', 'from'):
+            pointer = operation.get(key)
+            if pointer is None:
+                continue
+            parts = parse_pointer(pointer)
+            if not parts:
+                return None
+            roots.add(parts[0])
+    return roots
@@ -0,0 +1,418 @@
+"""
+Pooled, pre-bound LDAP connections.
+
+Pools are keyed by (uri, bind_dn, TLS mode, password digest). Each pool owns
+one ldap3 Server whose schema/DSE info is read by the first connection only;
+later connections bind with read_server_info=False. Connections are
+health-checked when they have been idle a while, expired after
+LDAP_POOL_IDLE_TIMEOUT, and replaced transparently when a search fails with
+a communication error.
+
+Checkouts also count against the worker-wide LDAP limit in limits.py, per
+server URI, so one slow server can't take every request slot.
+
+search_page() runs one page of a paged-results search, so large directories
+can be read (and streamed) without one huge result set. Servers tie the
+paged-results cookie to the connection that started the search, so between
+pages that connection is pinned to an opaque cursor token (see
+CursorRegistry) instead of going back to the pool. A pin is released after
+the last page, or by the reaper once it has been idle for LDAP_CURSOR_TTL.
+Pins live in the worker that created them.
+
+A background reaper runs every LDAP_POOL_SWEEP_INTERVAL seconds to close idle
+connections, drop unused pools and release expired cursor pins, so a quiet
+worker doesn't keep stale binds open.
+
+Config via env vars:
+  LDAP_POOL_MAX_SIZE       connections per pool (default 5)
+  LDAP_POOL_IDLE_TIMEOUT   seconds before an idle connection is closed (default 300)
+  LDAP_POOL_CHECK_AFTER    idle seconds before a checkout health check (default 30)
+  LDAP_POOL_WAIT           seconds to wait for a free connection (default 10)
+  LDAP_TIMEOUT             connect/receive timeout in seconds (default 10)
+  LDAP_POOL_SWEEP_INTERVAL seconds between reaper runs (default 30)
+  LDAP_CURSOR_TTL          seconds a cursor keeps its connection between pages (default 120)
+  LDAP_CURSOR_MAX          pinned cursors per pool; the oldest is dropped beyond this
+                           (default half of LDAP_POOL_MAX_SIZE, at least 1)
+"""
+
+import contextlib
+import hashlib
+import os
+import secrets
+import threading
+import time
+from collections import deque
+
+from ldap3 import ALL, BASE, SUBTREE, Connection, Server
+from ldap3.core.exceptions import LDAPCommunicationError, LDAPSessionTerminatedByServerError, LDAPSocketOpenError
+
+from limits import DependencyBusy, limiters
+
+ldap_limiter = limiters['ldap']
+
+PAGED_RESULTS_OID = '1.2.840.113556.1.4.319'
+
+# Errors that mean the connection is dead rather than the request being bad
+_CONNECTION_ERRORS = (LDAPCommunicationError, LDAPSessionTerminatedByServerError, LDAPSocketOpenError, OSError)
+
+
+class LDAPPoolError(Exception):
+    def __init__(self, message, result=None):
+        super().__init__(message)
+        self.result = result
+
+
+class LDAPStartTLSFailed(LDAPPoolError):
+    pass
+
+
+class LDAPBindFailed(LDAPPoolError):
+    @property
+    def code(self):
+        return (self.result or {}).get('description') or 'bindFailed'
+
+
+class LDAPPoolExhausted(LDAPPoolError):
+    pass
+
+
+class LDAPCursorExpired(LDAPPoolError):
+    """The server no longer recognises a paged-results cookie."""
+
+
+def is_connection_error(exc):
+    return isinstance(exc, _CONNECTION_ERRORS)
+
+
+def search_page(conn, base_dn, search_filter, attributes, page_size, cookie=None):
+    """Run one page of a paged-results (RFC 2696) subtree search.
+
+    Returns (entries, next_cookie). Entries are dicts holding the dn plus
+    whichever requested attributes are present; next_cookie is None after
+    the last page. Reads conn.response directly instead of conn.entries to
+    skip building Entry objects.
+    """
+    conn.search(search_base=base_dn, search_filter=search_filter, search_scope=SUBTREE,
+                attributes=attributes, paged_size=page_size, paged_cookie=cookie)
+    result = conn.result or {}
+    if cookie and result.get('result') not in (0, None):
+        raise LDAPCursorExpired(f"Paged search cookie rejected: {result.get('description')}", result)
+
+    entries = []
+    for item in conn.response or []:
+        if item.get('type') != 'searchResEntry':
+            continue
+        data = {'dn': item['dn']}
+        found = {k.lower(): v for k, v in (item.get('attributes') or {}).items()}
+        for attr in attributes:
+            val = found.get(attr.lower())
+            if val is None or val == []:
+                continue
+            data[attr] = list(val) if isinstance(val, (list, tuple)) else val
+        entries.append(data)
+
+    control = (result.get('controls') or {}).get(PAGED_RESULTS_OID) or {}
+    next_cookie = (control.get('value') or {}).get('cookie') or None
+    return entries, next_cookie
+
+
+def abandon_paged_search(conn, base_dn, search_filter, cookie):
+    """Tell the server to drop the state of an unfinished paged search."""
+    with contextlib.suppress(Exception):
+        conn.search(search_base=base_dn, search_filter=search_filter, search_scope=SUBTREE,
+                    attributes=['1.1'], paged_size=0, paged_cookie=cookie)
+
+
+class LDAPPool:
+    def __init__(self, uri, bind_dn, bind_pw, use_ssl, starttls, max_size, idle_timeout, check_after,
+                 wait_timeout, timeout):
+        self.uri = uri
+        self.bind_dn = bind_dn
+        self.bind_pw = bind_pw
+        self.starttls = starttls
+        self.max_size = max_size
+        self.idle_timeout = idle_timeout
+        self.check_after = check_after
+        self.wait_timeout = wait_timeout
+        self.timeout = timeout
+        self.server = Server(uri, get_info=ALL, use_ssl=use_ssl, connect_timeout=timeout)
+        self.info_loaded = False
+        self.last_used = time.monotonic()
+        self._idle = deque()   # (conn, idle_since), most recently used on the right
+        self._size = 0
+        self._cond = threading.Condition()
+
+    def _connect(self):
+        read_info = not self.info_loaded
+        # ldap3 packs receive_timeout into SO_RCVTIMEO, which needs whole seconds
+        receive_timeout = max(1, int(self.timeout))
+        if self.bind_dn and self.bind_pw:
+            conn = Connection(self.server, user=self.bind_dn, password=self.bind_pw, auto_bind=False,
+                              receive_timeout=receive_timeout)
+        else:
+            conn = Connection(self.server, auto_bind=False, receive_timeout=receive_timeout)
+        try:
+            if self.starttls:
+                if not conn.start_tls(read_server_info=False):
+                    raise LDAPStartTLSFailed('StartTLS failed', conn.result)
+            if not conn.bind(read_server_info=read_info):
+                code = conn.result.get('description') if conn.result else 'bindFailed'
+                raise LDAPBindFailed(f'Bind failed: {code}', conn.result)
+        except BaseException:
+            conn.unbind()
+            raise
+        self.info_loaded = True
+        return conn
+
+    @staticmethod
+    def _healthy(conn):
+        if conn.closed or not conn.bound:
+            return False
+        try:
+            # Root DSE read with no attributes: the cheapest round trip available
+            conn.search('', '(objectClass=*)', search_scope=BASE, attributes=['1.1'])
+            return True
+        except _CONNECTION_ERRORS:
+            return False
+
+    def _checkout(self):
+        deadline = time.monotonic() + self.wait_timeout
+        with self._cond:
+            while True:
+                if self._idle:
+                    conn, idle_since = self._idle.pop()
+                    break
+                if self._size < self.max_size:
+                    self._size += 1
+                    conn = None
+                    break
+                remaining = deadline - time.monotonic()
+                if remaining <= 0 or not self._cond.wait(remaining):
+                    raise LDAPPoolExhausted(f'All {self.max_size} LDAP connections to {self.uri} are busy')
+
+        if conn is not None:
+            if time.monotonic() - idle_since < self.check_after or self._healthy(conn):
+                return conn
+            self._discard(conn, release_slot=False)
+        try:
+            return self._connect()
+        except BaseException:
+            self._release_slot()
+            raise
+
+    def _release_slot(self):
+        with self._cond:
+            self._size -= 1
+            self._cond.notify()
+
+    def _discard(self, conn, release_slot=True):
+        with contextlib.suppress(Exception):
+            conn.unbind()
+        if release_slot:
+            self._release_slot()
+
+    def _checkin(self, conn):
+        with self._cond:
+            self._idle.append((conn, time.monotonic()))
+            self._cond.notify()
+
+    def acquire(self):
+        """Check out a bound connection; pair with release()."""
+        self.last_used = time.monotonic()
+        try:
+            ldap_limiter.acquire(self.uri)
+        except DependencyBusy as e:
+            raise LDAPPoolExhausted(str(e))
+        try:
+            return self._checkout()
+        except BaseException:
+            ldap_limiter.release(self.uri)
+            raise
+
+    def release(self, conn, broken=False):
+        try:
+            if broken:
+                self._discard(conn)
+            else:
+                self._checkin(conn)
+        finally:
+            ldap_limiter.release(self.uri)
+
+    @contextlib.contextmanager
+    def connection(self):
+        """Yield a bound connection; it is discarded if a connection error escapes."""
+        conn = self.acquire()
+        try:
+            yield conn
+        except _CONNECTION_ERRORS:
+            self.release(conn, broken=True)
+            raise
+        except BaseException:
+            self.release(conn)
+            raise
+        self.release(conn)
+
+    def run(self, fn):
+        """Call fn(conn); on a dead connection retry once on a fresh one."""
+        try:
+            with self.connection() as conn:
+                return fn(conn)
+        except _CONNECTION_ERRORS:
+            with self.connection() as conn:
+                return fn(conn)
+
+    def expire_idle(self, now=None):
+        now = time.monotonic() if now is None else now
+        expired = []
+        with self._cond:
+            # Oldest idle connections sit on the left
+            while self._idle and now - self._idle[0][1] >= self.idle_timeout:
+                expired.append(self._idle.popleft()[0])
+        for conn in expired:
+            self._discard(conn)
+
+    def close(self):
+        with self._cond:
+            idle, self._idle = list(self._idle), deque()
+        for conn, _ in idle:
+            self._discard(conn)
+
+
+class _Pin:
+    __slots__ = ('pool', 'conn', 'base_dn', 'search_filter', 'cookie', 'pending', 'expires')
+
+    def __init__(self, pool, conn, base_dn, search_filter, cookie, pending, expires):
+        self.pool = pool
+        self.conn = conn
+        self.base_dn = base_dn
+        self.search_filter = search_filter
+        self.cookie = cookie
+        self.pending = pending
+        self.expires = expires
+
+
+class CursorRegistry:
+    """Connections held between the pages of a paged search, keyed by cursor token.
+
+    A pinned connection stays checked out of its pool (and keeps its LDAP limit
+    slot) until take() hands it back to a request, the search ends, or the pin
+    expires and is reaped.
+    """
+
+    def __init__(self, ttl, max_per_pool):
+        self.ttl = ttl
+        self.max_per_pool = max_per_pool
+        self._pins = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def new_token():
+        return secrets.token_urlsafe(18)
+
+    def pin(self, pool, conn, base_dn, search_filter, cookie, token=None, pending=None):
+        """Keep conn (checked out of pool) for the next page; returns the cursor token.
+        pending is a page already read from the server but never delivered; the
+        request that takes the cursor sends it before reading further."""
+        token = token or self.new_token()
+        evicted = []
+        with self._lock:
+            mine = sorted((pin.expires, key) for key, pin in self._pins.items() if pin.pool is pool)
+            while mine and len(mine) >= self.max_per_pool:
+                evicted.append(self._pins.pop(mine.pop(0)[1]))
+            self._pins[token] = _Pin(pool, conn, base_dn, search_filter, cookie, pending,
+                                     time.monotonic() + self.ttl)
+        for pin in evicted:
+            self._drop(pin)
+        return token
+
+    def take(self, token, pool):
+        """Claim a pinned search: (conn, cookie, pending). The caller owns conn afterwards.
+        Raises LDAPCursorExpired for unknown, expired or foreign tokens."""
+        with self._lock:
+            pin = self._pins.get(token)
+            # A cursor only resumes on the pool (server + bind identity) that started it
+            if pin is not None and pin.pool is pool and pin.expires > time.monotonic():
+                del self._pins[token]
+                return pin.conn, pin.cookie, pin.pending
+        raise LDAPCursorExpired('Cursor expired or unknown')
+
+    def reap(self, now=None):
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            expired = [key for key, pin in self._pins.items() if pin.expires <= now]
+            pins = [self._pins.pop(key) for key in expired]
+        for pin in pins:
+            self._drop(pin)
+        return len(pins)
+
+    def clear(self):
+        with self._lock:
+            pins, self._pins = list(self._pins.values()), {}
+        for pin in pins:
+            self._drop(pin)
+
+    def __len__(self):
+        return len(self._pins)
+
+    @staticmethod
+    def _drop(pin):
+        if pin.cookie:
+            abandon_paged_search(pin.conn, pin.base_dn, pin.search_filter, pin.cookie)
+        pin.pool.release(pin.conn)
+
+
+class LDAPPoolManager:
+    def __init__(self):
+        self.max_size = int(os.getenv('LDAP_POOL_MAX_SIZE', '5'))
+        self.idle_timeout = float(os.getenv('LDAP_POOL_IDLE_TIMEOUT', '300'))
+        self.check_after = float(os.getenv('LDAP_POOL_CHECK_AFTER', '30'))
+        self.wait_timeout = float(os.getenv('LDAP_POOL_WAIT', '10'))
+        self.timeout = float(os.getenv('LDAP_TIMEOUT', '10'))
+        self.sweep_interval = float(os.getenv('LDAP_POOL_SWEEP_INTERVAL', '30'))
+        self.cursors = CursorRegistry(float(os.getenv('LDAP_CURSOR_TTL', '120')),
+                                      int(os.getenv('LDAP_CURSOR_MAX', str(max(1, self.max_size // 2)))))
+        self._lock = threading.Lock()
+        self._pools = {}
+        self._pid = None
+        self._stop = threading.Event()
+
+    def get(self, uri, bind_dn=None, bind_pw=None, use_ssl=False, starttls=False):
+        tls_mode = 'ssl' if use_ssl else ('starttls' if starttls else 'plain')
+        digest = hashlib.sha256((bind_pw or '').encode()).hexdigest()
+        key = (uri.lower(), bind_dn or '', tls_mode, digest)
+        with self._lock:
+            if self._pid != os.getpid():
+                # Sockets inherited across fork must not be shared with the parent
+                self._pid = os.getpid()
+                self._pools = {}
+                self.cursors = CursorRegistry(self.cursors.ttl, self.cursors.max_per_pool)
+                threading.Thread(target=self._reaper, name='ldap-pool-reaper', daemon=True).start()
+            pool = self._pools.get(key)
+            if pool is None:
+                pool = self._pools[key] = LDAPPool(uri, bind_dn, bind_pw, use_ssl, starttls, self.max_size,
+                                                   self.idle_timeout, self.check_after, self.wait_timeout,
+                                                   self.timeout)
+        return pool
+
+    def _reaper(self):
+        pid = os.getpid()
+        while not self._stop.wait(self.sweep_interval) and self._pid == pid:
+            try:
+                self.sweep()
+            except Exception as e:
+                print(f"[ldap] Pool sweep failed: {e}")
+
+    def sweep(self, now=None):
+        """Release expired cursor pins, close idle connections and drop unused pools."""
+        now = time.monotonic() if now is None else now
+        self.cursors.reap(now)
+        with self._lock:
+            pools = list(self._pools.items())
+        for key, pool in pools:
+            pool.expire_idle(now)
+            if now - pool.last_used >= self.idle_timeout and pool._size == 0:
+                with self._lock:
+                    self._pools.pop(key, None)
+
+
+pools = LDAPPoolManager()
@@ -0,0 +1,121 @@
+"""
+Concurrency limits for outbound dependencies (LDAP, SSH, ping).
+
+Each dependency has a cap on calls in flight per worker process and a
+smaller cap per target host. The per-host count includes callers still
+waiting for a slot. One slow LDAP server or SSH host can therefore hold
+only its share of the worker: further callers for that host are refused
+immediately, and the other hosts keep working. When the whole dependency
+is saturated, callers wait up to OUTBOUND_WAIT seconds and then get
+DependencyBusy. The app answers that with 503 and Retry-After.
+
+The limits matter most with gevent workers (see gunicorn.conf.py), where
+one worker serves hundreds of requests at once. With sync workers each
+process only handles one request, so they never trigger.
+
+Config via env vars:
+  OUTBOUND_LDAP_LIMIT / OUTBOUND_LDAP_PER_HOST   (default 50 / 10)
+  OUTBOUND_SSH_LIMIT / OUTBOUND_SSH_PER_HOST     (default 64 / 16)
+  OUTBOUND_PING_LIMIT / OUTBOUND_PING_PER_HOST   (default 100 / 10)
+  OUTBOUND_WAIT    seconds to wait for a free slot (default 5)
+"""
+
+import contextlib
+import os
+import threading
+
+DEFAULTS = {
+    # dependency: (limit, per_host)
+    'ldap': (50, 10),
+    'ssh': (64, 16),
+    'ping': (100, 10),
+}
+
+
+class DependencyBusy(Exception):
+    def __init__(self, dependency, message, retry_after=1):
+        super().__init__(message)
+        self.dependency = dependency
+        self.retry_after = retry_after
+
+
+class DependencyLimiter:
+    def __init__(self, name, limit, per_host, wait):
+        self.name = name
+        self.limit = limit
+        self.per_host = per_host
+        self.wait = wait
+        self._slots = threading.BoundedSemaphore(limit)
+        self._lock = threading.Lock()
+        self._hosts = {}
+        self.in_flight = 0
+        self.rejected = 0
+
+    def acquire(self, host=None):
+        """Take a slot for one call to host; pair with release(host)."""
+        with self._lock:
+            if host is not None:
+                if self._hosts.get(host, 0) >= self.per_host:
+                    self.rejected += 1
+                    raise DependencyBusy(self.name, f'Too many concurrent {self.name} calls to {host}')
+                self._hosts[host] = self._hosts.get(host, 0) + 1
+        if not self._slots.acquire(timeout=self.wait):
+            with self._lock:
+                self.rejected += 1
+                self._forget(host)
+            raise DependencyBusy(self.name, f'All {self.limit} {self.name} slots are busy')
+        with self._lock:
+            self.in_flight += 1
+
+    def release(self, host=None):
+        with self._lock:
+            self.in_flight -= 1
+            self._forget(host)
+        self._slots.release()
+
+    def _forget(self, host):
+        if host is None:
+            return
+        remaining = self._hosts.get(host, 1) - 1
+        if remaining:
+            self._hosts[host] = remaining
+        else:
+            self._hosts.pop(host, None)
+
+    @contextlib.contextmanager
+    def slot(self, host=None):
+        self.acquire(host)
+        try:
+            yield
+        finally:
+            self.release(host)
+
+    def stats(self):
+        with self._lock:
+            busiest = max(self._hosts.items(), key=lambda item: item[1], default=(None, 0))
+            return {
+                'limit': self.limit,
+                'per_host': self.per_host,
+                'in_flight': self.in_flight,
+                'rejected': self.rejected,
+                'busiest_host': {'host': busiest[0], 'calls': busiest[1]} if busiest[0] else None,
+            }
+
+
+def _from_env(name, limit, per_host):
+    prefix = f'OUTBOUND_{name.upper()}'
+    return DependencyLimiter(name,
+                             limit=int(os.getenv(f'{prefix}_LIMIT', str(limit))),
+                             per_host=int(os.getenv(f'{prefix}_PER_HOST', str(per_host))),
+                             wait=float(os.getenv('OUTBOUND_WAIT', '5')))
+
+
+limiters = {name: _from_env(name, *caps) for name, caps in DEFAULTS.items()}
+
+
+def slot(dependency, host=None):
+    return limiters[dependency].slot(host)
+
+
+def stats():
+    return {name: limiter.stats() for name, limiter in limiters.items()}
@@ -0,0 +1,203 @@
+"""
+Prometheus metrics, served at GET /metrics.
+
+Per request: count and latency by endpoint, requests in flight, and the
+number of DB queries and time spent in them. Outbound calls to ping, SSH and
+LDAP are timed by dependency, endpoint and outcome. The endpoint label is
+the Flask endpoint name (e.g. servers.list_servers), so label cardinality
+stays bounded by the route table. Streamed responses are timed until the
+response starts; the outbound timers of streamed SSH/LDAP calls run until
+the stream ends. The password hashing pool reports job duration, queue
+wait, jobs in flight and HashPoolBusy rejections (503 load shedding).
+
+Under gunicorn every worker writes its samples to PROMETHEUS_MULTIPROC_DIR
+(set up by gunicorn.conf.py). /metrics aggregates all workers, whichever one
+answers the scrape. Without that variable (python app.py) the
+in-process registry is used.
+
+Config via env vars:
+  PROMETHEUS_MULTIPROC_DIR  shared sample directory (multi-worker mode)
+  METRICS_TOKEN             if set, /metrics requires "Authorization: Bearer <token>"
+"""
+
+import contextlib
+import hmac
+import os
+import time
+
+from flask import Response, g, has_request_context, request
+from prometheus_client import (CONTENT_TYPE_LATEST, REGISTRY, CollectorRegistry, Counter, Gauge, Histogram,
+                               generate_latest, multiprocess)
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+from passwords import LATENCY_BUCKETS as HASH_BUCKETS
+from passwords import hasher as password_hasher
+
+OUTBOUND_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+REQUESTS = Counter('http_requests_total', 'HTTP requests handled',
+                   ['method', 'endpoint', 'status'])
+LATENCY = Histogram('http_request_duration_seconds', 'Time until the response is ready',
+                    ['method', 'endpoint'])
+IN_FLIGHT = Gauge('http_requests_in_flight', 'Requests currently being handled',
+                  ['endpoint'], multiprocess_mode='livesum')
+DB_QUERIES = Histogram('http_request_db_queries', 'DB queries issued per request',
+                       ['endpoint'], buckets=(0, 1, 2, 3, 5, 10, 20, 50, 100, 250))
+DB_TIME = Histogram('http_request_db_seconds', 'Time spent in DB queries per request',
+                    ['endpoint'])
+OUTBOUND = Histogram('outbound_call_duration_seconds', 'Calls to ping, SSH and LDAP',
+                     ['dependency', 'endpoint', 'outcome'], buckets=OUTBOUND_BUCKETS)
+HASH_DURATION = Histogram('password_hash_duration_seconds', 'Hash/verify jobs in the password hashing pool',
+                          ['operation'], buckets=HASH_BUCKETS)
+HASH_QUEUE_WAIT = Histogram('password_hash_queue_wait_seconds', 'Wait for a password hashing slot',
+                            ['operation'], buckets=HASH_BUCKETS)
+HASH_IN_FLIGHT = Gauge('password_hash_in_flight', 'Password hashing jobs queued or running',
+                       multiprocess_mode='livesum')
+HASH_REJECTED = Counter('password_hash_rejected_total', 'Password hashing jobs refused with HashPoolBusy',
+                        ['operation', 'reason'])
+
+
+def _endpoint():
+    if has_request_context():
+        return request.endpoint or 'unmatched'
+    return 'background'
+
+
+def outcome_of(exc):
+    if isinstance(exc, GeneratorExit):
+        return 'cancelled'
+    name = type(exc).__name__
+    if isinstance(exc, TimeoutError) or 'Timeout' in name:
+        return 'timeout'
+    if 'Busy' in name or 'Exhausted' in name:
+        return 'busy'
+    return 'error'
+
+
+class OutboundTimer:
+    """Times one outbound call. Set outcome before finish(), or pass it in."""
+
+    def __init__(self, dependency, endpoint=None):
+        self.dependency = dependency
+        self.endpoint = endpoint or _endpoint()
+        self.outcome = 'ok'
+        self.detached = False
+        self._started = time.perf_counter()
+        self._done = False
+
+    def detach(self):
+        """Keep timing after the with block; the stream that owns the call finishes it."""
+        self.detached = True
+
+    def finish(self, outcome=None):
+        if self._done:
+            return
+        self._done = True
+        OUTBOUND.labels(self.dependency, self.endpoint, outcome or self.outcome).observe(
+            time.perf_counter() - self._started)
+
+
+@contextlib.contextmanager
+def outbound(dependency, endpoint=None):
+    """Time the block as one call to dependency; exceptions set the outcome."""
+    timer = OutboundTimer(dependency, endpoint)
+    try:
+        yield timer
+    except BaseException as e:
+        timer.finish(outcome_of(e))
+        raise
+    if not timer.detached:
+        timer.finish()
+
+
+# --- DB query timing (all engines, attributed to the current request) ---
+@event.listens_for(Engine, 'before_cursor_execute')
+def _query_started(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault('query_started', []).append(time.perf_counter())
+
+
+@event.listens_for(Engine, 'after_cursor_execute')
+def _query_finished(conn, cursor, statement, parameters, context, executemany):
+    started = conn.info['query_started'].pop()
+    if has_request_context() and 'metrics_started' in g:
+        g.db_queries += 1
+        g.db_seconds += time.perf_counter() - started
+
+
+@event.listens_for(Engine, 'handle_error')
+def _query_failed(context):
+    stack = context.connection.info.get('query_started') if context.connection is not None else None
+    if stack:
+        stack.pop()
+
+
+# --- password hashing pool ---
+def _password_hash_event(event, op, value):
+    if event == 'started':
+        HASH_IN_FLIGHT.inc()
+        HASH_QUEUE_WAIT.labels(op).observe(value)
+    elif event == 'finished':
+        HASH_IN_FLIGHT.dec()
+        HASH_DURATION.labels(op).observe(value)
+    else:
+        HASH_REJECTED.labels(op, value).inc()
+
+
+password_hasher.add_listener(_password_hash_event)
+
+
+# --- request hooks ---
+# labels() hashes and locks on every call; the per-route children are looked up once
+_route_children = {}
+
+
+def _children(method, endpoint):
+    children = _route_children.get((method, endpoint))
+    if children is None:
+        children = _route_children[(method, endpoint)] = (
+            LATENCY.labels(method, endpoint), IN_FLIGHT.labels(endpoint),
+            DB_QUERIES.labels(endpoint), DB_TIME.labels(endpoint))
+    return children
+
+
+def _before_request():
+    g.metrics_started = time.perf_counter()
+    g.metrics_children = _children(request.method, request.endpoint or 'unmatched')
+    g.db_queries = 0
+    g.db_seconds = 0.0
+    g.metrics_children[1].inc()
+
+
+def _after_request(response):
+    if 'metrics_started' in g:
+        latency, _in_flight, db_queries, db_time = g.metrics_children
+        latency.observe(time.perf_counter() - g.metrics_started)
+        REQUESTS.labels(request.method, request.endpoint or 'unmatched', str(response.status_code)).inc()
+        db_queries.observe(g.db_queries)
+        db_time.observe(g.db_seconds)
+    return response
+
+
+def _teardown_request(_exc):
+    if 'metrics_started' in g:
+        g.metrics_children[1].dec()
+
+
+def metrics_view():
+    token = os.getenv('METRICS_TOKEN')
+    if token and not hmac.compare_digest(request.headers.get('Authorization', ''), f'Bearer {token}'):
+        return Response('Unauthorized\n', status=401, mimetype='text/plain')
+    if os.getenv('PROMETHEUS_MULTIPROC_DIR'):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+    return Response(generate_latest(registry), content_type=CONTENT_TYPE_LATEST)
+
+
+def init_app(app):
+    app.before_request(_before_request)
+    app.after_request(_after_request)
+    app.teardown_request(_teardown_request)
+    app.add_url_rule('/metrics', 'metrics', metrics_view, methods=['GET'])
@@ -0,0 +1,301 @@
+#!/usr/bin/env python3
+"""
+Versioned schema migrations, run once per deploy before gunicorn starts.
+
+Applied versions are recorded in the schema_version table. Each migration
+runs in its own transaction together with its schema_version row, so a
+failed migration leaves no partial version behind. On PostgreSQL the whole
+run holds an advisory lock, so concurrent containers apply each migration
+exactly once; the others wait and then find nothing left to do.
+
+Migrations check what already exists before changing it. Databases set up
+by older releases (db.create_all() at import plus ad-hoc ALTERs) therefore
+upgrade cleanly from version 0.
+
+Usage:  python migrations.py           apply pending migrations
+        python migrations.py status    print current and latest version
+
+Config via env vars:
+  DATABASE_URI            database to migrate
+  MIGRATE_DB_RETRIES      connection attempts while the DB starts (default 30)
+  MIGRATE_DB_RETRY_DELAY  seconds between attempts (default 2)
+"""
+
+import json
+import os
+import sys
+import time
+
+from sqlalchemy import (BigInteger, Boolean, Column, DateTime, Float, ForeignKey, Index, Integer, MetaData,
+                        String, Table, Text, UniqueConstraint, create_engine, inspect, text)
+
+# Arbitrary constant identifying the migration advisory lock
+ADVISORY_LOCK_KEY = 0x4D494752  # 'MIGR'
+
+MIGRATIONS = []
+
+
+def migration(version, description):
+    def register(fn):
+        MIGRATIONS.append((version, description, fn))
+        return fn
+    return register
+
+
+def _add_column(conn, table, column, ddl_type):
+    if column not in {c['name'] for c in inspect(conn).get_columns(table)}:
+        conn.execute(text(f'ALTER TABLE {table} ADD COLUMN {column} {ddl_type}'))
+        print(f"[migrate] Added {table}.{column}")
+
+
+# --- migrations (append only; never edit one that has shipped) ---
+# Tables are spelled out as they were when their migration shipped, never taken
+# from models.py, so model changes can't alter what an old migration creates.
+# create_all() checks first: databases from the create_all era already have them.
+@migration(1, 'Create base tables')
+def _create_tables(conn):
+    metadata = MetaData()
+    Table('user', metadata,
+          Column('id', Integer, primary_key=True),
+          Column('email', String(120), unique=True, nullable=False),
+          Column('username', String(120)),
+          Column('password_hash', Text, nullable=False),
+          Column('user_group', Text),
+          Column('otp_secret', String(32)),
+          Column('is_2fa_enabled', Boolean),
+          Column('_2fa_completed', Boolean))
+    Table('dashboard', metadata,
+          Column('id', Integer, primary_key=True),
+          Column('user_id', Integer, ForeignKey('user.id'), nullable=False),
+          Column('panels', Text, nullable=False),
+          Column('pinned_panels', Text),
+          Column('dashboard_layouts', Text),
+          Column('created_at', DateTime),
+          Column('updated_at', DateTime))
+    Table('server', metadata,
+          Column('id', Integer, primary_key=True),
+          Column('hostname', String(255), unique=True, nullable=False),
+          Column('bmc_ip', String(255)),
+          Column('auth_method', String(32), nullable=False),
+          Column('ssh_key', Text),
+          Column('root_password_hash', Text),
+          Column('state', String(32), nullable=False),
+          Column('created_at', DateTime),
+          Column('updated_at', DateTime))
+    metadata.create_all(conn)
+
+
+@migration(2, 'Dashboard pinned_panels and dashboard_layouts columns')
+def _dashboard_json_columns(conn):
+    _add_column(conn, 'dashboard', 'pinned_panels', 'TEXT')
+    _add_column(conn, 'dashboard', 'dashboard_layouts', 'TEXT')
+
+
+@migration(3, 'Dashboard optimistic-locking version')
+def _dashboard_version(conn):
+    _add_column(conn, 'dashboard', 'version', 'INTEGER NOT NULL DEFAULT 1')
+
+
+@migration(4, 'Server health-check columns')
+def _server_health_columns(conn):
+    _add_column(conn, 'server', 'check_interval', 'INTEGER')
+    _add_column(conn, 'server', 'last_checked_at', 'TIMESTAMP')
+    _add_column(conn, 'server', 'last_latency_ms', 'DOUBLE PRECISION')
+
+
+def _username_duplicates(conn):
+    """{lower(username): [user ids]} for usernames shared case-insensitively."""
+    rows = conn.execute(text(
+        'SELECT id, lower(username) FROM "user" WHERE lower(username) IN ('
+        ' SELECT lower(username) FROM "user" WHERE username IS NOT NULL'
+        ' GROUP BY lower(username) HAVING COUNT(*) > 1)'
+        ' ORDER BY lower(username), id'
+    )).all()
+    duplicates = {}
+    for user_id, name in rows:
+        duplicates.setdefault(name, []).append(user_id)
+    return duplicates
+
+
+@migration(5, 'Server listing and case-insensitive identity indexes')
+def _lookup_indexes(conn):
+    conn.execute(text('CREATE INDEX IF NOT EXISTS ix_server_created_at_id ON server (created_at, id)'))
+    conn.execute(text('CREATE INDEX IF NOT EXISTS ix_server_state_created_at_id ON server (state, created_at, id)'))
+    conn.execute(text('CREATE INDEX IF NOT EXISTS ix_user_email_lower ON "user" (lower(email))'))
+    # Usernames were never unique before: case-duplicates would fail the unique index,
+    # and with it every deploy, so fall back to a plain index and report them
+    duplicates = _username_duplicates(conn)
+    for name, user_ids in duplicates.items():
+        print(f"[migrate] Username {name!r} is shared by users {user_ids}")
+    if duplicates:
+        print(f"[migrate] {len(duplicates)} username(s) differ only in case; ix_user_username_lower "
+              f"created without UNIQUE. Rename those accounts, drop the index and recreate it as "
+              f"CREATE UNIQUE INDEX ix_user_username_lower ON \"user\" (lower(username))")
+    unique = '' if duplicates else 'UNIQUE '
+    conn.execute(text(f'CREATE {unique}INDEX IF NOT EXISTS ix_user_username_lower ON "user" (lower(username))'))
+
+
+@migration(6, 'Move dashboard panels into dashboard_panel rows')
+def _dashboard_panel_rows(conn):
+    metadata = MetaData()
+    Table('dashboard', metadata, Column('id', Integer, primary_key=True))  # only the FK target
+    panel_table = Table('dashboard_panel', metadata,
+                        Column('id', Integer, primary_key=True),
+                        Column('dashboard_id', Integer, ForeignKey('dashboard.id', ondelete='CASCADE'),
+                               nullable=False),
+                        Column('kind', String(16), nullable=False),
+                        Column('panel_id', String(255), nullable=False),
+                        Column('position', Integer, nullable=False),
+                        Column('config', Text, nullable=False),
+                        UniqueConstraint('dashboard_id', 'kind', 'panel_id', name='uq_dashboard_panel'),
+                        Index('ix_dashboard_panel_panel_id', 'panel_id'))
+    panel_table.create(conn, checkfirst=True)
+    legacy = conn.execute(text(
+        "SELECT id, panels, pinned_panels FROM dashboard "
+        "WHERE COALESCE(panels, '[]') NOT IN ('[]', '') OR COALESCE(pinned_panels, '[]') NOT IN ('[]', '')"
+    )).all()
+    for dashboard_id, panels_json, pinned_json in legacy:
+        for kind, raw in (('panel', panels_json), ('pinned', pinned_json)):
+            try:
+                panels = json.loads(raw) if raw else []
+            except ValueError:
+                print(f"[migrate] Dashboard {dashboard_id}: unreadable {kind} JSON, skipped")
+                panels = []
+            if not isinstance(panels, list):
+                print(f"[migrate] Dashboard {dashboard_id}: {kind} JSON is not a list, skipped: {raw[:200]}")
+                panels = []
+            # Old rows were never validated: keep the first copy of each id, drop id-less entries
+            unique = {}
+            for position, panel in enumerate(panels):
+                if not isinstance(panel, dict) or panel.get('id') in (None, ''):
+                    print(f"[migrate] Dashboard {dashboard_id}: dropped {kind} #{position} without an id: "
+                          f"{json.dumps(panel)[:200]}")
+                elif str(panel['id']) in unique:
+                    print(f"[migrate] Dashboard {dashboard_id}: dropped {kind} #{position}, duplicate id "
+                          f"{panel['id']!r}: {json.dumps(panel)[:200]}")
+                else:
+                    unique[str(panel['id'])] = panel
+            conn.execute(panel_table.delete().where(panel_table.c.dashboard_id == dashboard_id,
+                                                    panel_table.c.kind == kind))
+            if unique:
+                conn.execute(panel_table.insert(), [
+                    {'dashboard_id': dashboard_id, 'kind': kind, 'panel_id': panel_id,
+                     'position': position, 'config': json.dumps(panel)}
+                    for position, (panel_id, panel) in enumerate(unique.items())
+                ])
+        conn.execute(text("UPDATE dashboard SET panels = '[]', pinned_panels = NULL, version = version + 1 "
+                          "WHERE id = :id"), {'id': dashboard_id})
+    if legacy:
+        print(f"[migrate] Moved panels of {len(legacy)} dashboard(s) to dashboard_panel")
+
+
+@migration(7, 'Server state history table')
+def _server_state_history(conn):
+    # Until now only migration 1's create_all made this table, so older databases have it
+    metadata = MetaData()
+    Table('server', metadata, Column('id', Integer, primary_key=True))  # only the FK target
+    history = Table('server_state_history', metadata,
+                    Column('id', BigInteger().with_variant(Integer, 'sqlite'), primary_key=True),
+                    Column('server_id', Integer, ForeignKey('server.id', ondelete='CASCADE'), nullable=False),
+                    Column('checked_at', DateTime, nullable=False),
+                    Column('state', String(16), nullable=False),
+                    Column('latency_ms', Float),
+                    Column('transition', Boolean, nullable=False),
+                    Index('ix_server_state_history_server_checked', 'server_id', 'checked_at'))
+    history.create(conn, checkfirst=True)
+
+
+# --- runner ---
+def _connect(engine):
+    retries = int(os.getenv('MIGRATE_DB_RETRIES', '30'))
+    delay = float(os.getenv('MIGRATE_DB_RETRY_DELAY', '2'))
+    for attempt in range(1, retries + 1):
+        try:
+            return engine.connect()
+        except Exception as e:
+            if attempt == retries:
+                raise
+            print(f"[migrate] Attempt {attempt}/{retries}: database not ready yet ({e})")
+            time.sleep(delay)
+
+
+def _ensure_version_table(conn):
+    conn.execute(text(
+        'CREATE TABLE IF NOT EXISTS schema_version ('
+        ' version INTEGER PRIMARY KEY,'
+        ' description VARCHAR(255) NOT NULL,'
+        ' applied_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP)'
+    ))
+    conn.commit()
+
+
+def current_version(conn):
+    return conn.execute(text('SELECT COALESCE(MAX(version), 0) FROM schema_version')).scalar()
+
+
+def latest_version():
+    return max(version for version, _, _ in MIGRATIONS)
+
+
+def upgrade(database_uri=None):
+    """Apply all pending migrations. Returns the number applied."""
+    engine = create_engine(database_uri or os.getenv('DATABASE_URI'))
+    postgres = engine.dialect.name == 'postgresql'
+    applied = 0
+    try:
+        with _connect(engine) as conn:
+            if postgres:
+                conn.execute(text('SELECT pg_advisory_lock(:key)'), {'key': ADVISORY_LOCK_KEY})
+                conn.commit()
+            try:
+                _ensure_version_table(conn)
+                # Read after taking the lock: another runner may just have finished
+                current = current_version(conn)
+                conn.commit()
+                for version, description, fn in sorted(MIGRATIONS, key=lambda m: m[0]):
+                    if version <= current:
+                        continue
+                    started = time.monotonic()
+                    try:
+                        fn(conn)
+                        conn.execute(text('INSERT INTO schema_version (version, description) VALUES (:v, :d)'),
+                                     {'v': version, 'd': description})
+                        conn.commit()
+                    except Exception:
+                        conn.rollback()
+                        print(f"[migrate] Migration {version} ({description}) failed")
+                        raise
+                    applied += 1
+                    print(f"[migrate] Applied {version}: {description} ({time.monotonic() - started:.2f}s)")
+            finally:
+                if postgres:
+                    conn.execute(text('SELECT pg_advisory_unlock(:key)'), {'key': ADVISORY_LOCK_KEY})
+                    conn.commit()
+    finally:
+        engine.dispose()
+    print(f"[migrate] Schema is at version {latest_version()} ({applied} applied)")
+    return applied
+
+
+def status(database_uri=None):
+    engine = create_engine(database_uri or os.getenv('DATABASE_URI'))
+    try:
+        with _connect(engine) as conn:
+            has_table = inspect(conn).has_table('schema_version')
+            current = current_version(conn) if has_table else 0
+    finally:
+        engine.dispose()
+    print(f"[migrate] Current version {current}, latest {latest_version()}")
+    return current
+
+
+if __name__ == '__main__':
+    from dotenv import load_dotenv
+    load_dotenv()
+    command = sys.argv[1] if len(sys.argv) > 1 else 'upgrade'
+    if command == 'status':
+        sys.exit(0 if status() == latest_version() else 1)
+    if command != 'upgrade':
+        print(__doc__)
+        sys.exit(2)
+    upgrade()
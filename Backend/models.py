@@ -0,0 +1,256 @@
+"""SQLAlchemy models. Schema changes go through migrations.py."""
+
+import datetime
+import json
+
+from extensions import db
+from passwords import hasher as password_hasher
+
+
+# --- User Model ---
+class User(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    email = db.Column(db.String(120), unique=True, nullable=False)
+    username = db.Column(db.String(120), nullable=True)
+    password_hash = db.Column(db.Text, nullable=False)
+    user_group = db.Column(db.Text, nullable=True)
+    otp_secret = db.Column(db.String(32), nullable=True)
+    is_2fa_enabled = db.Column(db.Boolean, default=False)
+    _2fa_completed = db.Column(db.Boolean, default=False)
+
+    # Case-insensitive identity lookups (find_user) are index scans, not seq scans
+    __table_args__ = (
+        db.Index('ix_user_email_lower', db.func.lower(email)),
+        db.Index('ix_user_username_lower', db.func.lower(username), unique=True),
+    )
+
+    def set_password(self, password):
+        self.password_hash = password_hasher.hash(password)
+
+    def set_user_group(self, user_group):
+        self.user_group = user_group
+
+    def set_username(self, username):  
+        self.username = username
+
+    def check_password(self, password):
+        return password_hasher.verify(self.password_hash, password)
+
+# --- Dashboard Model ---
+class Dashboard(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    # Pre-dashboard_panel JSON columns; emptied by migration 6 once copied over
+    legacy_panels = db.Column('panels', db.Text, nullable=False, default='[]')
+    legacy_pinned_panels = db.Column('pinned_panels', db.Text, nullable=True)
+    dashboard_layouts = db.Column(db.Text, nullable=True)  # JSON string of dashboard layouts
+    created_at = db.Column(db.DateTime, default=datetime.datetime.now(datetime.UTC))
+    updated_at = db.Column(db.DateTime, default=datetime.datetime.now(datetime.UTC), onupdate=datetime.datetime.now(datetime.UTC))
+    version = db.Column(db.Integer, nullable=False, default=1)  # bumped by SQLAlchemy on every UPDATE
+    
+    # Relationship
+    user = db.relationship('User', backref=db.backref('dashboards', lazy=True))
+
+    __mapper_args__ = {'version_id_col': version}
+
+    @property
+    def etag(self):
+        return dashboard_etag(self.id, self.version)
+
+    def to_json(self):
+        """Serialize without decoding the stored JSON; panel configs are spliced in as-is."""
+        sections = DashboardPanel.sections_json(self.id)
+        return (
+            '{"panels":' + sections[PANEL_KIND] +
+            ',"pinned_panels":' + sections[PINNED_KIND] +
+            ',"dashboard_layouts":' + (self.dashboard_layouts or '{}') +
+            ',"version":' + str(self.version) +
+            ',"created_at":' + json.dumps(self.created_at.isoformat() if self.created_at else None) +
+            ',"updated_at":' + json.dumps(self.updated_at.isoformat() if self.updated_at else None) +
+            '}'
+        )
+
+# --- Dashboard panels: one row per panel, so pin checks and lookups are indexed SQL ---
+PANEL_KIND = 'panel'
+PINNED_KIND = 'pinned'
+
+class DashboardPanel(db.Model):
+    __tablename__ = 'dashboard_panel'
+    __table_args__ = (
+        db.UniqueConstraint('dashboard_id', 'kind', 'panel_id', name='uq_dashboard_panel'),
+        db.Index('ix_dashboard_panel_panel_id', 'panel_id'),
+    )
+    id = db.Column(db.Integer, primary_key=True)
+    dashboard_id = db.Column(db.Integer, db.ForeignKey('dashboard.id', ondelete='CASCADE'), nullable=False)
+    kind = db.Column(db.String(16), nullable=False)         # 'panel' | 'pinned'
+    panel_id = db.Column(db.String(255), nullable=False)
+    position = db.Column(db.Integer, nullable=False)
+    config = db.Column(db.Text, nullable=False)             # JSON string of the panel configuration
+
+    @classmethod
+    def sections_json(cls, dashboard_id):
+        """{kind: JSON array text} for a dashboard, built from one ordered query."""
+        configs = {PANEL_KIND: [], PINNED_KIND: []}
+        if dashboard_id:
+            rows = (db.session.query(cls.kind, cls.config)
+                    .filter_by(dashboard_id=dashboard_id)
+                    .order_by(cls.kind, cls.position))
+            for kind, config in rows:
+                configs.setdefault(kind, []).append(config)
+        return {kind: '[' + ','.join(items) + ']' for kind, items in configs.items()}
+
+    @classmethod
+    def load(cls, dashboard_id, kind):
+        if not dashboard_id:
+            return []
+        rows = (db.session.query(cls.config)
+                .filter_by(dashboard_id=dashboard_id, kind=kind)
+                .order_by(cls.position))
+        return [json.loads(config) for config, in rows]
+
+    @classmethod
+    def replace(cls, dashboard_id, kind, panels):
+        """Make the panels of one kind match `panels`, keeping their order. Rows are
+        matched by panel_id, so only added, removed, moved or edited panels are written."""
+        rows = panel_rows(dashboard_id, kind, panels)
+        existing = {panel_id: (row_id, position, config) for row_id, panel_id, position, config in
+                    db.session.query(cls.id, cls.panel_id, cls.position, cls.config)
+                    .filter_by(dashboard_id=dashboard_id, kind=kind)}
+        inserts = []
+        updates = []
+        for row in rows:
+            current = existing.pop(row['panel_id'], None)
+            if current is None:
+                inserts.append(row)
+            elif current[1:] != (row['position'], row['config']):
+                updates.append({'_id': current[0], 'position': row['position'], 'config': row['config']})
+        if existing:
+            removed = [row_id for row_id, _, _ in existing.values()]
+            db.session.query(cls).filter(cls.id.in_(removed)).delete(synchronize_session=False)
+        if updates:
+            table = cls.__table__
+            db.session.execute(db.update(table)
+                               .where(table.c.id == db.bindparam('_id'))
+                               .values(position=db.bindparam('position'), config=db.bindparam('config')),
+                               updates)
+        if inserts:
+            db.session.execute(db.insert(cls), inserts)
+
+def panel_rows(dashboard_id, kind, panels):
+    """Validate a panel list and turn it into dashboard_panel insert parameters."""
+    if not isinstance(panels, list):
+        raise ValueError(f'{kind} panels must be a list')
+    seen = set()
+    rows = []
+    for position, panel in enumerate(panels):
+        if not isinstance(panel, dict) or panel.get('id') in (None, ''):
+            raise ValueError('Every panel needs an id')
+        panel_id = str(panel['id'])
+        if panel_id in seen:
+            raise ValueError(f'Duplicate panel id: {panel_id}')
+        seen.add(panel_id)
+        rows.append({'dashboard_id': dashboard_id, 'kind': kind, 'panel_id': panel_id,
+                     'position': position, 'config': json.dumps(panel)})
+    return rows
+
+def dashboard_etag(dashboard_id, version):
+    return f"d{dashboard_id}v{version}" if dashboard_id else "empty"
+
+# --- Server Model (for infrastructure endpoints) ---
+class ServerHost(db.Model):
+    __tablename__ = 'server'
+    __table_args__ = (
+        # Keyset pagination for the inventory listing, optionally filtered by state
+        db.Index('ix_server_created_at_id', 'created_at', 'id'),
+        db.Index('ix_server_state_created_at_id', 'state', 'created_at', 'id'),
+    )
+    id = db.Column(db.Integer, primary_key=True)
+    hostname = db.Column(db.String(255), unique=True, nullable=False)
+    bmc_ip = db.Column(db.String(255), nullable=True)
+    auth_method = db.Column(db.String(32), nullable=False)  # 'ssh-key' | 'root-password'
+    ssh_key = db.Column(db.Text, nullable=True)             # plain storage (consider encrypting)
+    root_password_hash = db.Column(db.Text, nullable=True)  # hashed root password
+    state = db.Column(db.String(32), nullable=False, default='Unconfigured')  # Up | Down | Pending | Unconfigured
+    check_interval = db.Column(db.Integer, nullable=True)   # seconds; None = HEALTH_INTERVAL
+    last_checked_at = db.Column(db.DateTime, nullable=True)
+    last_latency_ms = db.Column(db.Float, nullable=True)
+    created_at = db.Column(db.DateTime, default=datetime.datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.datetime.utcnow, onupdate=datetime.datetime.utcnow)
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'hostname': self.hostname,
+            'bmc_ip': self.bmc_ip,
+            'auth_method': self.auth_method,
+            'state': self.state,
+            'check_interval': self.check_interval,
+            'last_checked_at': self.last_checked_at.isoformat() if self.last_checked_at else None,
+            'last_latency_ms': self.last_latency_ms,
+            'created_at': self.created_at.isoformat() if self.created_at else None,
+            'updated_at': self.updated_at.isoformat() if self.updated_at else None,
+        }
+
+# --- Server state history (every probe result goes through record_checks) ---
+class ServerStateHistory(db.Model):
+    __tablename__ = 'server_state_history'
+    __table_args__ = (db.Index('ix_server_state_history_server_checked', 'server_id', 'checked_at'),)
+    id = db.Column(db.BigInteger().with_variant(db.Integer, 'sqlite'), primary_key=True)
+    server_id = db.Column(db.Integer, db.ForeignKey('server.id', ondelete='CASCADE'), nullable=False)
+    checked_at = db.Column(db.DateTime, nullable=False)
+    state = db.Column(db.String(16), nullable=False)
+    latency_ms = db.Column(db.Float, nullable=True)
+    transition = db.Column(db.Boolean, nullable=False, default=False)  # False = periodic latency sample
+
+    def to_dict(self):
+        return {
+            'checked_at': self.checked_at.isoformat(),
+            'state': self.state,
+            'latency_ms': self.latency_ms,
+            'transition': self.transition,
+        }
+
+    @classmethod
+    def record_checks(cls, checks, checked_at=None, only_from=None):
+        """Write probe results: state, last_checked_at and last_latency_ms on the
+        server, plus a history row for every state transition and for every check
+        marked 'sample'. checks are dicts with server_id, state, latency_ms and
+        optionally sample. only_from limits the write to servers currently in that
+        state (e.g. 'Pending'). Deleted servers are skipped.
+        Returns {server_id: previous state} for the servers written; does not commit.
+        """
+        checked_at = checked_at or datetime.datetime.utcnow()
+        ids = [check['server_id'] for check in checks]
+        current = {}
+        for start in range(0, len(ids), 1000):
+            current.update(db.session.query(ServerHost.id, ServerHost.state)
+                           .filter(ServerHost.id.in_(ids[start:start + 1000])))
+        if only_from:
+            current = {server_id: state for server_id, state in current.items() if state == only_from}
+
+        updates = []
+        history = []
+        for check in checks:
+            previous = current.get(check['server_id'])
+            if previous is None:
+                continue
+            updates.append({'_id': check['server_id'], 'state': check['state'],
+                            'last_checked_at': checked_at, 'last_latency_ms': check['latency_ms']})
+            transition = previous != check['state']
+            if transition or check.get('sample'):
+                history.append({'server_id': check['server_id'], 'checked_at': checked_at,
+                                'state': check['state'], 'latency_ms': check['latency_ms'],
+                                'transition': transition})
+        if updates:
+            table = ServerHost.__table__
+            stmt = (db.update(table)
+                    .where(table.c.id == db.bindparam('_id'))
+                    .values(state=db.bindparam('state'),
+                            last_checked_at=db.bindparam('last_checked_at'),
+                            last_latency_ms=db.bindparam('last_latency_ms')))
+            if only_from:
+                stmt = stmt.where(table.c.state == only_from)
+            db.session.execute(stmt, updates)
+        if history:
+            db.session.execute(db.insert(cls), history)
+        return {update['_id']: current[update['_id']] for update in updates}
@@ -0,0 +1,202 @@
+"""
+Password hashing off the request thread.
+
+generate_password_hash/check_password_hash are deliberately slow (scrypt by
+default), so they run in a small process pool. A burst of logins then only
+costs request threads time spent waiting, not the worker's CPU/GIL. The
+number of queued + running jobs is bounded: once PASSWORD_HASH_QUEUE jobs
+are outstanding, new requests fail fast with HashPoolBusy instead of piling
+up behind each other. Listeners added with add_listener() see every job
+(metrics.py exports them to Prometheus).
+
+Config via env vars:
+  PASSWORD_HASH_WORKERS   worker processes (default: CPU count; 0 = hash inline)
+  PASSWORD_HASH_QUEUE     max outstanding jobs per app worker (default 4x workers)
+  PASSWORD_HASH_WAIT      seconds to wait for a free queue slot (default 0.5)
+  PASSWORD_HASH_TIMEOUT   seconds to wait for a result (default 10)
+  PASSWORD_HASH_METHOD    werkzeug method/cost for new hashes (default "scrypt")
+"""
+
+import atexit
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeout
+
+from werkzeug.security import check_password_hash, generate_password_hash
+
+# Upper bounds (seconds) of the latency histogram buckets
+LATENCY_BUCKETS = (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class HashPoolBusy(Exception):
+    """Too many hashing jobs are outstanding, or one took too long."""
+
+    def __init__(self, message, retry_after=1):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+def _hash(password, method):
+    return generate_password_hash(password, method=method)
+
+
+def _verify(pwhash, password):
+    return check_password_hash(pwhash, password)
+
+
+class _OpStats:
+    __slots__ = ('count', 'total', 'max', 'buckets')
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.buckets = [0] * (len(LATENCY_BUCKETS) + 1)
+
+    def observe(self, seconds):
+        self.count += 1
+        self.total += seconds
+        self.max = max(self.max, seconds)
+        for i, bound in enumerate(LATENCY_BUCKETS):
+            if seconds <= bound:
+                self.buckets[i] += 1
+                break
+        else:
+            self.buckets[-1] += 1
+
+    def to_dict(self):
+        return {
+            'count': self.count,
+            'avg_ms': round(self.total / self.count * 1000, 2) if self.count else None,
+            'max_ms': round(self.max * 1000, 2),
+            'buckets': {f'le_{bound}': n for bound, n in zip(LATENCY_BUCKETS + ('inf',), self.buckets)},
+        }
+
+
+class PasswordHasher:
+    def __init__(self):
+        cpus = os.cpu_count() or 1
+        self.workers = int(os.getenv('PASSWORD_HASH_WORKERS', str(cpus)))
+        self.queue_size = int(os.getenv('PASSWORD_HASH_QUEUE', str(max(self.workers, 1) * 4)))
+        self.wait = float(os.getenv('PASSWORD_HASH_WAIT', '0.5'))
+        self.timeout = float(os.getenv('PASSWORD_HASH_TIMEOUT', '10'))
+        self.method = os.getenv('PASSWORD_HASH_METHOD', 'scrypt')
+        self._slots = threading.BoundedSemaphore(self.queue_size)
+        self._lock = threading.Lock()
+        self._executor = None
+        self._pid = None
+        self._stats = {'hash': _OpStats(), 'verify': _OpStats()}
+        self._queue_wait = _OpStats()
+        self.in_flight = 0
+        self.rejected = 0
+        self.timeouts = 0
+        self._listeners = []
+
+    def add_listener(self, fn):
+        """fn(event, op, value) for every job: ('started', op, queue wait seconds),
+        ('finished', op, run seconds) and ('rejected', op, 'capacity' | 'timeout')."""
+        self._listeners.append(fn)
+
+    def _notify(self, event, op, value):
+        for fn in self._listeners:
+            try:
+                fn(event, op, value)
+            except Exception as e:
+                print(f"[passwords] Listener failed: {e}")
+
+    def _pool(self):
+        with self._lock:
+            if self._pid != os.getpid():
+                # A pool inherited across gunicorn's fork has no live workers
+                self._pid = os.getpid()
+                self._executor = ProcessPoolExecutor(max_workers=self.workers,
+                                                     mp_context=multiprocessing.get_context('spawn'))
+            return self._executor
+
+    def _run(self, op, fn, *args):
+        queued = time.monotonic()
+        if not self._slots.acquire(timeout=self.wait):
+            with self._lock:
+                self.rejected += 1
+            self._notify('rejected', op, 'capacity')
+            raise HashPoolBusy('Password hashing is at capacity, try again shortly')
+        started = time.monotonic()
+        with self._lock:
+            self.in_flight += 1
+            self._queue_wait.observe(started - queued)
+        self._notify('started', op, started - queued)
+
+        def finished(*_):
+            elapsed = time.monotonic() - started
+            with self._lock:
+                self.in_flight -= 1
+                self._stats[op].observe(elapsed)
+            self._slots.release()
+            self._notify('finished', op, elapsed)
+
+        if self.workers <= 0:
+            try:
+                return fn(*args)
+            finally:
+                finished()
+        try:
+            future = self._pool().submit(fn, *args)
+        except BaseException:
+            finished()
+            raise
+        # The slot is held until the job really ends, even if we stop waiting
+        future.add_done_callback(finished)
+        try:
+            return future.result(timeout=self.timeout)
+        except FutureTimeout:
+            with self._lock:
+                self.timeouts += 1
+            self._notify('rejected', op, 'timeout')
+            raise HashPoolBusy('Password hashing timed out', retry_after=int(self.timeout))
+
+    def hash(self, password):
+        return self._run('hash', _hash, password, self.method)
+
+    def verify(self, pwhash, password):
+        return self._run('verify', _verify, pwhash, password)
+
+    def hash_many(self, passwords):
+        """Hash several passwords in parallel, keeping at most queue_size outstanding."""
+        if not passwords:
+            return []
+        with ThreadPoolExecutor(max_workers=min(self.queue_size, len(passwords))) as waiters:
+            return list(waiters.map(self.hash, passwords))
+
+    def needs_rehash(self, pwhash):
+        """True when a stored hash was made with a different method/cost than configured."""
+        used = pwhash.split('$', 1)[0]
+        # A method without explicit cost ("scrypt") accepts any cost of that method
+        return not (used == self.method or used.startswith(self.method + ':'))
+
+    def stats(self):
+        with self._lock:
+            return {
+                'workers': self.workers,
+                'queue_size': self.queue_size,
+                'method': self.method,
+                'in_flight': self.in_flight,
+                'rejected': self.rejected,
+                'timeouts': self.timeouts,
+                'queue_wait': self._queue_wait.to_dict(),
+                'hash': self._stats['hash'].to_dict(),
+                'verify': self._stats['verify'].to_dict(),
+            }
+
+    def shutdown(self):
+        with self._lock:
+            if self._executor is not None and self._pid == os.getpid():
+                self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+            self._pid = None
+
+
+hasher = PasswordHasher()
+atexit.register(hasher.shutdown)
@@ -0,0 +1,255 @@
+"""
+In-process reachability probes.
+
+Replaces forking /bin/ping per check. Probes run on a single asyncio event
+loop owned by a daemon thread, so Flask handlers (sync) can submit thousands
+of probes at once and wait for the batch.
+
+Probe methods:
+  icmp : unprivileged ICMP echo over SOCK_DGRAM ping sockets. Linux only
+         allows these when the process gid is inside
+         net.ipv4.ping_group_range.
+  tcp  : TCP connect to PROBE_TCP_PORT (default 22). A refused connection
+         still proves the host is up.
+
+Config via env vars:
+  PROBE_MODE          auto | icmp | tcp   (auto = icmp when permitted, else tcp)
+  PROBE_TCP_PORT      port for tcp probes (default 22)
+  PROBE_TIMEOUT       seconds per probe (default 2)
+  PROBE_MAX_INFLIGHT  cap on concurrently outstanding probes (default 1024)
+"""
+
+import asyncio
+import errno
+import itertools
+import os
+import socket
+import struct
+import threading
+import time
+from concurrent.futures import Future
+from dataclasses import dataclass
+from typing import Iterable, List, Optional
+
+ICMP_ECHO_REQUEST = 8
+ICMP_ECHO_REPLY = 0
+ICMP6_ECHO_REQUEST = 128
+ICMP6_ECHO_REPLY = 129
+
+
+@dataclass
+class ProbeResult:
+    host: str
+    reachable: bool
+    latency_ms: Optional[float]
+    method: str
+    error: Optional[str] = None
+
+    def to_dict(self):
+        return {
+            'host': self.host,
+            'reachable': self.reachable,
+            'latency_ms': self.latency_ms,
+            'method': self.method,
+            'error': self.error,
+        }
+
+
+def _checksum(data: bytes) -> int:
+    if len(data) % 2:
+        data += b'\x00'
+    total = sum(struct.unpack('!%dH' % (len(data) // 2), data))
+    total = (total >> 16) + (total & 0xFFFF)
+    total += total >> 16
+    return ~total & 0xFFFF
+
+
+class _IcmpSocket:
+    """One ping socket per address family, shared by every outstanding probe.
+
+    The kernel rewrites the ICMP identifier to the socket's local port and
+    only delivers replies addressed to it, so replies are matched to waiters
+    by sequence number plus a payload token.
+    """
+
+    def __init__(self, loop, family):
+        proto = socket.IPPROTO_ICMP if family == socket.AF_INET else socket.IPPROTO_ICMPV6
+        self.sock = socket.socket(family, socket.SOCK_DGRAM, proto)
+        self.sock.setblocking(False)
+        self.family = family
+        self.loop = loop
+        self.waiters = {}
+        self._seq = itertools.count(1)
+        loop.add_reader(self.sock.fileno(), self._on_readable)
+
+    def _next_seq(self):
+        # 16-bit sequence space; skip any still in flight after wraparound
+        for _ in range(0x10000):
+            seq = next(self._seq) & 0xFFFF
+            if seq not in self.waiters:
+                return seq
+        raise RuntimeError('too many outstanding ICMP probes')
+
+    def _on_readable(self):
+        while True:
+            try:
+                packet = self.sock.recv(2048)
+            except (BlockingIOError, InterruptedError):
+                return
+            except OSError:
+                return
+            if len(packet) < 8:
+                continue
+            icmp_type, _code, _csum, _ident, seq = struct.unpack('!BBHHH', packet[:8])
+            if icmp_type not in (ICMP_ECHO_REPLY, ICMP6_ECHO_REPLY):
+                continue
+            waiter = self.waiters.get(seq)
+            if waiter and not waiter[1].done() and packet[8:16] == waiter[0]:
+                waiter[1].set_result(time.perf_counter())
+
+    async def echo(self, address, timeout):
+        seq = self._next_seq()
+        token = os.urandom(8)
+        req_type = ICMP_ECHO_REQUEST if self.family == socket.AF_INET else ICMP6_ECHO_REQUEST
+        header = struct.pack('!BBHHH', req_type, 0, 0, 0, seq)
+        checksum = _checksum(header + token)
+        packet = struct.pack('!BBHHH', req_type, 0, checksum, 0, seq) + token
+
+        future = self.loop.create_future()
+        self.waiters[seq] = (token, future)
+        try:
+            started = time.perf_counter()
+            self.sock.sendto(packet, address)
+            received = await asyncio.wait_for(future, timeout)
+            return round((received - started) * 1000, 2)
+        finally:
+            self.waiters.pop(seq, None)
+
+
+class ProbeEngine:
+    def __init__(self, mode=None, tcp_port=None, timeout=None, max_inflight=None):
+        self.mode = (mode or os.getenv('PROBE_MODE', 'auto')).lower()
+        self.tcp_port = int(tcp_port or os.getenv('PROBE_TCP_PORT', '22'))
+        self.timeout = float(timeout or os.getenv('PROBE_TIMEOUT', '2'))
+        self.max_inflight = int(max_inflight or os.getenv('PROBE_MAX_INFLIGHT', '1024'))
+        self._lock = threading.Lock()
+        self._loop = None
+        self._pid = None
+        self._icmp = {}
+        self._icmp_denied = set()
+        self._inflight = None
+
+    # --- event loop lifecycle ---
+    def _ensure_loop(self):
+        # A forked gunicorn worker inherits the object but not the thread
+        with self._lock:
+            if self._loop is not None and self._pid == os.getpid():
+                return self._loop
+            loop = asyncio.new_event_loop()
+            ready = threading.Event()
+
+            def run():
+                asyncio.set_event_loop(loop)
+                ready.set()
+                loop.run_forever()
+
+            threading.Thread(target=run, name='probe-engine', daemon=True).start()
+            ready.wait()
+            self._loop = loop
+            self._pid = os.getpid()
+            self._icmp = {}
+            self._icmp_denied = set()
+            self._inflight = None
+            return loop
+
+    def _icmp_socket(self, family):
+        if family in self._icmp_denied:
+            return None
+        sock = self._icmp.get(family)
+        if sock is None:
+            try:
+                sock = _IcmpSocket(self._loop, family)
+            except OSError as e:
+                if e.errno in (errno.EACCES, errno.EPERM, errno.EPROTONOSUPPORT, errno.EAFNOSUPPORT):
+                    self._icmp_denied.add(family)
+                    return None
+                raise
+            self._icmp[family] = sock
+        return sock
+
+    # --- probe coroutines ---
+    async def _probe_tcp(self, host, timeout):
+        started = time.perf_counter()
+        try:
+            _reader, writer = await asyncio.wait_for(
+                asyncio.open_connection(host, self.tcp_port), timeout)
+            writer.close()
+        except ConnectionRefusedError:
+            pass  # RST came back, so the host itself answered
+        except asyncio.TimeoutError:
+            return ProbeResult(host, False, None, 'tcp', 'timeout')
+        except OSError as e:
+            return ProbeResult(host, False, None, 'tcp', e.strerror or str(e))
+        return ProbeResult(host, True, round((time.perf_counter() - started) * 1000, 2), 'tcp')
+
+    async def _probe_icmp(self, host, timeout):
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout
+        try:
+            infos = await asyncio.wait_for(
+                loop.getaddrinfo(host, None, type=socket.SOCK_DGRAM), timeout)
+        except asyncio.TimeoutError:
+            return ProbeResult(host, False, None, 'icmp', 'resolve timeout')
+        except OSError as e:
+            return ProbeResult(host, False, None, 'icmp', e.strerror or str(e))
+        family, _type, _proto, _canon, address = infos[0]
+        sock = self._icmp_socket(family)
+        if sock is None:
+            if self.mode == 'icmp':
+                return ProbeResult(host, False, None, 'icmp', 'icmp sockets not permitted')
+            return await self._probe_tcp(host, max(deadline - loop.time(), 0.01))
+        try:
+            latency = await sock.echo(address, max(deadline - loop.time(), 0.01))
+        except asyncio.TimeoutError:
+            return ProbeResult(host, False, None, 'icmp', 'timeout')
+        except OSError as e:
+            return ProbeResult(host, False, None, 'icmp', e.strerror or str(e))
+        return ProbeResult(host, True, latency, 'icmp')
+
+    async def _probe_one(self, host, timeout):
+        if self._inflight is None:
+            self._inflight = asyncio.Semaphore(self.max_inflight)
+        async with self._inflight:
+            try:
+                if self.mode == 'tcp':
+                    return await self._probe_tcp(host, timeout)
+                return await self._probe_icmp(host, timeout)
+            except Exception as e:
+                return ProbeResult(host, False, None, self.mode, str(e))
+
+    async def probe_many_async(self, hosts: Iterable[str], timeout: Optional[float] = None) -> List[ProbeResult]:
+        """Coroutine form of probe_many; must run on this engine's loop."""
+        timeout = self.timeout if timeout is None else timeout
+        return list(await asyncio.gather(*(self._probe_one(h, timeout) for h in hosts)))
+
+    # --- sync API for request handlers ---
+    def probe_many(self, hosts: Iterable[str], timeout: Optional[float] = None) -> List[ProbeResult]:
+        """Probe all hosts concurrently; results keep the input order."""
+        hosts = list(hosts)
+        if not hosts:
+            return []
+        loop = self._ensure_loop()
+        future = asyncio.run_coroutine_threadsafe(self.probe_many_async(hosts, timeout), loop)
+        return future.result()
+
+    def probe(self, host: str, timeout: Optional[float] = None) -> ProbeResult:
+        return self.probe_many([host], timeout)[0]
+
+    def submit(self, host: str, timeout: Optional[float] = None) -> Future:
+        """Start a probe without waiting; the returned future yields a ProbeResult."""
+        loop = self._ensure_loop()
+        timeout = self.timeout if timeout is None else timeout
+        return asyncio.run_coroutine_threadsafe(self._probe_one(host, timeout), loop)
+
+
+engine = ProbeEngine()
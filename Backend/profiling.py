@@ -0,0 +1,317 @@
+"""
+On-demand request profiling.
+
+Off by default. An admin turns it on through PUT /api/profiling with a
+sampling rate and/or a list of routes (Flask endpoint names or path
+prefixes). It switches itself off again after ttl_seconds. The settings
+live in a small JSON file that every worker re-reads about once a second,
+so one call reaches all gunicorn workers.
+
+A selected request runs under cProfile, and each SQL statement it issues
+is recorded with its duration. Results are written to PROFILING_DIR, one
+summary (.json) and one stats file (.pstats) per profile, so every gunicorn
+worker can list and serve every profile whichever worker captured it. Only
+the newest PROFILING_BUFFER_SIZE profiles are kept. Each profile can be
+downloaded as pstats (load with pstats.Stats or snakeviz) or as collapsed
+stacks for flamegraph.pl, speedscope or inferno. cProfile keeps caller edges but not full stacks, so
+the collapsed stacks split each function's time across its callers
+proportionally.
+
+Only one request per worker is profiled at a time; others pass through
+untouched. With gevent workers the profile can include other greenlets
+that ran while the profiled request was waiting. Streamed responses are
+profiled until the response starts.
+
+Config via env vars:
+  PROFILING_STATE_FILE     shared settings file (default: <tmp>/profiling.json)
+  PROFILING_DIR            shared profile directory (default: <tmp>/profiles)
+  PROFILING_BUFFER_SIZE    profiles kept (default 20)
+  PROFILING_MAX_SQL        statements recorded per profile (default 500)
+"""
+
+import collections
+import contextlib
+import cProfile
+import json
+import marshal
+import os
+import random
+import re
+import secrets
+import tempfile
+import threading
+import time
+
+from flask import g, has_request_context, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+STATE_FILE = os.getenv('PROFILING_STATE_FILE', os.path.join(tempfile.gettempdir(), 'profiling.json'))
+PROFILE_DIR = os.getenv('PROFILING_DIR', os.path.join(tempfile.gettempdir(), 'profiles'))
+BUFFER_SIZE = int(os.getenv('PROFILING_BUFFER_SIZE', '20'))
+MAX_SQL = int(os.getenv('PROFILING_MAX_SQL', '500'))
+MAX_STATEMENT_CHARS = 2000
+MAX_STACK_DEPTH = 256
+# How often a worker re-reads the settings file
+STATE_CHECK_INTERVAL = 1.0
+
+DEFAULT_SETTINGS = {'enabled': False, 'sample_rate': 0.0, 'routes': [], 'expires_at': None}
+# Profile ids become file names
+PROFILE_ID = re.compile(r'^\d+-[0-9a-f]+$')
+
+
+class Profiler:
+    def __init__(self, directory=PROFILE_DIR, keep=BUFFER_SIZE):
+        self.directory = directory
+        self.keep = keep
+        self._settings = dict(DEFAULT_SETTINGS)
+        self._mtime = None
+        self._checked = 0.0
+        self._active = threading.Lock()
+
+    # --- settings (shared across workers through STATE_FILE) ---
+    def settings(self):
+        now = time.monotonic()
+        if now - self._checked >= STATE_CHECK_INTERVAL:
+            self._checked = now
+            try:
+                mtime = os.stat(STATE_FILE).st_mtime_ns
+            except OSError:
+                mtime = None
+            if mtime != self._mtime:
+                self._mtime = mtime
+                self._settings = self._read_settings() if mtime else dict(DEFAULT_SETTINGS)
+        return self._settings
+
+    @staticmethod
+    def _read_settings():
+        try:
+            with open(STATE_FILE) as f:
+                return {**DEFAULT_SETTINGS, **json.load(f)}
+        except (OSError, ValueError):
+            return dict(DEFAULT_SETTINGS)
+
+    def configure(self, enabled, sample_rate=0.0, routes=(), ttl_seconds=600):
+        settings = {
+            'enabled': bool(enabled),
+            'sample_rate': float(sample_rate),
+            'routes': list(routes),
+            'expires_at': time.time() + ttl_seconds if enabled else None,
+        }
+        tmp = f'{STATE_FILE}.{os.getpid()}.tmp'
+        with open(tmp, 'w') as f:
+            json.dump(settings, f)
+        os.replace(tmp, STATE_FILE)
+        self._checked = 0.0
+        return self.settings()
+
+    def wanted(self):
+        settings = self.settings()
+        if not settings['enabled'] or (settings['expires_at'] and time.time() > settings['expires_at']):
+            return False
+        endpoint = request.endpoint or ''
+        if any(endpoint == route or request.path.startswith(route) for route in settings['routes']):
+            return True
+        return settings['sample_rate'] > 0 and random.random() < settings['sample_rate']
+
+    # --- capture ---
+    def start(self):
+        if not self.wanted() or not self._active.acquire(blocking=False):
+            return
+        profile = {'profiler': cProfile.Profile(), 'sql': [], 'sql_dropped': 0,
+                   'started': time.perf_counter(), 'status': None}
+        try:
+            profile['profiler'].enable()
+        except ValueError:
+            # Another profiler (a debugger, say) owns this thread
+            self._active.release()
+            return
+        g.profile = profile
+
+    def stop(self):
+        profile = g.pop('profile', None)
+        if profile is None:
+            return
+        try:
+            profile['profiler'].disable()
+        finally:
+            self._active.release()
+        duration = time.perf_counter() - profile['started']
+        profile['profiler'].create_stats()
+        sql = profile['sql']
+        entry = {
+            'id': f'{os.getpid()}-{secrets.token_hex(4)}',
+            'pid': os.getpid(),
+            'captured_at': time.time(),
+            'method': request.method,
+            'path': request.path,
+            'endpoint': request.endpoint,
+            'status': profile['status'],
+            'duration_ms': round(duration * 1000, 2),
+            'sql_count': len(sql) + profile['sql_dropped'],
+            'sql_ms': round(sum(q['duration_ms'] for q in sql), 2),
+            'sql': sql,
+        }
+        self._save(entry, profile['profiler'].stats)
+
+    def record_sql(self, statement, duration, executemany):
+        profile = g.get('profile')
+        if profile is None:
+            return
+        if len(profile['sql']) >= MAX_SQL:
+            profile['sql_dropped'] += 1
+            return
+        profile['sql'].append({'statement': statement[:MAX_STATEMENT_CHARS],
+                               'duration_ms': round(duration * 1000, 3), 'executemany': executemany})
+
+    # --- results (shared by all workers through PROFILE_DIR) ---
+    def _path(self, profile_id, suffix):
+        return os.path.join(self.directory, profile_id + suffix)
+
+    def _save(self, entry, stats):
+        os.makedirs(self.directory, exist_ok=True)
+        # Stats first and each file renamed into place, so a listed profile is always complete
+        for suffix, data in (('.pstats', marshal.dumps(stats)), ('.json', json.dumps(entry).encode())):
+            tmp = self._path(entry['id'], suffix + '.tmp')
+            with open(tmp, 'wb') as f:
+                f.write(data)
+            os.replace(tmp, self._path(entry['id'], suffix))
+        for profile_id in self._ids()[:-self.keep or None]:
+            self._remove(profile_id)
+
+    def _ids(self):
+        """Profile ids, oldest first."""
+        try:
+            names = [name for name in os.listdir(self.directory) if name.endswith('.json')]
+        except OSError:
+            return []
+        found = []
+        for name in names:
+            try:
+                found.append((os.stat(os.path.join(self.directory, name)).st_mtime_ns, name[:-5]))
+            except OSError:
+                continue  # removed by another worker meanwhile
+        return [profile_id for _, profile_id in sorted(found)]
+
+    def _remove(self, profile_id):
+        for suffix in ('.json', '.pstats'):
+            with contextlib.suppress(OSError):
+                os.remove(self._path(profile_id, suffix))
+
+    def _summary(self, profile_id):
+        try:
+            with open(self._path(profile_id, '.json')) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def profiles(self):
+        summaries = (self._summary(profile_id) for profile_id in self._ids())
+        return [{k: v for k, v in entry.items() if k != 'sql'} for entry in summaries if entry]
+
+    def get(self, profile_id):
+        """Summary, SQL and stats of one profile, or None."""
+        if not PROFILE_ID.match(profile_id or ''):
+            return None
+        entry = self._summary(profile_id)
+        if entry is None:
+            return None
+        try:
+            with open(self._path(profile_id, '.pstats'), 'rb') as f:
+                entry['stats'] = marshal.loads(f.read())
+        except (OSError, ValueError, EOFError, TypeError):
+            return None
+        return entry
+
+    def clear(self):
+        for profile_id in self._ids():
+            self._remove(profile_id)
+
+
+def _label(func):
+    filename, line, name = func
+    if filename == '~':
+        return name  # built-ins, e.g. <method 'execute' of 'sqlite3.Cursor' objects>
+    return f'{name} ({os.path.basename(filename)}:{line})'
+
+
+def top_functions(entry, limit=30):
+    rows = []
+    for func, (cc, nc, tt, ct, _callers) in entry['stats'].items():
+        rows.append({'function': _label(func), 'calls': nc, 'primitive_calls': cc,
+                     'self_ms': round(tt * 1000, 3), 'cumulative_ms': round(ct * 1000, 3)})
+    rows.sort(key=lambda row: row['cumulative_ms'], reverse=True)
+    return rows[:limit]
+
+
+def to_pstats(entry):
+    """Bytes in the format Profile.dump_stats() writes; pstats.Stats(path) loads them."""
+    return marshal.dumps(entry['stats'])
+
+
+def to_collapsed(entry):
+    """Collapsed stacks ("a;b;c <microseconds>") reconstructed from caller edges."""
+    stats = entry['stats']
+    children = collections.defaultdict(list)
+    for func, (_cc, _nc, _tt, _ct, callers) in stats.items():
+        for caller, (_ecc, _enc, _ett, edge_ct) in callers.items():
+            children[caller].append((func, edge_ct))
+    roots = [func for func, value in stats.items() if not value[4]]
+    lines = collections.Counter()
+
+    def walk(func, path, share, seen):
+        path = path + [_label(func).replace(';', ',')]
+        weight = int(stats[func][2] * share * 1_000_000)
+        if weight:
+            lines[';'.join(path)] += weight
+        if len(path) >= MAX_STACK_DEPTH:
+            return
+        for child, edge_ct in children.get(func, ()):
+            if child in seen or child not in stats:
+                continue
+            child_ct = stats[child][3]
+            # Paths worth less than a microsecond are dropped; call graphs can fan out a lot
+            if child_ct > 0 and edge_ct * share >= 1e-6:
+                walk(child, path, share * edge_ct / child_ct, seen | {child})
+
+    for root in roots:
+        walk(root, [], 1.0, {root})
+    return ''.join(f'{stack} {weight}\n' for stack, weight in lines.most_common())
+
+
+profiler = Profiler()
+
+
+@event.listens_for(Engine, 'before_cursor_execute')
+def _sql_started(conn, cursor, statement, parameters, context, executemany):
+    if context is not None and has_request_context() and 'profile' in g:
+        context._profile_started = time.perf_counter()
+
+
+@event.listens_for(Engine, 'after_cursor_execute')
+def _sql_finished(conn, cursor, statement, parameters, context, executemany):
+    started = getattr(context, '_profile_started', None)
+    if started is not None:
+        profiler.record_sql(statement, time.perf_counter() - started, executemany)
+
+
+def _before_request():
+    profiler.start()
+
+
+def _after_request(response):
+    if 'profile' in g:
+        g.profile['status'] = response.status_code
+    return response
+
+
+def _teardown_request(_exc):
+    if 'profile' in g:
+        profiler.stop()
+
+
+def init_app(app):
+    app.before_request(_before_request)
+    app.after_request(_after_request)
+    app.teardown_request(_teardown_request)
+
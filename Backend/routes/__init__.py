@@ -0,0 +1,10 @@
+"""HTTP routes, one blueprint per area. register_blueprints() wires them into an app."""
+
+from routes import auth, dashboards, ldap, profiling, remote_exec, servers
+
+BLUEPRINTS = (auth.bp, dashboards.bp, servers.bp, ldap.bp, remote_exec.bp, profiling.bp)
+
+
+def register_blueprints(app):
+    for blueprint in BLUEPRINTS:
+        app.register_blueprint(blueprint)
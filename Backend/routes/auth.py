@@ -0,0 +1,316 @@
+"""Login, 2FA, session bootstrap and user management routes.
+
+pyotp and qrcode are imported on first use: most workers never set up 2FA,
+and qrcode pulls in PIL for PNG output.
+"""
+
+import base64
+import hashlib
+import io
+import json
+import os
+
+from flask import Blueprint, current_app, g, jsonify, make_response, redirect, request, session
+
+from cache import TTLCache
+from extensions import db
+from models import Dashboard, User, dashboard_etag
+from passwords import hasher as password_hasher
+from security import admin_required, find_user, generate_token, token_required
+
+bp = Blueprint('auth', __name__)
+
+"""
+ORIGINAL LOGIN ROUTE (DB-auth only)
+"""
+
+@bp.route('/app/login', methods=['POST'])
+def input_form():
+    data = request.get_json()
+    identifier = data.get("email")
+    password = data.get("password")
+
+    if not identifier or not password:
+        return jsonify({'error': 'Email/Username and password are required'}), 400
+
+    user = find_user(identifier)
+
+    if not user or not user.check_password(password):
+        return jsonify({'error': 'Invalid username or password'}), 401
+    if password_hasher.needs_rehash(user.password_hash):
+        # PASSWORD_HASH_METHOD changed since this hash was made; upgrade it now we know the password
+        try:
+            user.set_password(password)
+            db.session.commit()
+        except Exception as e:
+            db.session.rollback()
+            print(f"[auth] Could not rehash password for user {user.id}: {e}")
+
+    token = generate_token(user)
+    session['user'] = user.email
+    session['role'] = user.user_group
+
+    return jsonify({
+        'message': 'Login successful',
+        'user': user.email,
+        'username': user.username,
+        'role': user.user_group,
+        'token': token,
+        '2fa_required': user.is_2fa_enabled,
+        'user_id': user.id
+    }), 200
+
+@bp.route('/api/auth/password-hashing', methods=['GET'])
+@admin_required
+def password_hashing_stats():
+    return jsonify(password_hasher.stats()), 200
+
+@bp.route('/protected')
+def protected():
+	if 'user' in session:
+		return f"Welcome, {session['user']}! <a href='/logout'>Logout</a>"
+	return redirect('/')
+
+@bp.route('/logout')
+def logout():
+	session.clear()
+	return redirect('/')
+
+# Rendered enrollment QR codes keyed by (sha256 of provisioning URI, format);
+# the URI covers secret, issuer and account, so a hit is byte-for-byte what we'd render
+qr_cache = TTLCache(
+    ttl=float(os.getenv('QR_CACHE_TTL', '3600')),
+    max_bytes=int(os.getenv('QR_CACHE_MAX_BYTES', str(4 * 1024 * 1024))),
+    sizer=len,
+    name='qr-cache',
+)
+
+def _render_qr(uri, qr_format):
+    """PNG as base64 (rendered with PIL) or SVG markup built straight from the module matrix.
+    The 1-bit PNG is the smaller payload (~1.7 KB vs ~3.4 KB for a typical code) and
+    stays the default; SVG scales crisply at any size and only wins once gzipped."""
+    import qrcode
+    if qr_format == 'svg':
+        qr = qrcode.QRCode(border=4)
+        qr.add_data(uri)
+        matrix = qr.get_matrix()
+        # One stroked horizontal segment per run of dark modules, with relative
+        # moves between runs, keeps the path a few characters per run
+        path = ['M0 .5']
+        cx = cy = 0
+        for y, row in enumerate(matrix):
+            x = 0
+            while x < len(row):
+                if row[x]:
+                    start = x
+                    while x < len(row) and row[x]:
+                        x += 1
+                    path.append(f'm{start - cx} {y - cy}h{x - start}')
+                    cx, cy = x, y
+                x += 1
+        size = len(matrix)
+        return (f"<svg xmlns='http://www.w3.org/2000/svg' viewBox='0 0 {size} {size}' shape-rendering='crispEdges'>"
+                f"<rect width='{size}' height='{size}' fill='#fff'/>"
+                f"<path stroke='#000' d='{''.join(path)}'/></svg>")
+    qr = qrcode.make(uri)
+    buf = io.BytesIO()
+    qr.save(buf, format='PNG')
+    return base64.b64encode(buf.getvalue()).decode()
+
+@bp.route('/app/2fa', methods=['POST'])
+def setup_2fa():
+    import pyotp
+    try:
+        data = request.get_json()
+        if not data:
+            return jsonify({'error': 'No data provided'}), 400
+
+        identifier = data.get('email')  # can be email or username
+        if not identifier:
+            return jsonify({'error': 'Email/Username is required'}), 400
+
+        user = find_user(identifier)
+        if not user:
+            return jsonify({'error': 'User not found'}), 404
+
+        # Only generate a new secret if not already set
+        if not user.otp_secret:
+            secret = pyotp.random_base32()
+            user.otp_secret = secret
+            db.session.commit()
+        else:
+            secret = user.otp_secret
+
+        qr_format = (data.get('format') or request.args.get('format') or 'png').lower()
+        if qr_format not in ('png', 'svg'):
+            return jsonify({'error': 'format must be png or svg'}), 400
+
+        # Generate the provisioning URI
+        uri = pyotp.totp.TOTP(secret).provisioning_uri(
+            name=user.email,
+            issuer_name="MyApp"
+        )
+        qr_code, status = qr_cache.get_or_load((hashlib.sha256(uri.encode()).hexdigest(), qr_format),
+                                               lambda: _render_qr(uri, qr_format))
+        response = jsonify({'qr_code': qr_code, 'format': qr_format})
+        response.headers['X-Cache'] = status
+        response.headers['Cache-Control'] = 'no-store'
+        return response, 200
+
+    except Exception as e:
+        import traceback
+        traceback.print_exc()
+        return jsonify({'error': 'Failed to generate QR code'}), 500
+
+@bp.route('/app/user', methods=['GET'])
+@token_required
+def verify_user():
+	return jsonify({'message': 'User verified!', "user_group": g.current_user['user_group']}), 200
+
+@bp.route('/app/session', methods=['GET'])
+@token_required
+def get_session():
+    """Everything the frontend needs at startup in one response: user group,
+    2FA state and dashboard config. Claims come from token_required (cached);
+    only the dashboard row is queried. Supports If-None-Match; the stored
+    dashboard JSON is never decoded.
+    """
+    claims = g.current_user
+    dashboard = Dashboard.query.filter_by(user_id=claims['user_id']).first()
+
+    fingerprint = json.dumps([claims, dashboard.etag if dashboard else dashboard_etag(None, None)])
+    etag = hashlib.sha1(fingerprint.encode()).hexdigest()
+    if request.if_none_match.contains(etag):
+        response = make_response('', 304)
+    else:
+        head = json.dumps({
+            'user': {
+                'user_id': claims['user_id'],
+                'email': claims['email'],
+                'username': claims['username'],
+                'user_group': claims['user_group'],
+            },
+            '2fa': {
+                'is_2fa_enabled': claims['is_2fa_enabled'],
+                '2fa_completed': claims['2fa_completed'],
+            },
+        })
+        dashboard_json = dashboard.to_json() if dashboard else json.dumps(
+            {'panels': [], 'pinned_panels': [], 'dashboard_layouts': {}, 'version': None, 'updated_at': None})
+        # Splice the stored dashboard JSON in rather than decoding and re-encoding it
+        response = current_app.response_class(head[:-1] + ',"dashboard":' + dashboard_json + '}',
+                                      mimetype='application/json')
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = 'private, no-cache'
+    return response
+
+@bp.route('/app/verify-2fa', methods=['POST'])
+def verify_2fa():
+    import pyotp
+    try:
+        data = request.get_json()
+        if not data:
+            return jsonify({'error': 'No data provided'}), 400
+
+        identifier = data.get('email')  # can be email or username
+        code = data.get('code')
+
+        if not identifier or not code:
+            return jsonify({'error': 'Email/Username and code are required'}), 400
+
+        user = find_user(identifier)
+        if not user:
+            return jsonify({'error': 'User not found'}), 404
+
+        if not user.otp_secret:
+            return jsonify({'error': '2FA not set up'}), 400
+
+        totp = pyotp.TOTP(user.otp_secret)
+        if totp.verify(code):
+            user._2fa_completed = True
+            db.session.commit()
+            return jsonify({
+                'status': 'success',
+                'user_group': user.user_group
+            }), 200
+        else:
+            return jsonify({'error': 'Invalid code'}), 401
+
+    except Exception as e:
+        return jsonify({'error': 'Internal server error'}), 500
+
+@bp.route('/app/2fa-status', methods=['GET'])
+@token_required
+def get_2fa_status():
+	user = g.current_user
+	return jsonify({
+		'is_2fa_enabled': user['is_2fa_enabled'],
+		'email': user['email'],
+		'2fa_completed': user['2fa_completed']
+	}), 200
+
+@bp.route('/app/update-2fa-status', methods=['POST'])
+def update_2fa_status():
+	data = request.get_json()
+	email = data.get('email')
+	is_2fa_enabled = data.get('is_2fa_enabled')
+
+	user = User.query.filter_by(email=email).first()
+	if not user:
+		return jsonify({'error': 'User not found'}), 404
+
+	user.is_2fa_enabled = True if is_2fa_enabled else False
+	db.session.commit()
+
+	return jsonify({'message': '2FA status updated successfully'}), 200
+
+@bp.route('/api/users', methods=['GET'])
+def get_users():
+    users = User.query.all()
+    user_list = [{'email': u.email, 'username': u.username, 'user_group': u.user_group, 'password': '*'} for u in users]
+    print(f"[DEBUG] Returning {len(user_list)} users")
+    print(f"[DEBUG] Users: {user_list}")
+    return jsonify(user_list), 200
+
+@bp.route('/api/users', methods=['POST'])
+def add_user():
+    data = request.get_json()
+    email = data.get('email')
+    password = data.get('password')
+    username = data.get('username')
+    user_group = data.get('user_group', 'viewer')
+
+    if not email or not password or not username or not user_group:
+        return jsonify({'error': 'Email, username, password, and user group are required'}), 400
+
+    # Check local DB (emails and usernames share one case-insensitive namespace)
+    if find_user(email) or find_user(username):
+        return jsonify({'error': 'User already exists'}), 409
+
+    # Add to local DB
+    user = User(email=email)
+    user.set_password(password)
+    user.set_user_group(user_group)
+    user.set_username(username)
+    db.session.add(user)
+    try:
+        db.session.commit()
+    except Exception as e:
+        db.session.rollback()
+        import traceback
+        traceback.print_exc()
+        return jsonify({'error': f'Database error: {str(e)}'}), 500
+
+    return jsonify({'message': 'User added'}), 201
+
+@bp.route('/api/users/<path:identifier>', methods=['DELETE'])
+def delete_user(identifier):
+    user = find_user(identifier)
+    if not user:
+        return jsonify({'error': 'User not found'}), 404
+
+    # Remove from local DB
+    db.session.delete(user)
+    db.session.commit()
+
+    return jsonify({'message': 'User deleted'}), 200
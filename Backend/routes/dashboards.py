@@ -0,0 +1,291 @@
+"""Dashboard layout, panel and pin routes."""
+
+import datetime
+import json
+
+from flask import Blueprint, current_app, g, jsonify, make_response, request
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm.exc import StaleDataError
+
+from extensions import db
+from jsonpatch import JsonPatchConflict, JsonPatchError, apply_patch, touched_roots
+from models import PANEL_KIND, PINNED_KIND, Dashboard, DashboardPanel, User, dashboard_etag
+from security import admin_required, token_required
+
+bp = Blueprint('dashboards', __name__)
+
+# --- Dashboard Routes ---
+@bp.route('/app/dashboard', methods=['GET'])
+@token_required
+def get_dashboard():
+    """Get the current user's dashboard configuration.
+    Sends an ETag per dashboard version; If-None-Match answers 304 after a
+    query that never touches the JSON columns."""
+    user_id = g.current_user['user_id']
+    try:
+        head = db.session.query(Dashboard.id, Dashboard.version).filter_by(user_id=user_id).first()
+        etag = dashboard_etag(*head) if head else dashboard_etag(None, None)
+        if request.if_none_match.contains(etag):
+            response = make_response('', 304)
+        elif head:
+            dashboard = db.session.get(Dashboard, head.id)
+            response = current_app.response_class(dashboard.to_json(), mimetype='application/json')
+        else:
+            # Return empty dashboard if none exists
+            response = jsonify({'panels': [], 'pinned_panels': [], 'dashboard_layouts': {}})
+        response.set_etag(etag)
+        response.headers['Cache-Control'] = 'private, no-cache'
+        return response
+    except Exception as e:
+        return jsonify({'error': f'Internal server error: {str(e)}'}), 500
+
+def _modified_response(user_id, status):
+    """Reply to a lost optimistic-locking race with the version that won."""
+    db.session.rollback()
+    head = db.session.query(Dashboard.id, Dashboard.version).filter_by(user_id=user_id).first()
+    response = jsonify({'error': 'Dashboard was modified by another request',
+                        'version': head.version if head else None})
+    response.set_etag(dashboard_etag(*head) if head else dashboard_etag(None, None))
+    return response, status
+
+@bp.route('/app/dashboard', methods=['POST'])
+@token_required
+def save_dashboard():
+    """Save the current user's dashboard configuration"""
+    user_id = g.current_user['user_id']
+    try:
+        data = request.get_json()
+        if not data or 'panels' not in data:
+            return jsonify({'error': 'Panels data is required'}), 400
+        
+        panels = data['panels']
+        pinned_panels = data.get('pinned_panels', []) # Get pinned panels from request
+        dashboard_layouts = data.get('dashboard_layouts', {}) # Get dashboard layouts from request
+        
+        # Check if dashboard exists for this user
+        dashboard = Dashboard.query.filter_by(user_id=user_id).first()
+        
+        if dashboard:
+            # Update existing dashboard
+            dashboard.dashboard_layouts = json.dumps(dashboard_layouts) # Update dashboard layouts
+            dashboard.updated_at = datetime.datetime.now(datetime.UTC)
+        else:
+            # Create new dashboard
+            dashboard = Dashboard(
+                user_id=user_id,
+                dashboard_layouts=json.dumps(dashboard_layouts) # Initialize dashboard layouts
+            )
+            db.session.add(dashboard)
+            db.session.flush()
+
+        try:
+            DashboardPanel.replace(dashboard.id, PANEL_KIND, panels)
+            DashboardPanel.replace(dashboard.id, PINNED_KIND, pinned_panels)
+        except ValueError as e:
+            db.session.rollback()
+            return jsonify({'error': str(e)}), 400
+        
+        db.session.commit()
+        
+        response = jsonify({
+            'message': 'Dashboard saved successfully',
+            'panels': panels,
+            'pinned_panels': pinned_panels,
+            'dashboard_layouts': dashboard_layouts,
+            'version': dashboard.version
+        })
+        response.set_etag(dashboard.etag)
+        return response, 200
+        
+    except StaleDataError:
+        # Another save bumped the version between our read and our write
+        return _modified_response(user_id, 409)
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': f'Internal server error: {str(e)}'}), 500
+
+# Patchable members of the dashboard document -> dashboard_panel kind (None = dashboard column)
+DASHBOARD_SECTIONS = {
+    'panels': PANEL_KIND,
+    'pinned_panels': PINNED_KIND,
+    'dashboard_layouts': None,
+}
+
+def _section_delta(name, before, after):
+    """What changed in one section: the new value for dashboard_layouts; for panel
+    sections the added or edited panels, the removed ids and, if it changed, the order."""
+    if not DASHBOARD_SECTIONS[name]:
+        return after
+    old = {str(panel['id']): panel for panel in before}
+    new = {str(panel['id']): panel for panel in after}
+    delta = {
+        'upserted': [panel for panel_id, panel in new.items() if old.get(panel_id) != panel],
+        'removed': [panel_id for panel_id in old if panel_id not in new],
+    }
+    kept = [panel_id for panel_id in old if panel_id in new]
+    if list(new) != kept + [panel_id for panel_id in new if panel_id not in old]:
+        delta['order'] = list(new)
+    return delta
+
+@bp.route('/app/dashboard', methods=['PATCH'])
+@token_required
+def patch_dashboard():
+    """Apply an RFC 6902 JSON Patch to the current user's dashboard.
+    Paths address {panels, pinned_panels, dashboard_layouts}; only the
+    sections a patch touches are decoded and rewritten, and the response holds
+    only what changed (see _section_delta). Send If-Match with the dashboard
+    ETag (or a "version" query arg) to reject concurrent edits."""
+    user_id = g.current_user['user_id']
+    operations = request.get_json(force=True, silent=True)
+    if isinstance(operations, dict) and 'patch' in operations:
+        operations = operations['patch']
+    try:
+        roots = touched_roots(operations)
+    except JsonPatchError as e:
+        return jsonify({'error': str(e)}), 400
+    if not isinstance(operations, list) or not operations:
+        return jsonify({'error': 'Request body must be a non-empty JSON Patch array'}), 400
+    if roots is None or roots - DASHBOARD_SECTIONS.keys():
+        return jsonify({'error': f'Patch paths must start with one of: {", ".join(DASHBOARD_SECTIONS)}'}), 400
+
+    try:
+        dashboard = Dashboard.query.filter_by(user_id=user_id).first()
+        current_etag = dashboard.etag if dashboard else dashboard_etag(None, None)
+        expected_version = request.args.get('version', type=int)
+        if (request.if_match and not request.if_match.contains(current_etag)) or \
+                (expected_version is not None and (dashboard.version if dashboard else 0) != expected_version):
+            response = jsonify({'error': 'Dashboard was modified by another request',
+                                'version': dashboard.version if dashboard else None})
+            response.set_etag(current_etag)
+            return response, 412
+
+        document = {}
+        for name in roots:
+            kind = DASHBOARD_SECTIONS[name]
+            if kind:
+                document[name] = DashboardPanel.load(dashboard.id if dashboard else None, kind)
+            else:
+                raw = dashboard.dashboard_layouts if dashboard else None
+                document[name] = json.loads(raw) if raw else {}
+
+        try:
+            patched = apply_patch(document, operations)
+        except JsonPatchConflict as e:
+            return jsonify({'error': str(e), 'index': e.index}), 409
+        except JsonPatchError as e:
+            return jsonify({'error': str(e), 'index': e.index}), 422
+        for name in roots:
+            if name not in patched:
+                return jsonify({'error': f'Section {name} cannot be removed'}), 422
+
+        changed = sorted(name for name in roots if patched[name] != document[name])
+        if changed or not dashboard:
+            if not dashboard:
+                dashboard = Dashboard(user_id=user_id, dashboard_layouts='{}')
+                db.session.add(dashboard)
+                db.session.flush()
+            try:
+                for name in changed:
+                    if DASHBOARD_SECTIONS[name]:
+                        DashboardPanel.replace(dashboard.id, DASHBOARD_SECTIONS[name], patched[name])
+                    else:
+                        dashboard.dashboard_layouts = json.dumps(patched[name])
+            except ValueError as e:
+                db.session.rollback()
+                return jsonify({'error': str(e)}), 422
+            dashboard.updated_at = datetime.datetime.now(datetime.UTC)
+            db.session.commit()
+
+        response = jsonify({
+            'message': 'Dashboard patched successfully',
+            'applied': len(operations),
+            'changed': {name: _section_delta(name, document[name], patched[name]) for name in changed},
+            'version': dashboard.version
+        })
+        response.set_etag(dashboard.etag)
+        return response, 200
+
+    except StaleDataError:
+        return _modified_response(user_id, 412)
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': f'Internal server error: {str(e)}'}), 500
+
+@bp.route('/app/dashboard/pin', methods=['POST'])
+@token_required
+def pin_panel():
+    """Pin or unpin a panel to/from dashboard"""
+    user_id = g.current_user['user_id']
+    try:
+        data = request.get_json()
+        if not data or 'panel' not in data or 'action' not in data:
+            return jsonify({'error': 'Panel data and action are required'}), 400
+        
+        panel = data['panel']
+        action = data['action']  # 'pin' or 'unpin'
+        
+        # Get user's dashboard
+        dashboard = Dashboard.query.filter_by(user_id=user_id).first()
+        
+        if not dashboard:
+            return jsonify({'error': 'Dashboard not found'}), 404
+        
+        if not isinstance(panel, dict) or panel.get('id') in (None, ''):
+            return jsonify({'error': 'Panel id is required'}), 400
+        pinned = DashboardPanel.query.filter_by(dashboard_id=dashboard.id, kind=PINNED_KIND,
+                                                panel_id=str(panel['id']))
+        
+        if action == 'pin':
+            # Check if panel is already pinned (unique index lookup)
+            if db.session.query(pinned.exists()).scalar():
+                return jsonify({'error': 'Panel is already pinned'}), 400
+            next_position = (db.session.query(db.func.coalesce(db.func.max(DashboardPanel.position), -1) + 1)
+                             .filter_by(dashboard_id=dashboard.id, kind=PINNED_KIND)
+                             .scalar_subquery())
+            try:
+                db.session.execute(db.insert(DashboardPanel).values(
+                    dashboard_id=dashboard.id, kind=PINNED_KIND, panel_id=str(panel['id']),
+                    position=next_position, config=json.dumps(panel)))
+            except IntegrityError:
+                # Lost a race with a concurrent pin of the same panel
+                db.session.rollback()
+                return jsonify({'error': 'Panel is already pinned'}), 400
+            message = 'Panel pinned successfully'
+        elif action == 'unpin':
+            # Remove panel from pinned list
+            pinned.delete(synchronize_session=False)
+            message = 'Panel unpinned successfully'
+        else:
+            return jsonify({'error': 'Invalid action. Use "pin" or "unpin"'}), 400
+        
+        # Update dashboard
+        dashboard.updated_at = datetime.datetime.now(datetime.UTC)
+        db.session.commit()
+        current_pinned = DashboardPanel.load(dashboard.id, PINNED_KIND)
+        
+        response = jsonify({
+            'message': message,
+            'pinned_panels': current_pinned,
+            'version': dashboard.version
+        })
+        response.set_etag(dashboard.etag)
+        return response, 200
+        
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': f'Internal server error: {str(e)}'}), 500
+
+
+@bp.route('/api/dashboards/panels/<path:panel_id>', methods=['GET'])
+@admin_required
+def panel_usage(panel_id):
+    """Which dashboards show or pin a given panel (indexed on panel_id)."""
+    rows = (db.session.query(DashboardPanel.dashboard_id, DashboardPanel.kind, Dashboard.user_id, User.email)
+            .join(Dashboard, Dashboard.id == DashboardPanel.dashboard_id)
+            .join(User, User.id == Dashboard.user_id)
+            .filter(DashboardPanel.panel_id == panel_id)
+            .order_by(DashboardPanel.dashboard_id, DashboardPanel.kind))
+    return jsonify({'panel_id': panel_id, 'dashboards': [
+        {'dashboard_id': dashboard_id, 'kind': kind, 'user_id': user_id, 'email': email}
+        for dashboard_id, kind, user_id, email in rows
+    ]}), 200
@@ -0,0 +1,292 @@
+"""LDAP directory browsing routes.
+
+ldap3 (through ldappool) is imported on first use, so workers that never
+serve an LDAP request don't pay for it.
+"""
+
+import hashlib
+import os
+import tempfile
+
+from flask import Blueprint, jsonify, request
+
+import metrics
+from cache import TTLCache
+from security import admin_required
+from streaming import requested_stream_mode, stream_records, stream_response
+
+bp = Blueprint('ldap', __name__)
+
+ldap_cache = TTLCache(
+    ttl=float(os.getenv('LDAP_CACHE_TTL', '60')),
+    stale_ttl=float(os.getenv('LDAP_CACHE_STALE_TTL', '300')),
+    max_bytes=int(os.getenv('LDAP_CACHE_MAX_BYTES', str(32 * 1024 * 1024))),
+    generation_file=os.getenv('LDAP_CACHE_GENERATION_FILE',
+                              os.path.join(tempfile.gettempdir(), 'ldap-cache.generation')),
+    name='ldap-cache',
+)
+
+def _encode_ldap_cursor(query_key, token):
+    return query_key + '.' + token
+
+def _decode_ldap_cursor(cursor, query_key):
+    key, _, token = cursor.partition('.')
+    if key != query_key or not token:
+        raise ValueError('cursor does not match query')
+    return token
+
+def _checkout_page(pool, token):
+    """The connection, paged-results cookie and undelivered page a request continues
+    with: those pinned to its cursor, or a fresh checkout when starting a search."""
+    from ldappool import pools as ldap_pools
+    if token:
+        return ldap_pools.cursors.take(token, pool)
+    return pool.acquire(), None, None
+
+def _search_one_page(pool, conn, base_dn, flt, attr_list, page_size, cookie, pending=None):
+    """Run one page on conn (or hand out the pending page a cursor carried). While
+    more pages remain conn stays pinned to the returned cursor token; otherwise it
+    goes back to the pool."""
+    from ldappool import LDAPCursorExpired, is_connection_error, search_page
+    from ldappool import pools as ldap_pools
+    if pending is not None:
+        users, next_cookie = pending, cookie
+    else:
+        try:
+            users, next_cookie = search_page(conn, base_dn, flt, attr_list, page_size, cookie)
+        except BaseException as e:
+            pool.release(conn, broken=is_connection_error(e))
+            if cookie and is_connection_error(e):
+                raise LDAPCursorExpired('Connection for this cursor was lost') from e
+            raise
+    if not next_cookie:
+        pool.release(conn)
+        return users, None
+    return users, ldap_pools.cursors.pin(pool, conn, base_dn, flt, next_cookie)
+
+def _ldap_stream_pages(pool, conn, base_dn, flt, attr_list, page_size, cookie, query_key, timer,
+                       token=None, pending=None):
+    """Yield record batches for a streamed paged search; owns conn until done.
+    Prime it with next() before handing it on: from then on closing it, even before
+    the server asks for the first batch, pins or returns conn.
+    A page counts as delivered once the consumer asks for the next batch. If the
+    client goes away first, conn is pinned to the last cursor the client did get
+    (token, when resuming) together with the page it missed, which the resumed
+    search sends first. With no cursor delivered, conn goes back to the pool."""
+    from ldappool import LDAPCursorExpired, abandon_paged_search, is_connection_error, search_page
+    from ldappool import pools as ldap_pools
+    total = 0
+    broken = False
+    pinned = False
+    in_flight = None
+    outcome = 'cancelled'
+    try:
+        yield []
+        while True:
+            if pending is not None:
+                users, pending = pending, None
+            else:
+                users, cookie = search_page(conn, base_dn, flt, attr_list, page_size, cookie)
+            next_token = ldap_pools.cursors.new_token() if cookie else None
+            batch = [('user', u) for u in users]
+            batch.append(('page', {
+                'count': len(users),
+                'cursor': _encode_ldap_cursor(query_key, next_token) if next_token else None,
+            }))
+            in_flight = users
+            yield batch
+            in_flight = None
+            total += len(users)
+            token = next_token
+            if not cookie:
+                break
+        outcome = 'ok'
+        yield [('end', {'status': 'success', 'count': total})]
+    except GeneratorExit:
+        if token:
+            ldap_pools.cursors.pin(pool, conn, base_dn, flt, cookie, token=token,
+                                   pending=in_flight if in_flight is not None else pending)
+            pinned = True
+        raise
+    except LDAPCursorExpired:
+        outcome = 'expired'
+        yield [('end', {'status': 'error', 'count': total, 'message': 'Cursor expired; restart the search'})]
+    except Exception as e:
+        broken = is_connection_error(e)
+        outcome = metrics.outcome_of(e)
+        yield [('end', {'status': 'error', 'count': total, 'message': 'LDAP query failed'})]
+    finally:
+        if not pinned:
+            if cookie and not broken:
+                abandon_paged_search(conn, base_dn, flt, cookie)
+            pool.release(conn, broken=broken)
+        timer.finish(outcome)
+
+@bp.route('/api/ldap/users', methods=['GET'])
+def ldap_list_users():
+    """Query an LDAP server for user entries.
+    Query params:
+      base (required)      : Base DN, e.g. dc=example,dc=com
+      uri  (required)      : ldap://host[:port] or ldaps://host[:port]
+      bind_dn (optional)   : Explicit bind DN overrides env LDAP_BIND_DN
+      bind_password        : Overrides env LDAP_BIND_PASSWORD
+      filter (optional)    : LDAP filter (default matches person / inetOrgPerson)
+      attrs (optional)     : Comma-separated attributes (default cn,sn,uid,mail)
+      starttls=1           : Perform StartTLS after connecting (ldap:// only)
+      ssl=1                : Force use_ssl on server (equivalent to ldaps://)
+      debug=1              : Include debug info in error responses
+      page_size (optional) : Entries per LDAP page (default LDAP_PAGE_SIZE, 500).
+                             When given, only one page is returned plus next_cursor.
+      cursor (optional)    : next_cursor from a previous response; resumes the search
+      stream=ndjson|sse    : Stream entries as pages arrive; each page ends with a
+                             'page' record carrying the cursor to resume from
+      cache=0              : Skip the result cache (so does Cache-Control: no-cache)
+    Env fallbacks:
+      LDAP_BIND_DN, LDAP_BIND_PASSWORD
+    Full (unpaged) results are cached per (uri, base, filter, attrs, bind identity)
+    for LDAP_CACHE_TTL seconds, then served stale for up to LDAP_CACHE_STALE_TTL
+    while refreshed in the background. X-Cache reports HIT / STALE / MISS / BYPASS.
+    A cursor keeps the LDAP connection that holds the paged search (servers tie
+    the paged-results cookie to it) for LDAP_CURSOR_TTL seconds between pages.
+    Cursors are only known to the worker that issued them. An expired or
+    unknown cursor returns 410 and the search must restart.
+    """
+    from ldap3.core.exceptions import LDAPBindError
+    from ldappool import (LDAPBindFailed, LDAPCursorExpired, LDAPPoolExhausted, LDAPStartTLSFailed,
+                          is_connection_error, search_page)
+    from ldappool import pools as ldap_pools
+    base_dn = request.args.get('base')
+    uri = request.args.get('uri')
+    flt = request.args.get('filter', '(|(objectClass=person)(objectClass=inetOrgPerson))')
+    attrs_param = request.args.get('attrs')
+    attr_list = [a.strip() for a in attrs_param.split(',')] if attrs_param else ['cn', 'sn', 'uid', 'mail']
+    debug = request.args.get('debug') == '1' or os.getenv('LDAP_DEBUG') == '1'
+
+    if not base_dn or not uri:
+        return jsonify({'status': 'error', 'message': 'Missing required params base, uri'}), 400
+
+    bind_dn = request.args.get('bind_dn') or os.getenv('LDAP_BIND_DN')
+    bind_pw = request.args.get('bind_password') or os.getenv('LDAP_BIND_PASSWORD')
+    want_starttls = request.args.get('starttls') == '1'
+    force_ssl = request.args.get('ssl') == '1'
+
+    # Determine SSL usage: ldaps:// URI OR ssl=1
+    use_ssl = uri.lower().startswith('ldaps://') or force_ssl
+
+    try:
+        page_size = min(max(int(request.args.get('page_size') or os.getenv('LDAP_PAGE_SIZE', '500')), 1), 5000)
+    except ValueError:
+        return jsonify({'status': 'error', 'message': 'page_size must be an integer'}), 400
+    # A cursor is only valid for the exact query that produced it
+    query_key = hashlib.sha256('\0'.join([uri.lower(), base_dn, flt, ','.join(attr_list)]).encode()).hexdigest()[:16]
+    token = None
+    cursor = request.args.get('cursor')
+    if cursor:
+        try:
+            token = _decode_ldap_cursor(cursor, query_key)
+        except ValueError:
+            return jsonify({'status': 'error', 'message': 'Invalid cursor for this query'}), 400
+    stream_mode = requested_stream_mode()
+    single_page = bool(cursor) or 'page_size' in request.args
+
+    try:
+        # Pooled, already-bound connection; server info is fetched once per pool
+        creds = (bind_dn, bind_pw) if bind_dn and bind_pw else (None, None)
+        pool = ldap_pools.get(uri, *creds, use_ssl=use_ssl, starttls=want_starttls and not use_ssl)
+
+        if stream_mode:
+            # Check out up front so bind errors still get a normal error response
+            with metrics.outbound('ldap') as call:
+                conn, cookie, pending = _checkout_page(pool, token)
+                call.detach()
+            pages = _ldap_stream_pages(pool, conn, base_dn, flt, attr_list, page_size, cookie, query_key, call,
+                                       token=token, pending=pending)
+            next(pages)
+            return stream_response(stream_records(pages, stream_mode), stream_mode)
+
+        if single_page:
+            with metrics.outbound('ldap'):
+                try:
+                    conn, cookie, pending = _checkout_page(pool, token)
+                    users, next_token = _search_one_page(pool, conn, base_dn, flt, attr_list, page_size, cookie,
+                                                         pending)
+                except Exception as e:
+                    if token or not is_connection_error(e):
+                        raise
+                    # A new search on a dead pooled connection: once more on a fresh one
+                    conn = pool.acquire()
+                    users, next_token = _search_one_page(pool, conn, base_dn, flt, attr_list, page_size, None)
+            return jsonify({
+                'status': 'success',
+                'count': len(users),
+                'users': users,
+                'next_cursor': _encode_ldap_cursor(query_key, next_token) if next_token else None,
+            })
+
+        def search_all(conn):
+            # Paged under the hood so server size limits don't truncate the result
+            users, page_cookie = search_page(conn, base_dn, flt, attr_list, page_size)
+            while page_cookie:
+                page, page_cookie = search_page(conn, base_dn, flt, attr_list, page_size, page_cookie)
+                users.extend(page)
+            return users
+
+        endpoint = request.endpoint
+
+        def load():
+            # Stale entries reload on a background thread, so the endpoint is captured here
+            with metrics.outbound('ldap', endpoint):
+                return pool.run(search_all)
+
+        bypass = request.args.get('cache') == '0' or 'no-cache' in request.headers.get('Cache-Control', '')
+        if bypass:
+            users, cache_status = load(), 'BYPASS'
+        else:
+            cache_key = (uri.lower(), base_dn, flt, tuple(attr_list),
+                         creds[0] or '', hashlib.sha256((creds[1] or '').encode()).hexdigest()[:16])
+            users, cache_status = ldap_cache.get_or_load(cache_key, load)
+        response = jsonify({'status': 'success', 'count': len(users), 'users': users})
+        response.headers['X-Cache'] = cache_status
+        return response
+    except LDAPCursorExpired:
+        return jsonify({'status': 'error', 'message': 'Cursor expired; restart the search without a cursor'}), 410
+    except LDAPStartTLSFailed as e:
+        return jsonify({'status': 'error', 'message': 'StartTLS failed', 'result': e.result}), 502
+    except LDAPBindFailed as e:
+        http_code = 401 if 'invalidCredentials' in e.code else 502
+        payload = {'status': 'error', 'message': f'Bind failed: {e.code}'}
+        if debug:
+            payload['detail'] = e.result
+        return jsonify(payload), http_code
+    except LDAPPoolExhausted as e:
+        return jsonify({'status': 'error', 'message': str(e)}), 503
+    except LDAPBindError as e:
+        msg = 'Invalid credentials'
+        payload = {'status': 'error', 'message': msg}
+        if debug:
+            payload['detail'] = str(e)
+        return jsonify(payload), 401
+    except Exception as e:
+        payload = {'status': 'error', 'message': 'LDAP query failed'}
+        if debug:
+            payload['detail'] = str(e)
+        return jsonify(payload), 500
+
+@bp.route('/api/ldap/cache', methods=['GET'])
+@admin_required
+def ldap_cache_stats():
+    return jsonify(ldap_cache.stats()), 200
+
+@bp.route('/api/ldap/cache/invalidate', methods=['POST'])
+@admin_required
+def ldap_cache_invalidate():
+    """Drop cached LDAP results. JSON body (optional): uri, base to narrow it down.
+    Other gunicorn workers drop the same entries on their next lookup."""
+    data = request.get_json(silent=True) or {}
+    uri = (data.get('uri') or '').lower() or None
+    base_dn = data.get('base') or None
+    if uri or base_dn:
+        removed = ldap_cache.invalidate_prefix((uri, base_dn))
+    else:
+        removed = ldap_cache.invalidate()
+    return jsonify({'message': 'LDAP cache invalidated', 'removed': removed}), 200
@@ -0,0 +1,82 @@
+"""Admin routes to switch request profiling on and download the captured profiles."""
+
+import os
+
+from flask import Blueprint, jsonify, make_response, request
+
+from profiling import profiler, to_collapsed, to_pstats, top_functions
+from security import admin_required
+
+bp = Blueprint('profiling', __name__)
+
+PROFILING_MAX_TTL = 24 * 3600
+
+
+@bp.route('/api/profiling', methods=['GET'])
+@admin_required
+def profiling_status():
+    """Current settings plus every captured profile (shared by all workers)."""
+    return jsonify({'settings': profiler.settings(), 'pid': os.getpid(), 'profiles': profiler.profiles()}), 200
+
+
+@bp.route('/api/profiling', methods=['PUT'])
+@admin_required
+def configure_profiling():
+    """Turn profiling on or off for every worker.
+    JSON body:
+      enabled      : true / false
+      sample_rate  : fraction of all requests to profile, 0..1 (default 0)
+      routes       : endpoint names (servers.list_servers) or path prefixes (/app/dashboard)
+                     that are always profiled
+      ttl_seconds  : switch off again after this long (default 600, max one day)
+    """
+    data = request.get_json(silent=True) or {}
+    enabled = bool(data.get('enabled'))
+    try:
+        sample_rate = float(data.get('sample_rate') or 0)
+        ttl_seconds = int(data.get('ttl_seconds') or 600)
+    except (TypeError, ValueError):
+        return jsonify({'error': 'sample_rate must be a number and ttl_seconds an integer'}), 400
+    routes = data.get('routes') or []
+    if not 0 <= sample_rate <= 1:
+        return jsonify({'error': 'sample_rate must be between 0 and 1'}), 400
+    if not 0 < ttl_seconds <= PROFILING_MAX_TTL:
+        return jsonify({'error': f'ttl_seconds must be between 1 and {PROFILING_MAX_TTL}'}), 400
+    if not isinstance(routes, list) or not all(isinstance(route, str) and route for route in routes):
+        return jsonify({'error': 'routes must be a list of endpoint names or path prefixes'}), 400
+    if enabled and not sample_rate and not routes:
+        return jsonify({'error': 'Give a sample_rate or routes to profile'}), 400
+    settings = profiler.configure(enabled, sample_rate, routes, ttl_seconds)
+    print(f"[profiling] {'Enabled' if enabled else 'Disabled'}: rate={sample_rate} routes={routes}")
+    return jsonify({'message': 'Profiling settings updated', 'settings': settings}), 200
+
+
+@bp.route('/api/profiling/profiles', methods=['DELETE'])
+@admin_required
+def clear_profiles():
+    profiler.clear()
+    return jsonify({'message': 'Profiles cleared'}), 200
+
+
+@bp.route('/api/profiling/profiles/<profile_id>', methods=['GET'])
+@admin_required
+def download_profile(profile_id):
+    """One profile. format=json (summary, top functions, SQL), pstats or collapsed (flamegraph input)."""
+    entry = profiler.get(profile_id)
+    if entry is None:
+        return jsonify({'error': 'Profile not found'}), 404
+    fmt = request.args.get('format', 'json')
+    if fmt == 'pstats':
+        response = make_response(to_pstats(entry))
+        response.mimetype = 'application/octet-stream'
+        response.headers['Content-Disposition'] = f'attachment; filename="{profile_id}.pstats"'
+        return response
+    if fmt == 'collapsed':
+        response = make_response(to_collapsed(entry))
+        response.mimetype = 'text/plain'
+        response.headers['Content-Disposition'] = f'attachment; filename="{profile_id}.collapsed.txt"'
+        return response
+    if fmt != 'json':
+        return jsonify({'error': 'format must be json, pstats or collapsed'}), 400
+    summary = {k: v for k, v in entry.items() if k != 'stats'}
+    return jsonify({**summary, 'top_functions': top_functions(entry)}), 200
@@ -0,0 +1,194 @@
+"""Remote command routes over pooled SSH sessions.
+
+sshpool is imported on first use, keeping its subprocess/selectors setup out
+of worker start-up.
+"""
+
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from flask import Blueprint, jsonify, request
+
+import metrics
+from routes.servers import _select_servers
+from security import admin_required
+from streaming import requested_stream_mode, stream_records, stream_remote_output, stream_response
+
+bp = Blueprint('remote_exec', __name__)
+
+# Hosts one /api/servers/exec request may run on at once (its default and its ceiling)
+FANOUT_CONCURRENCY = int(os.getenv('FANOUT_CONCURRENCY', '32'))
+
+"""
+NEW: API ROUTE FOR REMOTE FILE LISTING VIA SSH
+"""
+
+@bp.route('/api/list-ldap-server-files', methods=['GET'])
+def list_ldap_server_files():
+    """
+    List files on a remote server using password-based SSH.
+    Configure credentials via env vars:
+      SSH_HOST, SSH_USER, SSH_PASSWORD (or SSH_PASS), SSH_COMMAND (optional)
+    Connections are pooled (see sshpool.py) and reused across requests.
+
+    Streaming: stream=ndjson (or Accept: application/x-ndjson) returns one
+    {"line": ...} object per output line as it arrives; stream=sse (or
+    Accept: text/event-stream) sends the same as Server-Sent Events. The
+    last record carries the exit status. max_bytes caps streamed output
+    (default SSH_STREAM_MAX_BYTES, 10 MiB). Disconnecting kills the command.
+    """
+    from sshpool import SSHConnectError, SSHError, SSHPoolBusy, SSHTimeout
+    from sshpool import pool as ssh_pool
+    LDAP_SERVER_IP = request.args.get('host') or os.getenv("SSH_HOST", "")
+    LDAP_SERVER_USER = request.args.get('user') or os.getenv("SSH_USER", "")
+    LDAP_SERVER_PASSWORD = request.args.get('password') or os.getenv("SSH_PASSWORD", os.getenv("SSH_PASS", ""))
+    command_to_run = request.args.get('cmd') or os.getenv("SSH_COMMAND", "ls -la /home")
+    # Allow overriding execution timeout (seconds)
+    try:
+        exec_timeout = float(request.args.get('timeout') or os.getenv('SSH_TIMEOUT', '25'))
+    except ValueError:
+        exec_timeout = 25.0
+
+    if not LDAP_SERVER_IP or not LDAP_SERVER_USER or not LDAP_SERVER_PASSWORD:
+        return jsonify({
+            'status': 'error',
+            'message': 'Missing SSH env vars. Require SSH_HOST, SSH_USER, SSH_PASSWORD.'
+        }), 400
+
+    stream_mode = requested_stream_mode()
+    if stream_mode:
+        try:
+            max_bytes = int(request.args.get('max_bytes') or os.getenv('SSH_STREAM_MAX_BYTES', str(10 * 1024 * 1024)))
+        except ValueError:
+            return jsonify({'status': 'error', 'message': 'max_bytes must be an integer'}), 400
+        try:
+            with metrics.outbound('ssh') as call:
+                remote = ssh_pool.stream(LDAP_SERVER_IP, LDAP_SERVER_USER, command_to_run,
+                                         password=LDAP_SERVER_PASSWORD, timeout=exec_timeout, max_bytes=max_bytes)
+                call.detach()
+        except SSHTimeout as e:
+            return jsonify({'status': 'error', 'message': str(e)}), 504
+        except SSHPoolBusy as e:
+            return jsonify({'status': 'error', 'message': str(e)}), 503
+        except SSHConnectError as e:
+            return jsonify({'status': 'error', 'message': str(e)}), 502
+        except Exception as e:
+            return jsonify({'status': 'error', 'message': str(e)}), 500
+        return stream_remote_output(remote, stream_mode, on_end=call.finish)
+
+    try:
+        # Runs on a warm pooled session; only the first call per host authenticates
+        with metrics.outbound('ssh'):
+            output = ssh_pool.run(LDAP_SERVER_IP, LDAP_SERVER_USER, command_to_run,
+                                  password=LDAP_SERVER_PASSWORD, timeout=exec_timeout)
+        return jsonify({'status': 'success', 'files': output.splitlines()})
+    except SSHTimeout as e:
+        return jsonify({'status': 'error', 'message': str(e)}), 504
+    except SSHPoolBusy as e:
+        return jsonify({'status': 'error', 'message': str(e)}), 503
+    except SSHConnectError as e:
+        return jsonify({'status': 'error', 'message': str(e)}), 502
+    except SSHError as e:
+        return jsonify({'status': 'error', 'message': str(e)}), 500
+    except Exception as e:
+        return jsonify({'status': 'error', 'message': str(e)}), 500
+
+def _exec_on_host(target, command, user, password, timeout, max_bytes, endpoint):
+    """Run one fan-out command; returns the per-host result record."""
+    from sshpool import SSHError
+    from sshpool import pool as ssh_pool
+    started = time.perf_counter()
+    result = {'id': target['id'], 'hostname': target['hostname']}
+    key = target['ssh_key'] if target['auth_method'] == 'ssh-key' else None
+    if not key and not password:
+        result.update(status='error', message='No usable credentials (ssh_key or password)')
+        return result
+    # Runs on a fan-out thread, outside the request context
+    timer = metrics.OutboundTimer('ssh', endpoint)
+    try:
+        remote = ssh_pool.stream(target['hostname'], user, command, password=None if key else password,
+                                 key=key, timeout=timeout, max_bytes=max_bytes)
+        output = [line for lines in remote.lines() for line in lines]
+        result.update(exit_code=remote.returncode, truncated=remote.truncated, output=output)
+        if remote.timed_out:
+            timer.outcome = 'timeout'
+            result.update(status='error', message=f'SSH command timed out after {timeout} seconds')
+        elif remote.returncode == 0 or remote.truncated:
+            result.update(status='success')
+        else:
+            timer.outcome = 'error'
+            result.update(status='error', message=f"Command failed on remote server: {remote.stderr}")
+    except SSHError as e:
+        timer.outcome = metrics.outcome_of(e)
+        result.update(status='error', message=str(e))
+    except Exception as e:
+        timer.outcome = metrics.outcome_of(e)
+        result.update(status='error', message=str(e))
+    timer.finish()
+    result['duration_ms'] = round((time.perf_counter() - started) * 1000, 2)
+    return result
+
+@bp.route('/api/servers/exec', methods=['POST'])
+@admin_required
+def exec_on_servers():
+    """Run one command on many servers and stream per-host results. Admin only.
+    JSON body:
+      command (required) : shell command (run via bash -lc)
+      ids (required)     : server ids to run on; there is no "all servers" default
+      state / hostname / pattern : optional filters on top of ids (see _select_servers)
+      user               : SSH user (default root)
+      password           : for root-password hosts (only a hash is stored); ssh-key hosts use their key.
+                           Never taken from the environment; hosts without a key or password fail.
+      timeout            : per-host seconds (default 25)
+      concurrency        : max hosts at once, 1..FANOUT_CONCURRENCY (default and cap 32)
+      max_bytes          : per-host output cap (default 1 MiB)
+    Results are streamed as NDJSON (or SSE with stream=sse) in completion
+    order, followed by an 'end' summary record.
+    """
+    data = request.get_json(silent=True) or {}
+    command = (data.get('command') or '').strip()
+    if not command:
+        return jsonify({'error': 'command is required'}), 400
+    ids = data.get('ids')
+    if not isinstance(ids, list) or not ids:
+        return jsonify({'error': 'ids must be a non-empty list of server ids'}), 400
+    user = data.get('user') or 'root'
+    password = data.get('password') or None
+    concurrency = data.get('concurrency', FANOUT_CONCURRENCY)
+    if isinstance(concurrency, bool) or not isinstance(concurrency, int) or concurrency < 1:
+        return jsonify({'error': 'concurrency must be a positive integer'}), 400
+    concurrency = min(concurrency, FANOUT_CONCURRENCY)
+    try:
+        timeout = float(data.get('timeout') or os.getenv('SSH_TIMEOUT', '25'))
+        max_bytes = int(data.get('max_bytes') or 1024 * 1024)
+        hosts = _select_servers(data).all()
+    except (TypeError, ValueError) as e:
+        return jsonify({'error': str(e)}), 400
+    if not hosts:
+        return jsonify({'error': 'No servers matched'}), 404
+
+    # Plain dicts only; ORM rows must not leak into the worker threads
+    targets = [{'id': h.id, 'hostname': h.hostname, 'auth_method': h.auth_method, 'ssh_key': h.ssh_key}
+               for h in hosts]
+    mode = 'sse' if request.args.get('stream') == 'sse' else 'ndjson'
+    endpoint = request.endpoint
+
+    def records():
+        executor = ThreadPoolExecutor(max_workers=min(concurrency, len(targets)), thread_name_prefix='fanout')
+        counts = {'success': 0, 'error': 0}
+        started = time.perf_counter()
+        try:
+            futures = [executor.submit(_exec_on_host, t, command, user, password, timeout, max_bytes, endpoint)
+                       for t in targets]
+            for future in as_completed(futures):
+                result = future.result()
+                counts[result['status']] += 1
+                yield [('host', result)]
+            yield [('end', {'hosts': len(targets), **counts,
+                            'duration_ms': round((time.perf_counter() - started) * 1000, 2)})]
+        finally:
+            # On client disconnect, drop queued hosts; running ones end at their timeout
+            executor.shutdown(wait=False, cancel_futures=True)
+
+    return stream_response(stream_records(records(), mode), mode)
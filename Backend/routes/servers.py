@@ -0,0 +1,506 @@
+"""Server inventory, import, refresh and state-history routes."""
+
+import base64
+import binascii
+import csv
+import datetime
+import io
+import itertools
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+from flask import Blueprint, current_app, jsonify, request
+from sqlalchemy.exc import IntegrityError
+
+import limits
+import metrics
+from extensions import db
+from models import ServerHost, ServerStateHistory
+from passwords import hasher as password_hasher
+from probe import engine as probe_engine
+
+bp = Blueprint('servers', __name__)
+
+# -------------------- Server CRUD & State Routes --------------------
+def _probe_host(host: str):
+    """Reachability check via the in-process probe engine (ICMP, TCP fallback)."""
+    with limits.slot('ping', host), metrics.outbound('ping') as call:
+        outcome = probe_engine.probe(host)
+        call.outcome = 'up' if outcome.reachable else 'down'
+    return outcome
+
+# Probes run on the engine's event loop; this small pool only writes results
+_probe_writer = ThreadPoolExecutor(max_workers=int(os.getenv('INITIAL_PROBE_WRITERS', '2')),
+                                   thread_name_prefix='initial-probe')
+# Import sweeps get their own thread so a big import never delays the first
+# result of a server created on its own
+_import_sweeper = ThreadPoolExecutor(max_workers=int(os.getenv('SERVER_IMPORT_SWEEPERS', '1')),
+                                     thread_name_prefix='import-probe')
+
+def _record_initial_probe(app, server_id: int, outcome):
+    with app.app_context():
+        try:
+            # Only settle hosts still Pending so a faster manual refresh isn't overwritten
+            ServerStateHistory.record_checks(
+                [{'server_id': server_id, 'state': 'Up' if outcome.reachable else 'Down',
+                  'latency_ms': outcome.latency_ms}], only_from='Pending')
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            import traceback
+            traceback.print_exc()
+        finally:
+            db.session.remove()
+
+def _queue_initial_probe(app, server_id: int, hostname: str):
+    future = probe_engine.submit(hostname)
+
+    def done(f):
+        try:
+            outcome = f.result()
+        except Exception as e:
+            print(f"[servers] Initial probe of {hostname} failed: {e}")
+            return
+        _probe_writer.submit(_record_initial_probe, app, server_id, outcome)
+
+    future.add_done_callback(done)
+
+IMPORT_SWEEP_CHUNK = int(os.getenv('SERVER_IMPORT_SWEEP_CHUNK', '500'))
+
+def _initial_probe_sweep(app, targets):
+    """Probe newly imported servers concurrently and settle them from Pending in bulk."""
+    with app.app_context():
+        try:
+            for start in range(0, len(targets), IMPORT_SWEEP_CHUNK):
+                chunk = targets[start:start + IMPORT_SWEEP_CHUNK]
+                outcomes = probe_engine.probe_many([hostname for _, hostname in chunk])
+                checks = [{'server_id': server_id, 'state': 'Up' if outcome.reachable else 'Down',
+                           'latency_ms': outcome.latency_ms}
+                          for (server_id, _), outcome in zip(chunk, outcomes)]
+                try:
+                    ServerStateHistory.record_checks(checks, only_from='Pending')
+                    db.session.commit()
+                except Exception:
+                    db.session.rollback()
+                    import traceback
+                    traceback.print_exc()
+        finally:
+            db.session.remove()
+
+SERVER_FIELDS = ('id', 'hostname', 'bmc_ip', 'auth_method', 'state', 'check_interval',
+                 'last_checked_at', 'last_latency_ms', 'created_at', 'updated_at')
+SERVER_PAGE_SIZE = int(os.getenv('SERVER_PAGE_SIZE', '100'))
+SERVER_PAGE_MAX = int(os.getenv('SERVER_PAGE_MAX', '1000'))
+
+def _encode_server_cursor(created_at, server_id):
+    raw = json.dumps([created_at.isoformat() if created_at else None, server_id])
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+def _decode_server_cursor(cursor):
+    try:
+        created_at, server_id = json.loads(base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)))
+        return datetime.datetime.fromisoformat(created_at), int(server_id)
+    except (binascii.Error, ValueError, TypeError):
+        raise ValueError('malformed cursor')
+
+@bp.route('/api/servers', methods=['GET'])
+def list_servers():
+    """Newest-first server inventory, one keyset page at a time.
+    Query args: limit, cursor (next_cursor from the previous page), state,
+    auth_method, hostname (prefix) and fields (comma-separated subset of
+    SERVER_FIELDS). Only the requested columns are selected."""
+    limit = request.args.get('limit', SERVER_PAGE_SIZE, type=int)
+    if limit < 1:
+        return jsonify({'error': 'limit must be positive'}), 400
+    limit = min(limit, SERVER_PAGE_MAX)
+
+    fields = [f.strip() for f in (request.args.get('fields') or '').split(',') if f.strip()] or list(SERVER_FIELDS)
+    unknown = [f for f in fields if f not in SERVER_FIELDS]
+    if unknown:
+        return jsonify({'error': f'Unknown fields: {", ".join(unknown)}'}), 400
+
+    columns = [getattr(ServerHost, f) for f in dict.fromkeys(['id', 'created_at', *fields])]
+    query = db.session.query(*columns)
+    state = request.args.get('state')
+    if state:
+        query = query.filter(ServerHost.state == state)
+    auth_method = request.args.get('auth_method')
+    if auth_method:
+        query = query.filter(ServerHost.auth_method == auth_method)
+    prefix = (request.args.get('hostname') or '').strip()
+    if prefix:
+        query = query.filter(ServerHost.hostname.startswith(prefix, autoescape=True))
+    cursor = request.args.get('cursor')
+    if cursor:
+        try:
+            created_at, server_id = _decode_server_cursor(cursor)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        query = query.filter(db.tuple_(ServerHost.created_at, ServerHost.id) < (created_at, server_id))
+
+    # One extra row tells us whether another page exists without a COUNT
+    rows = query.order_by(ServerHost.created_at.desc(), ServerHost.id.desc()).limit(limit + 1).all()
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = _encode_server_cursor(rows[-1].created_at, rows[-1].id)
+
+    servers = []
+    for row in rows:
+        record = {}
+        for f in fields:
+            value = getattr(row, f)
+            record[f] = value.isoformat() if isinstance(value, datetime.datetime) else value
+        servers.append(record)
+    return jsonify({'servers': servers, 'next_cursor': next_cursor}), 200
+
+def _parse_server_row(data):
+    """Validate one server definition. Returns ServerHost column values with the
+    plain root password under 'root_password'; raises ValueError on bad input."""
+    hostname = (data.get('hostname') or '').strip()
+    bmc_ip = (data.get('bmc_ip') or '').strip() or None
+    auth_method = data.get('auth_method')
+    ssh_key = data.get('ssh_key')
+    root_password = data.get('root_password')
+    check_interval = data.get('check_interval')
+
+    if not hostname or not auth_method:
+        raise ValueError('hostname and auth_method are required')
+    if auth_method not in ('ssh-key', 'root-password'):
+        raise ValueError('Invalid auth_method')
+    if check_interval is not None and (not isinstance(check_interval, int) or check_interval < 5):
+        raise ValueError('check_interval must be an integer of at least 5 seconds')
+    if auth_method == 'root-password' and not root_password:
+        raise ValueError('root_password required for root-password auth')
+    return {
+        'hostname': hostname,
+        'bmc_ip': bmc_ip,
+        'auth_method': auth_method,
+        'check_interval': check_interval,
+        'ssh_key': (ssh_key.strip() or None) if auth_method == 'ssh-key' and ssh_key else None,
+        'root_password': root_password if auth_method == 'root-password' else None,
+    }
+
+@bp.route('/api/servers', methods=['POST'])
+def create_server():
+    try:
+        fields = _parse_server_row(request.get_json() or {})
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    hostname = fields['hostname']
+    if ServerHost.query.filter_by(hostname=hostname).first():
+        return jsonify({'error': 'Server already exists'}), 409
+
+    root_password = fields.pop('root_password')
+    host_obj = ServerHost(**fields)
+    if root_password:
+        host_obj.root_password_hash = password_hasher.hash(root_password)
+
+    # Reachability is resolved in the background; poll GET /api/servers/<id>
+    host_obj.state = 'Pending'
+
+    db.session.add(host_obj)
+    try:
+        db.session.commit()
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': f'Database error: {str(e)}'}), 500
+    _queue_initial_probe(current_app._get_current_object(), host_obj.id, hostname)
+    current_app.extensions['health_scheduler'].reschedule(host_obj.id, soon=False)
+    return jsonify({'message': 'Server created', 'server': host_obj.to_dict()}), 201
+
+IMPORT_MAX_ROWS = int(os.getenv('SERVER_IMPORT_MAX_ROWS', '10000'))
+IMPORT_BATCH_SIZE = int(os.getenv('SERVER_IMPORT_BATCH_SIZE', '500'))
+IMPORT_CSV_FIELDS = ('hostname', 'bmc_ip', 'auth_method', 'ssh_key', 'root_password', 'check_interval')
+
+def _read_import_rows():
+    """Rows from a JSON array / {"servers": [...]} body, a text/csv body or a CSV upload ('file')."""
+    upload = request.files.get('file')
+    if upload is not None or request.mimetype == 'text/csv':
+        text_body = (upload.read() if upload is not None else request.get_data()).decode('utf-8-sig')
+        rows = []
+        for row in csv.DictReader(io.StringIO(text_body)):
+            row = {k.strip().lower(): (v or '').strip() for k, v in row.items() if k and k.strip().lower() in IMPORT_CSV_FIELDS}
+            interval = row.pop('check_interval', '')
+            if interval:
+                row['check_interval'] = int(interval) if interval.isdigit() else interval
+            rows.append(row)
+        return rows
+    data = request.get_json(silent=True)
+    if isinstance(data, dict):
+        data = data.get('servers')
+    if not isinstance(data, list):
+        raise ValueError('Expected a JSON array of servers, {"servers": [...]}, or CSV')
+    return data
+
+def _insert_server_batch(batch):
+    """Insert one batch; returns {hostname: id}. Rows that lost a race to a concurrent
+    insert are left out and reported as existing by the caller."""
+    stmt = db.insert(ServerHost).returning(ServerHost.id, ServerHost.hostname)
+    try:
+        ids = {hostname: server_id for server_id, hostname in db.session.execute(stmt, batch)}
+        db.session.commit()
+        return ids
+    except IntegrityError:
+        db.session.rollback()
+    taken = {h for h, in db.session.query(ServerHost.hostname)
+             .filter(ServerHost.hostname.in_([r['hostname'] for r in batch]))}
+    remaining = [r for r in batch if r['hostname'] not in taken]
+    if not remaining:
+        return {}
+    ids = {hostname: server_id for server_id, hostname in db.session.execute(stmt, remaining)}
+    db.session.commit()
+    return ids
+
+@bp.route('/api/servers/import', methods=['POST'])
+def import_servers():
+    """Create many servers at once from JSON or CSV (columns: hostname, bmc_ip,
+    auth_method, ssh_key, root_password, check_interval).
+    Returns one result per input row: created | exists | duplicate | invalid | error.
+    New servers start Pending and are probed by a background sweep."""
+    try:
+        rows = _read_import_rows()
+    except (ValueError, UnicodeDecodeError, csv.Error) as e:
+        return jsonify({'error': f'Could not read import: {e}'}), 400
+    if len(rows) > IMPORT_MAX_ROWS:
+        return jsonify({'error': f'At most {IMPORT_MAX_ROWS} servers per import'}), 413
+
+    results = []
+    pending = []  # (result, parsed row)
+    seen = set()
+    for index, row in enumerate(rows):
+        result = {'row': index, 'hostname': (row.get('hostname') or '').strip() if isinstance(row, dict) else None}
+        results.append(result)
+        try:
+            if not isinstance(row, dict):
+                raise ValueError('Each server must be an object')
+            fields = _parse_server_row(row)
+        except ValueError as e:
+            result.update(status='invalid', error=str(e))
+            continue
+        if fields['hostname'] in seen:
+            result['status'] = 'duplicate'
+            continue
+        seen.add(fields['hostname'])
+        pending.append((result, fields))
+
+    # One existence query per chunk instead of one per host
+    existing = set()
+    hostnames = [fields['hostname'] for _, fields in pending]
+    for start in range(0, len(hostnames), 1000):
+        existing.update(h for h, in db.session.query(ServerHost.hostname)
+                        .filter(ServerHost.hostname.in_(hostnames[start:start + 1000])))
+    to_create = []
+    for result, fields in pending:
+        if fields['hostname'] in existing:
+            result['status'] = 'exists'
+        else:
+            to_create.append((result, fields))
+
+    # Password hashing is the expensive part; spread it over the hashing pool
+    passwords = [fields['root_password'] for _, fields in to_create if fields['root_password']]
+    hashes = iter(password_hasher.hash_many(passwords))
+    values = []
+    for _, fields in to_create:
+        root_password = fields.pop('root_password')
+        values.append({**fields, 'state': 'Pending',
+                       'root_password_hash': next(hashes) if root_password else None})
+
+    created = []
+    for start in range(0, len(values), IMPORT_BATCH_SIZE):
+        batch = values[start:start + IMPORT_BATCH_SIZE]
+        batch_results = [result for result, _ in to_create[start:start + IMPORT_BATCH_SIZE]]
+        try:
+            ids = _insert_server_batch(batch)
+        except Exception as e:
+            db.session.rollback()
+            for result in batch_results:
+                result.update(status='error', error=f'Database error: {str(e)}')
+            continue
+        for result in batch_results:
+            server_id = ids.get(result['hostname'])
+            if server_id is None:
+                result['status'] = 'exists'
+            else:
+                result.update(status='created', id=server_id)
+                created.append((server_id, result['hostname']))
+
+    if created:
+        _import_sweeper.submit(_initial_probe_sweep, current_app._get_current_object(), created)
+        for server_id, _ in created:
+            current_app.extensions['health_scheduler'].reschedule(server_id, soon=False)
+
+    summary = {}
+    for result in results:
+        summary[result['status']] = summary.get(result['status'], 0) + 1
+    return jsonify({'message': f'Imported {len(created)} of {len(results)} servers',
+                    'summary': summary, 'results': results}), 200
+
+@bp.route('/api/servers/<int:server_id>', methods=['GET'])
+def get_server(server_id: int):
+    host_obj = ServerHost.query.get(server_id)
+    if not host_obj:
+        return jsonify({'error': 'Server not found'}), 404
+    return jsonify({'server': host_obj.to_dict()}), 200
+
+@bp.route('/api/servers/<int:server_id>', methods=['DELETE'])
+def delete_server(server_id: int):
+    host_obj = ServerHost.query.get(server_id)
+    if not host_obj:
+        return jsonify({'error': 'Server not found'}), 404
+    db.session.delete(host_obj)
+    db.session.commit()
+    return jsonify({'message': 'Server deleted'}), 200
+
+@bp.route('/api/servers/<int:server_id>/refresh', methods=['POST'])
+def refresh_server(server_id: int):
+    host_obj = ServerHost.query.get(server_id)
+    if not host_obj:
+        return jsonify({'error': 'Server not found'}), 404
+    outcome = _probe_host(host_obj.hostname)
+    ServerStateHistory.record_checks([{'server_id': host_obj.id, 'state': 'Up' if outcome.reachable else 'Down',
+                                       'latency_ms': outcome.latency_ms}])
+    db.session.commit()
+    return jsonify({'message': 'State refreshed', 'server': host_obj.to_dict()}), 200
+
+def _select_servers(data):
+    """Build a ServerHost query from a JSON host selector.
+      ids      : list of server ids
+      state    : only servers currently in this state (Up | Down | Pending | Unconfigured)
+      hostname : hostname prefix
+      pattern  : hostname glob, e.g. "rack1-*.lab" (* and ? wildcards)
+    Raises ValueError on malformed input.
+    """
+    ids = data.get('ids')
+    state = data.get('state')
+    prefix = (data.get('hostname') or '').strip()
+    pattern = (data.get('pattern') or '').strip()
+
+    query = ServerHost.query
+    if ids is not None:
+        if not isinstance(ids, list) or not all(isinstance(i, int) for i in ids):
+            raise ValueError('ids must be a list of integers')
+        query = query.filter(ServerHost.id.in_(ids))
+    if state:
+        query = query.filter(ServerHost.state == state)
+    if prefix:
+        query = query.filter(ServerHost.hostname.startswith(prefix, autoescape=True))
+    if pattern:
+        like = (pattern.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+                .replace('*', '%').replace('?', '_'))
+        query = query.filter(ServerHost.hostname.like(like, escape='\\'))
+    return query.order_by(ServerHost.id)
+
+@bp.route('/api/servers/refresh', methods=['POST'])
+def refresh_servers():
+    """Refresh the state of many servers at once.
+    JSON body: host selector (see _select_servers; no filters means every server).
+    Hosts are probed concurrently by the probe engine and all results (state,
+    last check, history) are written in a single commit.
+    """
+    data = request.get_json(silent=True) or {}
+    try:
+        hosts = _select_servers(data).all()
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    if not hosts:
+        return jsonify({'message': 'No servers matched', 'results': []}), 200
+    # Plain values; the commit below expires the ORM rows
+    targets = [(h.id, h.hostname) for h in hosts]
+
+    # One slot for the whole sweep; the engine bounds the probes themselves
+    with limits.slot('ping'), metrics.outbound('ping'):
+        outcomes = probe_engine.probe_many([hostname for _, hostname in targets])
+
+    checks = [{'server_id': server_id, 'state': 'Up' if outcome.reachable else 'Down',
+               'latency_ms': outcome.latency_ms}
+              for (server_id, _), outcome in zip(targets, outcomes)]
+    try:
+        previous_states = ServerStateHistory.record_checks(checks)
+        db.session.commit()
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': f'Database error: {str(e)}'}), 500
+
+    results = []
+    for (server_id, hostname), outcome, check in zip(targets, outcomes, checks):
+        results.append({
+            'id': server_id,
+            'hostname': hostname,
+            'reachable': outcome.reachable,
+            'latency_ms': outcome.latency_ms,
+            'method': outcome.method,
+            'error': outcome.error,
+            'previous_state': previous_states.get(server_id),
+            'state': check['state'],
+        })
+    return jsonify({'message': 'States refreshed', 'results': results}), 200
+
+def _uptime_pct(server_id, since, now):
+    """Percent of [since, now] spent Up, from every transition in the window rather
+    than the rows one history page shows. Coverage starts at `since` when an
+    earlier row gives the state in force then, else at the first row in the window."""
+    History = ServerStateHistory
+    before = (db.session.query(History.state)
+              .filter(History.server_id == server_id, History.checked_at < since)
+              .order_by(History.checked_at.desc(), History.id.desc())
+              .limit(1).scalar())
+    if before is not None:
+        cursor, current = since, before
+    else:
+        first = (db.session.query(History.checked_at, History.state)
+                 .filter(History.server_id == server_id, History.checked_at >= since)
+                 .order_by(History.checked_at, History.id)
+                 .first())
+        if first is None:
+            return None
+        cursor, current = first
+    # Samples never change the state, so transitions alone give the timeline
+    transitions = (db.session.query(History.checked_at, History.state)
+                   .filter(History.server_id == server_id, History.checked_at >= cursor,
+                           History.transition.is_(True))
+                   .order_by(History.checked_at, History.id)
+                   .yield_per(1000))
+    up = total = 0.0
+    for checked_at, state in itertools.chain(transitions, [(now, None)]):
+        span = (checked_at - cursor).total_seconds()
+        total += span
+        if current == 'Up':
+            up += span
+        cursor, current = checked_at, state
+    return round(up / total * 100, 2) if total > 0 else None
+
+@bp.route('/api/servers/<int:server_id>/history', methods=['GET'])
+def server_history(server_id: int):
+    """State transitions and latency samples for one server.
+    Query params:
+      hours (optional) : window size (default 24, max 720)
+      limit (optional) : max rows returned, newest first (default 500, max 5000)
+    The response also carries uptime_pct for the whole window, computed from
+    its transitions (time spent Up / time covered by history) regardless of limit.
+    """
+    host_obj = ServerHost.query.get(server_id)
+    if not host_obj:
+        return jsonify({'error': 'Server not found'}), 404
+    try:
+        hours = min(max(float(request.args.get('hours', 24)), 0.1), 720)
+        limit = min(max(int(request.args.get('limit', 500)), 1), 5000)
+    except ValueError:
+        return jsonify({'error': 'hours and limit must be numeric'}), 400
+
+    now = datetime.datetime.utcnow()
+    since = now - datetime.timedelta(hours=hours)
+    rows = (ServerStateHistory.query
+            .filter(ServerStateHistory.server_id == server_id,
+                    ServerStateHistory.checked_at >= since)
+            .order_by(ServerStateHistory.checked_at.desc())
+            .limit(limit)
+            .all())
+    uptime_pct = _uptime_pct(server_id, since, now)
+
+    return jsonify({
+        'server': host_obj.to_dict(),
+        'uptime_pct': uptime_pct,
+        'history': [r.to_dict() for r in rows],
+    }), 200
@@ -0,0 +1,248 @@
+"""
+Background health scheduler for ServerHost records.
+
+Probes every server on its own interval so GET /api/servers is a pure DB
+read. Each host gets the next check at interval +/- jitter; hosts that are
+Down back off exponentially up to HEALTH_MAX_BACKOFF. One batch of at most
+HEALTH_MAX_CONCURRENT due hosts is probed per tick through the probe engine
+and written in a single commit.
+
+History is kept compact: a row is written on every state transition, plus a
+latency sample at most every HEALTH_SAMPLE_INTERVAL seconds per host. Results
+are written through ServerStateHistory.record_checks, the same path manual
+refreshes use; a state change found on reload that has no history row yet
+(e.g. a direct DB edit) is recorded as a transition. Rows older than
+HEALTH_HISTORY_DAYS are pruned.
+
+With several gunicorn workers only one runs the scheduler: on PostgreSQL the
+leader holds a session-level advisory lock; other workers retry periodically
+and take over if the leader goes away.
+
+Config via env vars:
+  HEALTH_SCHEDULER        1 to run (default), 0 to disable
+  HEALTH_INTERVAL         default seconds between checks (default 60)
+  HEALTH_JITTER           jitter fraction of the interval (default 0.1)
+  HEALTH_MAX_BACKOFF      cap in seconds for Down hosts (default 900)
+  HEALTH_MAX_CONCURRENT   max hosts probed per tick (default 64)
+  HEALTH_SAMPLE_INTERVAL  seconds between latency samples (default 300)
+  HEALTH_HISTORY_DAYS     history retention (default 30)
+"""
+
+import datetime
+import os
+import random
+import threading
+import time
+import traceback
+
+from sqlalchemy import text
+
+# Arbitrary constant identifying the scheduler's advisory lock
+ADVISORY_LOCK_KEY = 0x48454C54  # 'HELT'
+
+
+class _HostSchedule:
+    __slots__ = ('hostname', 'state', 'interval', 'next_due', 'failures', 'last_sample')
+
+    def __init__(self, hostname, state, interval, next_due):
+        self.hostname = hostname
+        self.state = state
+        self.interval = interval
+        self.next_due = next_due
+        self.failures = 0
+        self.last_sample = 0.0
+
+
+class HealthScheduler:
+    def __init__(self, app, db, host_model, history_model, engine):
+        self.app = app
+        self.db = db
+        self.host_model = host_model
+        self.history_model = history_model
+        self.engine = engine
+        self.enabled = os.getenv('HEALTH_SCHEDULER', '1') == '1'
+        self.interval = float(os.getenv('HEALTH_INTERVAL', '60'))
+        self.jitter = float(os.getenv('HEALTH_JITTER', '0.1'))
+        self.max_backoff = float(os.getenv('HEALTH_MAX_BACKOFF', '900'))
+        self.max_concurrent = int(os.getenv('HEALTH_MAX_CONCURRENT', '64'))
+        self.sample_interval = float(os.getenv('HEALTH_SAMPLE_INTERVAL', '300'))
+        self.history_days = float(os.getenv('HEALTH_HISTORY_DAYS', '30'))
+        self.tick_seconds = 1.0
+        self.reload_seconds = 30.0
+        self.leader_retry_seconds = 30.0
+        self._hosts = {}
+        self._last_reload = 0.0
+        self._last_prune = 0.0
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._pid = None
+        self._lock_conn = None
+
+    # --- lifecycle ---
+    def start(self):
+        """Start the scheduler thread once per process (safe to call often)."""
+        if not self.enabled or self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            self._hosts = {}
+            self._lock_conn = None
+            self._stop.clear()
+            threading.Thread(target=self._run, name='health-scheduler', daemon=True).start()
+
+    def stop(self):
+        self._stop.set()
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                if self._acquire_leadership():
+                    break
+            except Exception as e:
+                print(f"[health] Leader election failed: {e}")
+            self._stop.wait(self.leader_retry_seconds)
+
+        while not self._stop.is_set():
+            try:
+                self.tick()
+            except Exception:
+                traceback.print_exc()
+            self._stop.wait(self.tick_seconds)
+
+    def _acquire_leadership(self):
+        with self.app.app_context():
+            if self.db.engine.dialect.name != 'postgresql':
+                return True
+            conn = self.db.engine.connect()
+            got = conn.execute(text('SELECT pg_try_advisory_lock(:k)'), {'k': ADVISORY_LOCK_KEY}).scalar()
+            if not got:
+                conn.close()
+                return False
+            conn.commit()
+            # Held for the life of the process; closing the connection releases it
+            self._lock_conn = conn
+            print(f"[health] Scheduler running in pid {os.getpid()}")
+            return True
+
+    # --- scheduling ---
+    def _next_delay(self, entry):
+        delay = entry.interval
+        if entry.state == 'Down' and entry.failures:
+            delay = min(entry.interval * (2 ** min(entry.failures, 16)), max(self.max_backoff, entry.interval))
+        return delay * (1 + random.uniform(-self.jitter, self.jitter))
+
+    def reschedule(self, server_id, soon=True):
+        """Ask for a host to be checked on the next tick (or reloaded if unknown)."""
+        entry = self._hosts.get(server_id)
+        if entry is None:
+            self._last_reload = 0.0
+        elif soon:
+            entry.next_due = 0.0
+
+    def _reload(self, now):
+        Host = self.host_model
+        rows = self.db.session.query(Host.id, Host.hostname, Host.state, Host.check_interval).all()
+        hosts = {}
+        outside = []
+        for server_id, hostname, state, check_interval in rows:
+            interval = float(check_interval or self.interval)
+            entry = self._hosts.get(server_id)
+            if entry is None:
+                # Spread first checks across one interval instead of a thundering herd
+                entry = _HostSchedule(hostname, state, interval, now + random.uniform(0, interval))
+            else:
+                entry.hostname = hostname
+                entry.interval = interval
+                if entry.state != state:
+                    # Changed outside the scheduler (manual refresh, initial probe, direct edit)
+                    entry.state = state
+                    entry.failures = 0
+                    outside.append((server_id, state))
+            hosts[server_id] = entry
+        self._hosts = hosts
+        self._last_reload = now
+        if outside:
+            self._record_outside_changes(outside)
+
+    def _record_outside_changes(self, changes):
+        """Add a transition row for state changes that skipped record_checks, so
+        history and uptime stay complete. Changes already recorded are left alone."""
+        History = self.history_model
+        # The real time of the change is unknown; it is recorded as seen now
+        seen_at = datetime.datetime.utcnow()
+        ids = [server_id for server_id, _ in changes]
+        latest = {}
+        for start in range(0, len(ids), 1000):
+            # Newest history row per server, for the whole chunk in one query
+            ranked = (self.db.session.query(
+                          History.server_id, History.state,
+                          self.db.func.row_number().over(
+                              partition_by=History.server_id,
+                              order_by=(History.checked_at.desc(), History.id.desc())).label('rank'))
+                      .filter(History.server_id.in_(ids[start:start + 1000]))
+                      .subquery())
+            latest.update(self.db.session.query(ranked.c.server_id, ranked.c.state).filter(ranked.c.rank == 1))
+        rows = [{'server_id': server_id, 'checked_at': seen_at, 'state': state,
+                 'latency_ms': None, 'transition': True}
+                for server_id, state in changes if latest.get(server_id) != state]
+        if rows:
+            self.db.session.execute(History.__table__.insert(), rows)
+            self.db.session.commit()
+
+    def tick(self, now=None):
+        """Probe every due host (up to the concurrency cap). Returns hosts probed."""
+        now = time.monotonic() if now is None else now
+        with self.app.app_context():
+            try:
+                if now - self._last_reload >= self.reload_seconds:
+                    self._reload(now)
+                due = [sid for sid, e in self._hosts.items() if e.next_due <= now]
+                if not due:
+                    return 0
+                due.sort(key=lambda sid: self._hosts[sid].next_due)
+                due = due[:self.max_concurrent]
+                outcomes = self.engine.probe_many([self._hosts[sid].hostname for sid in due])
+                self._persist(due, outcomes, now)
+                if now - self._last_prune >= 3600:
+                    self._prune()
+                    self._last_prune = now
+                return len(due)
+            finally:
+                self.db.session.remove()
+
+    def _persist(self, due, outcomes, now):
+        checks = []
+        for server_id, outcome in zip(due, outcomes):
+            entry = self._hosts[server_id]
+            checks.append({
+                'server_id': server_id,
+                'state': 'Up' if outcome.reachable else 'Down',
+                'latency_ms': outcome.latency_ms,
+                'sample': now - entry.last_sample >= self.sample_interval,
+            })
+        try:
+            # Servers deleted since the last reload are skipped
+            previous_states = self.history_model.record_checks(checks)
+            self.db.session.commit()
+        except Exception:
+            self.db.session.rollback()
+            self._last_reload = 0.0
+            raise
+
+        for check in checks:
+            entry = self._hosts[check['server_id']]
+            if check['server_id'] not in previous_states:
+                self._last_reload = 0.0
+            elif check['sample'] or previous_states[check['server_id']] != check['state']:
+                entry.last_sample = now
+            entry.failures = 0 if check['state'] == 'Up' else entry.failures + 1
+            entry.state = check['state']
+            entry.next_due = now + self._next_delay(entry)
+
+    def _prune(self):
+        cutoff = datetime.datetime.utcnow() - datetime.timedelta(days=self.history_days)
+        History = self.history_model
+        self.db.session.query(History).filter(History.checked_at < cutoff).delete(synchronize_session=False)
+        self.db.session.commit()
@@ -0,0 +1,182 @@
+"""
+Token issuing and verification, cached user claims and the route decorators
+(token_required, admin_required) shared by the blueprints.
+"""
+
+import datetime
+import functools
+import os
+import tempfile
+
+import jwt
+from flask import g, jsonify, request
+from sqlalchemy.orm import Session as OrmSession
+
+from cache import TTLCache
+from extensions import db
+from models import User
+
+# JWT signing key
+SECRET_KEY = os.getenv('JWT_SECRET_KEY', 'change-me-jwt-in-prod')
+
+
+def generate_token(user):
+    payload = {
+        'user_id': user.id,
+        'exp': datetime.datetime.now(datetime.UTC) + datetime.timedelta(hours=12)
+    }
+    return jwt.encode(payload, SECRET_KEY, algorithm='HS256')
+
+# --- Authentication ---
+# Verified tokens map to a user id until they expire; user claims (group,
+# 2FA flags) are cached per id and dropped whenever the User row changes.
+_token_cache = TTLCache(ttl=float(os.getenv('AUTH_CACHE_TTL', '300')), sizer=None,
+                        max_entries=int(os.getenv('AUTH_CACHE_MAX_ENTRIES', '10000')), name='token-cache')
+claims_cache = TTLCache(ttl=float(os.getenv('AUTH_CACHE_TTL', '300')), sizer=None,
+                         max_entries=int(os.getenv('AUTH_CACHE_MAX_ENTRIES', '10000')),
+                         generation_file=os.getenv('AUTH_CACHE_GENERATION_FILE',
+                                                   os.path.join(tempfile.gettempdir(), 'auth-cache.generation')),
+                         name='claims-cache')
+
+# Lower-cased email/username -> user id, so repeat logins skip the identity query
+_identity_cache = TTLCache(ttl=float(os.getenv('AUTH_CACHE_TTL', '300')), sizer=None,
+                           max_entries=int(os.getenv('AUTH_CACHE_MAX_ENTRIES', '10000')),
+                           generation_file=os.getenv('AUTH_IDENTITY_GENERATION_FILE',
+                                                     os.path.join(tempfile.gettempdir(), 'auth-identity.generation')),
+                           name='identity-cache')
+
+class AuthError(Exception):
+    def __init__(self, message, status=401):
+        super().__init__(message)
+        self.status = status
+
+def user_claims(user):
+    return {
+        'user_id': user.id,
+        'email': user.email,
+        'username': user.username,
+        'user_group': user.user_group,
+        'is_2fa_enabled': bool(user.is_2fa_enabled),
+        '2fa_completed': bool(user._2fa_completed),
+    }
+
+def find_user(identifier):
+    """Resolve an email or username (case-insensitive) to a User, or None.
+    An email match wins over another account's username."""
+    key = (identifier or '').strip().lower()
+    if not key:
+        return None
+    user_id = _identity_cache.get(key)
+    if user_id is not None:
+        user = db.session.get(User, user_id)
+        if user is not None and key in ((user.email or '').lower(), (user.username or '').lower()):
+            return user
+    email_match = db.func.lower(User.email) == key
+    user = (User.query
+            .filter(db.or_(email_match, db.func.lower(User.username) == key))
+            .order_by(db.case((email_match, 0), else_=1), User.id)
+            .first())
+    if user is not None:
+        _identity_cache.set(key, user.id)
+    return user
+
+def verify_token(token):
+    """Return the user id for a valid token, decoding each distinct token once."""
+    user_id = _token_cache.get(token)
+    if user_id is not None:
+        return user_id
+    try:
+        decoded = jwt.decode(token, SECRET_KEY, algorithms=['HS256'])
+    except jwt.ExpiredSignatureError:
+        raise AuthError('Token has expired!')
+    except jwt.InvalidTokenError:
+        raise AuthError('Invalid token!')
+    # Never keep a token cached past its own expiry
+    remaining = decoded['exp'] - datetime.datetime.now(datetime.UTC).timestamp() if 'exp' in decoded else None
+    if remaining is None or remaining > 0:
+        ttl = _token_cache.ttl if remaining is None else min(_token_cache.ttl, remaining)
+        _token_cache.set(token, decoded['user_id'], ttl=ttl)
+    return decoded['user_id']
+
+def _load_claims(user_id):
+    user = db.session.get(User, user_id)
+    return user_claims(user) if user else None
+
+def authenticate():
+    """Resolve the request's bearer token to user claims (once per request)."""
+    if 'current_user' in g:
+        return g.current_user
+    token = None
+    auth_header = request.headers.get('Authorization')
+    if auth_header and auth_header.startswith('Bearer '):
+        token = auth_header.split(" ")[1]
+    if not token:
+        raise AuthError('Token is missing!')
+
+    user_id = verify_token(token)
+    claims, _status = claims_cache.get_or_load(user_id, lambda: _load_claims(user_id))
+    if claims is None:
+        claims_cache.discard(user_id)
+        raise AuthError('User not found')
+    g.current_user = claims
+    return claims
+
+def token_required(f):
+    """Reject requests without a valid bearer token; claims land in g.current_user."""
+    @functools.wraps(f)
+    def wrapper(*args, **kwargs):
+        try:
+            authenticate()
+        except AuthError as e:
+            return jsonify({'error': str(e)}), e.status
+        return f(*args, **kwargs)
+    return wrapper
+
+def admin_required(f):
+    @functools.wraps(f)
+    @token_required
+    def wrapper(*args, **kwargs):
+        if g.current_user['user_group'] != 'admin':
+            return jsonify({'error': 'Admin access required'}), 403
+        return f(*args, **kwargs)
+    return wrapper
+
+# Columns that feed user_claims() and find_user(); a password rehash leaves the caches alone
+_CLAIM_ATTRS = ('email', 'username', 'user_group', 'is_2fa_enabled', '_2fa_completed')
+_IDENTITY_ATTRS = ('email', 'username')
+
+def _note_user_change(target, identities):
+    # Dropped here at flush, then in every worker after commit, so a read in
+    # between can't leave old claims cached anywhere
+    claims_cache.discard(target.id)
+    for key in identities:
+        _identity_cache.discard(key)
+    session = db.object_session(target)
+    if session is not None:
+        session.info.setdefault('changed_user_ids', set()).add(target.id)
+        session.info.setdefault('changed_identities', set()).update(identities)
+
+@db.event.listens_for(User, 'after_update')
+def _user_updated(_mapper, _connection, target):
+    state = db.inspect(target)
+    if not any(state.attrs[attr].history.has_changes() for attr in _CLAIM_ATTRS):
+        return
+    identities = set()
+    for attr in _IDENTITY_ATTRS:
+        history = state.attrs[attr].history
+        if history.has_changes():
+            identities.update(value.lower() for value in (*history.deleted, *history.added) if value)
+    _note_user_change(target, identities)
+
+@db.event.listens_for(User, 'after_delete')
+def _user_deleted(_mapper, _connection, target):
+    _note_user_change(target, {value.lower() for value in (target.email, target.username) if value})
+
+@db.event.listens_for(OrmSession, 'after_commit')
+def _invalidate_committed_users(session):
+    user_ids = session.info.pop('changed_user_ids', ())
+    identities = session.info.pop('changed_identities', ())
+    if user_ids:
+        claims_cache.invalidate_keys(sorted(user_ids))
+    if identities:
+        _identity_cache.invalidate_keys(sorted(identities))
@@ -0,0 +1,356 @@
+"""
+Pooled SSH sessions for remote command execution.
+
+Each (host, port, user, credential) gets one long-lived OpenSSH master
+connection (ControlMaster). Commands run as extra channels multiplexed over
+that master, so only the first command pays for TCP setup, key exchange and
+authentication. Masters are closed after SSH_POOL_IDLE_TIMEOUT seconds
+without use, and at most SSH_POOL_MAX_SESSIONS commands run per host at once.
+Sessions also count against the worker-wide SSH limit in limits.py.
+
+Everything goes through the ssh/sshpass binaries (SSH_BINARY, SSHPASS_BINARY)
+with configurable port and extra options (SSH_EXTRA_OPTIONS). That lets it
+run against a local sshd stand-in.
+
+Config via env vars:
+  SSH_POOL_IDLE_TIMEOUT   seconds an unused master is kept (default 300)
+  SSH_POOL_MAX_SESSIONS   concurrent commands per host (default 8; sshd's
+                          MaxSessions defaults to 10)
+  SSH_POOL_WAIT           seconds to wait for a free session (default 10)
+  SSH_CONNECT_TIMEOUT     seconds for the initial connection (default 8)
+  SSH_POOL_DIR            where control sockets live (default: temp dir)
+"""
+
+import atexit
+import contextlib
+import hashlib
+import os
+import selectors
+import shlex
+import shutil
+import subprocess
+import tempfile
+import threading
+import time
+
+from limits import DependencyBusy, limiters
+
+ssh_limiter = limiters['ssh']
+
+
+class SSHError(Exception):
+    def __init__(self, message, returncode=None, stderr=''):
+        super().__init__(message)
+        self.returncode = returncode
+        self.stderr = stderr
+
+
+class SSHConnectError(SSHError):
+    """The master connection could not be established (network or auth)."""
+
+
+class SSHTimeout(SSHError):
+    pass
+
+
+class SSHPoolBusy(SSHError):
+    """No free session for the host within SSH_POOL_WAIT."""
+
+
+class RemoteStream:
+    """A remote command whose output is read incrementally.
+
+    Iterate lines() to receive stdout lines as the remote side produces them.
+    Reading is pull-based: nothing is read from the pipe until the consumer
+    asks for more, so a slow client backs pressure up to the remote command.
+    After iteration, returncode / truncated / timed_out / stderr describe how
+    it ended. close() kills the command and frees the session; it runs
+    automatically when the consumer stops early (e.g. client disconnect).
+    """
+
+    def __init__(self, stack, proc, timeout, max_bytes):
+        self._stack = stack
+        self.proc = proc
+        self.deadline = time.monotonic() + timeout
+        self.timeout = timeout
+        self.max_bytes = max_bytes
+        self.bytes_read = 0
+        self.returncode = None
+        self.truncated = False
+        self.timed_out = False
+        self.stderr = ''
+        self._closed = False
+
+    def lines(self, chunk_size=65536):
+        """Yield lists of decoded lines, one list per pipe read."""
+        sel = selectors.DefaultSelector()
+        sel.register(self.proc.stdout, selectors.EVENT_READ)
+        sel.register(self.proc.stderr, selectors.EVENT_READ)
+        pending = b''
+        stderr_tail = b''
+        try:
+            open_pipes = 2
+            while open_pipes:
+                remaining = self.deadline - time.monotonic()
+                if remaining <= 0:
+                    self.timed_out = True
+                    break
+                for key, _ in sel.select(timeout=min(remaining, 1.0)):
+                    data = os.read(key.fd, chunk_size)
+                    if not data:
+                        sel.unregister(key.fileobj)
+                        open_pipes -= 1
+                        continue
+                    if key.fileobj is self.proc.stderr:
+                        stderr_tail = (stderr_tail + data)[-4096:]
+                        continue
+                    if self.max_bytes and self.bytes_read + len(data) > self.max_bytes:
+                        data = data[:max(self.max_bytes - self.bytes_read, 0)]
+                        self.truncated = True
+                    self.bytes_read += len(data)
+                    pending += data
+                    *complete, pending = pending.split(b'\n')
+                    if complete:
+                        yield [line.decode('utf-8', 'replace') for line in complete]
+                    if self.truncated:
+                        break
+                if self.truncated:
+                    break
+            if pending and not self.timed_out:
+                yield [pending.decode('utf-8', 'replace')]
+        finally:
+            sel.close()
+            self.stderr = stderr_tail.decode('utf-8', 'replace').strip()
+            self.close()
+
+    def close(self):
+        if self._closed:
+            return
+        self._closed = True
+        if self.proc.poll() is None:
+            self.proc.kill()
+        self.returncode = self.proc.wait()
+        self.proc.stdout.close()
+        self.proc.stderr.close()
+        self._stack.close()
+
+
+class _Master:
+    def __init__(self, ctl_path, key_file=None):
+        self.ctl_path = ctl_path
+        self.key_file = key_file
+        self.proc = None
+        self.last_used = time.monotonic()
+        self.active = 0
+        self.lock = threading.Lock()
+
+    def alive(self):
+        return self.proc is not None and self.proc.poll() is None and os.path.exists(self.ctl_path)
+
+
+class SSHPool:
+    def __init__(self):
+        self.ssh_binary = os.getenv('SSH_BINARY', 'ssh')
+        self.sshpass_binary = os.getenv('SSHPASS_BINARY', 'sshpass')
+        self.idle_timeout = float(os.getenv('SSH_POOL_IDLE_TIMEOUT', '300'))
+        self.max_sessions = int(os.getenv('SSH_POOL_MAX_SESSIONS', '8'))
+        self.wait_timeout = float(os.getenv('SSH_POOL_WAIT', '10'))
+        self.connect_timeout = int(os.getenv('SSH_CONNECT_TIMEOUT', '8'))
+        self.base_dir = os.getenv('SSH_POOL_DIR') or tempfile.gettempdir()
+        self.extra_options = shlex.split(os.getenv('SSH_EXTRA_OPTIONS', ''))
+        self._lock = threading.Lock()
+        self._pid = None
+        self._dir = None
+        self._masters = {}
+        self._host_slots = {}
+
+    # --- per-process state ---
+    def _state(self):
+        # Masters belong to the process that spawned them; a forked worker starts fresh
+        if self._pid != os.getpid():
+            with self._lock:
+                if self._pid != os.getpid():
+                    self._pid = os.getpid()
+                    self._masters = {}
+                    self._host_slots = {}
+                    self._dir = tempfile.mkdtemp(prefix=f'sshpool-{self._pid}-', dir=self.base_dir)
+                    os.chmod(self._dir, 0o700)
+                    threading.Thread(target=self._reap_loop, name='ssh-pool-reaper', daemon=True).start()
+        return self._masters
+
+    @staticmethod
+    def _pool_key(host, port, user, password, key):
+        secret = hashlib.sha256((password or '').encode() + b'\0' + (key or '').encode()).hexdigest()
+        return (host, int(port), user, secret)
+
+    def _base_options(self, port, password, key_file):
+        opts = [
+            '-p', str(port),
+            '-o', 'StrictHostKeyChecking=no',
+            '-o', 'UserKnownHostsFile=/dev/null',
+            '-o', 'LogLevel=ERROR',
+            '-o', f'ConnectTimeout={self.connect_timeout}',
+            '-o', 'ServerAliveInterval=30',
+            '-o', 'ServerAliveCountMax=3',
+        ]
+        if password:
+            opts += [
+                '-o', 'PreferredAuthentications=password',
+                '-o', 'PubkeyAuthentication=no',
+                '-o', 'NumberOfPasswordPrompts=1',
+            ]
+        elif key_file:
+            opts += ['-i', key_file, '-o', 'IdentitiesOnly=yes', '-o', 'BatchMode=yes']
+        return opts + self.extra_options
+
+    # --- master lifecycle ---
+    def _start_master(self, master, host, port, user, password, key):
+        if key and not master.key_file:
+            fd, master.key_file = tempfile.mkstemp(dir=self._dir, suffix='.key')
+            with os.fdopen(fd, 'w') as f:
+                f.write(key.strip() + '\n')
+        with contextlib.suppress(FileNotFoundError):
+            os.unlink(master.ctl_path)
+
+        argv = [self.ssh_binary, '-M', '-N', '-S', master.ctl_path,
+                *self._base_options(port, password, master.key_file), f'{user}@{host}']
+        env = None
+        if password:
+            # -e reads the password from SSHPASS, keeping it out of the process list
+            argv = [self.sshpass_binary, '-e'] + argv
+            env = dict(os.environ, SSHPASS=password)
+        proc = subprocess.Popen(argv, stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL,
+                                stderr=subprocess.PIPE, text=True, env=env, start_new_session=True)
+
+        deadline = time.monotonic() + self.connect_timeout + 5
+        while time.monotonic() < deadline:
+            if os.path.exists(master.ctl_path):
+                master.proc = proc
+                return
+            if proc.poll() is not None:
+                stderr = (proc.stderr.read() or '').strip()
+                raise SSHConnectError(f'SSH connection to {host} failed: {stderr or "exit " + str(proc.returncode)}',
+                                      returncode=proc.returncode, stderr=stderr)
+            time.sleep(0.02)
+        proc.kill()
+        proc.wait()
+        raise SSHTimeout(f'SSH connection to {host} timed out after {self.connect_timeout} seconds')
+
+    def _close_master(self, master):
+        if master.proc is not None and master.proc.poll() is None:
+            master.proc.terminate()
+            try:
+                master.proc.wait(timeout=5)
+            except subprocess.TimeoutExpired:
+                master.proc.kill()
+                master.proc.wait()
+        master.proc = None
+        for path in (master.ctl_path, master.key_file):
+            if path:
+                with contextlib.suppress(FileNotFoundError):
+                    os.unlink(path)
+        master.key_file = None
+
+    def _reap_loop(self):
+        pid = os.getpid()
+        while self._pid == pid:
+            time.sleep(min(30.0, max(self.idle_timeout / 2, 1.0)))
+            self.reap_idle()
+
+    def reap_idle(self):
+        """Close masters that have been unused for longer than the idle timeout."""
+        now = time.monotonic()
+        with self._lock:
+            masters = list(self._masters.values())
+        for master in masters:
+            with master.lock:
+                # Entries stay in the map; the next session() restarts the master
+                if master.proc is not None and master.active == 0 and \
+                        (now - master.last_used >= self.idle_timeout or not master.alive()):
+                    self._close_master(master)
+
+    def close_all(self):
+        if self._pid != os.getpid():
+            return
+        with self._lock:
+            masters, self._masters = list(self._masters.values()), {}
+        for master in masters:
+            with master.lock:
+                self._close_master(master)
+        if self._dir:
+            shutil.rmtree(self._dir, ignore_errors=True)
+
+    # --- sessions ---
+    @contextlib.contextmanager
+    def session(self, host, user, password=None, key=None, port=22):
+        """Reserve a session slot on a warm master; yields ssh argv prefix for one command."""
+        masters = self._state()
+        pool_key = self._pool_key(host, port, user, password, key)
+        with self._lock:
+            slots = self._host_slots.setdefault((host, int(port)), threading.BoundedSemaphore(self.max_sessions))
+            master = masters.get(pool_key)
+            if master is None:
+                name = hashlib.sha1(repr(pool_key).encode()).hexdigest()[:16]
+                master = masters[pool_key] = _Master(os.path.join(self._dir, name + '.sock'))
+        try:
+            ssh_limiter.acquire(host)
+        except DependencyBusy as e:
+            raise SSHPoolBusy(str(e))
+        if not slots.acquire(timeout=self.wait_timeout):
+            ssh_limiter.release(host)
+            raise SSHPoolBusy(f'All {self.max_sessions} SSH sessions to {host} are busy')
+        try:
+            with master.lock:
+                if not master.alive():
+                    self._close_master(master)
+                    self._start_master(master, host, port, user, password, key)
+                master.active += 1
+            try:
+                yield [self.ssh_binary, '-S', master.ctl_path, '-o', 'ControlMaster=no', '-o', 'BatchMode=yes',
+                       *self._base_options(port, None, None), f'{user}@{host}']
+            finally:
+                with master.lock:
+                    master.active -= 1
+                    master.last_used = time.monotonic()
+        finally:
+            slots.release()
+            ssh_limiter.release(host)
+
+    def run(self, host, user, command, password=None, key=None, port=22, timeout=25.0):
+        """Run a shell command on a pooled session; returns stdout text.
+
+        Raises SSHTimeout, SSHPoolBusy, SSHConnectError, or SSHError when the
+        remote command exits non-zero.
+        """
+        remote = f'bash -lc {shlex.quote(command)}'
+        with self.session(host, user, password=password, key=key, port=port) as argv:
+            try:
+                result = subprocess.run(argv + [remote], capture_output=True, text=True,
+                                        stdin=subprocess.DEVNULL, timeout=timeout)
+            except subprocess.TimeoutExpired:
+                raise SSHTimeout(f'SSH command timed out after {timeout} seconds')
+        if result.returncode != 0:
+            stderr = (result.stderr or '').strip()
+            raise SSHError(f'Command failed on remote server: {stderr}', returncode=result.returncode, stderr=stderr)
+        return result.stdout
+
+    def stream(self, host, user, command, password=None, key=None, port=22, timeout=25.0, max_bytes=None):
+        """Start a command on a pooled session and return a RemoteStream.
+
+        Connection problems raise here, before any output is produced, so
+        callers can still answer with a normal error response.
+        """
+        remote = f'bash -lc {shlex.quote(command)}'
+        stack = contextlib.ExitStack()
+        try:
+            argv = stack.enter_context(self.session(host, user, password=password, key=key, port=port))
+            proc = subprocess.Popen(argv + [remote], stdin=subprocess.DEVNULL,
+                                    stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        except BaseException:
+            stack.close()
+            raise
+        return RemoteStream(stack, proc, timeout, max_bytes)
+
+
+pool = SSHPool()
+atexit.register(pool.close_all)
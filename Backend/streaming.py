@@ -0,0 +1,67 @@
+"""Chunked NDJSON / Server-Sent Events responses shared by the streaming routes."""
+
+import json
+
+from flask import current_app, request
+
+
+def requested_stream_mode():
+    """'ndjson' or 'sse' when the client asked for a streamed response, else None."""
+    mode = request.args.get('stream')
+    if mode in ('ndjson', 'sse'):
+        return mode
+    accept = request.headers.get('Accept', '')
+    if 'text/event-stream' in accept:
+        return 'sse'
+    if 'application/x-ndjson' in accept:
+        return 'ndjson'
+    return None
+
+def stream_records(records, mode):
+    """Wrap (event, payload) pairs as NDJSON lines or SSE frames, one chunk per batch."""
+    def frame(event, payload):
+        body = json.dumps(payload)
+        if mode == 'sse':
+            return f"event: {event}\ndata: {body}\n\n"
+        return body + "\n"
+
+    for batch in records:
+        yield ''.join(frame(event, payload) for event, payload in batch)
+
+def stream_response(chunks, mode):
+    mimetype = 'text/event-stream' if mode == 'sse' else 'application/x-ndjson'
+    response = current_app.response_class(chunks, mimetype=mimetype)
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no'  # don't let a reverse proxy buffer it
+    return response
+
+def stream_remote_output(remote, mode, on_end=None):
+    """on_end(outcome) runs once the stream is over: 'ok', 'error', 'timeout' or 'cancelled'."""
+    def records():
+        outcome = 'cancelled'
+        try:
+            # The WSGI server closes this generator when the client goes away;
+            # lines() then kills the remote command in its finally block
+            for lines in remote.lines():
+                yield [('line', {'line': line}) for line in lines]
+            end = {
+                # Truncation kills the command on purpose; that alone isn't a failure
+                'status': 'success' if (remote.returncode == 0 or remote.truncated) and not remote.timed_out else 'error',
+                'exit_code': remote.returncode,
+                'truncated': remote.truncated,
+                'bytes': remote.bytes_read,
+            }
+            if remote.timed_out:
+                end['message'] = f'SSH command timed out after {remote.timeout} seconds'
+            elif remote.returncode and not remote.truncated:
+                end['message'] = f"Command failed on remote server: {remote.stderr}"
+            outcome = 'timeout' if remote.timed_out else 'ok' if end['status'] == 'success' else 'error'
+            yield [('end', end)]
+        except Exception:
+            outcome = 'error'
+            raise
+        finally:
+            if on_end is not None:
+                on_end(outcome)
+
+    return stream_response(stream_records(records(), mode), mode)
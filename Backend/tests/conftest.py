@@ -0,0 +1,89 @@
+"""
+Shared fixtures. The app runs against a throwaway SQLite database built by
+migrations.py; every test starts with empty tables and empty auth caches.
+Run from Backend/:  python -m pytest -q
+"""
+
+import os
+import sys
+import tempfile
+
+import pytest
+
+_TMP = tempfile.mkdtemp(prefix='backend-tests-')
+# Set before the app is imported: modules read their config at import time
+os.environ.update({
+    'DATABASE_URI': f'sqlite:///{_TMP}/app.db',
+    'HEALTH_SCHEDULER': '0',
+    'PASSWORD_HASH_WORKERS': '0',
+    'PASSWORD_HASH_METHOD': 'pbkdf2:sha256:1000',
+    'AUTH_CACHE_GENERATION_FILE': os.path.join(_TMP, 'auth-cache.generation'),
+    'AUTH_IDENTITY_GENERATION_FILE': os.path.join(_TMP, 'auth-identity.generation'),
+    'LDAP_CACHE_GENERATION_FILE': os.path.join(_TMP, 'ldap-cache.generation'),
+    'PROFILING_STATE_FILE': os.path.join(_TMP, 'profiling.json'),
+    'PROFILING_DIR': os.path.join(_TMP, 'profiles'),
+})
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+@pytest.fixture(scope='session')
+def tmp_root():
+    return _TMP
+
+
+@pytest.fixture(scope='session')
+def app():
+    import migrations
+    migrations.upgrade(os.environ['DATABASE_URI'])
+    from app import app as flask_app
+    return flask_app
+
+
+@pytest.fixture(autouse=True)
+def _clean_state(request):
+    yield
+    if 'app' not in request.fixturenames:
+        return
+    import security
+    from extensions import db
+    flask_app = request.getfixturevalue('app')
+    with flask_app.app_context():
+        db.session.remove()
+        for table in reversed(db.metadata.sorted_tables):
+            db.session.execute(table.delete())
+        db.session.commit()
+    # Row ids are reused once tables are emptied, so cached claims must go too
+    for cache in (security._token_cache, security.claims_cache, security._identity_cache):
+        cache.invalidate()
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+
+@pytest.fixture
+def make_user(app):
+    from extensions import db
+    from models import User
+
+    def make(email='user@example.com', group='viewer', password='secret-password'):
+        with app.app_context():
+            user = User(email=email, username=email.split('@')[0], user_group=group)
+            user.set_password(password)
+            db.session.add(user)
+            db.session.commit()
+            return user.id
+    return make
+
+
+@pytest.fixture
+def auth_header(app):
+    from extensions import db
+    from models import User
+    from security import generate_token
+
+    def header(user_id):
+        with app.app_context():
+            return {'Authorization': f'Bearer {generate_token(db.session.get(User, user_id))}'}
+    return header
@@ -0,0 +1,136 @@
+import time
+
+from cache import HIT, MISS, STALE, TTLCache
+
+
+def test_get_or_load_reports_miss_then_hit():
+    cache = TTLCache(ttl=60)
+    calls = []
+
+    def load():
+        calls.append(1)
+        return {'value': 1}
+
+    assert cache.get_or_load('k', load) == ({'value': 1}, MISS)
+    assert cache.get_or_load('k', load) == ({'value': 1}, HIT)
+    assert len(calls) == 1
+
+
+def test_stale_entry_is_served_while_refreshing():
+    cache = TTLCache(ttl=0.2, stale_ttl=60)
+    cache.get_or_load('k', lambda: 'old')
+    time.sleep(0.25)
+    value, status = cache.get_or_load('k', lambda: 'new')
+    assert (value, status) == ('old', STALE)
+    for _ in range(100):
+        if cache.get('k') == 'new':
+            break
+        time.sleep(0.01)
+    assert cache.get('k') == 'new'
+
+
+def test_invalidate_with_predicate_keeps_other_keys():
+    cache = TTLCache(ttl=60)
+    cache.set(('a', 1), 'x')
+    cache.set(('b', 1), 'y')
+    assert cache.invalidate(lambda key: key[0] == 'a') == 1
+    assert cache.get(('a', 1)) is None
+    assert cache.get(('b', 1)) == 'y'
+
+
+def _workers(tmp_path, count=2):
+    # Caches sharing a generation file stand in for gunicorn workers
+    generation = str(tmp_path / 'cache.generation')
+    return [TTLCache(ttl=60, generation_file=generation) for _ in range(count)]
+
+
+def test_invalidate_all_reaches_other_workers(tmp_path):
+    worker_a, worker_b = _workers(tmp_path)
+    worker_a.set('k', 'a')
+    worker_b.set('k', 'b')
+
+    worker_a.invalidate()
+
+    assert worker_a.get('k') is None
+    assert worker_b.get('k') is None
+    # Entries stored after the event survive until the next one
+    worker_b.set('k', 'fresh')
+    assert worker_b.get('k') == 'fresh'
+
+
+def test_invalidate_keys_drops_only_those_keys_everywhere(tmp_path):
+    worker_a, worker_b = _workers(tmp_path)
+    for worker in (worker_a, worker_b):
+        worker.set(1, 'user 1')
+        worker.set(2, 'user 2')
+
+    assert worker_a.invalidate_keys([1]) == 1
+
+    assert worker_b.get(1) is None
+    assert worker_b.get(2) == 'user 2'
+    assert worker_a.get(2) == 'user 2'
+
+
+def test_two_quick_invalidations_are_both_seen(tmp_path):
+    worker_a, worker_b = _workers(tmp_path)
+    worker_b.set(1, 'one')
+    worker_a.invalidate_keys([1])
+    assert worker_b.get(1) is None
+    worker_b.set(1, 'one again')
+    worker_b.set(2, 'two')
+    # Same filesystem timestamp tick as the first event; only the offset tells them apart
+    worker_a.invalidate_keys([1])
+    worker_a.invalidate_keys([2])
+    assert worker_b.get(1) is None
+    assert worker_b.get(2) is None
+
+
+def test_predicate_invalidation_stays_local(tmp_path):
+    worker_a, worker_b = _workers(tmp_path)
+    for worker in (worker_a, worker_b):
+        worker.set(('a', 1), 'x')
+        worker.set(('b', 1), 'y')
+
+    assert worker_a.invalidate(lambda key: key[0] == 'a') == 1
+
+    assert worker_a.get(('a', 1)) is None
+    assert worker_b.get(('a', 1)) == 'x'
+    assert worker_b.get(('b', 1)) == 'y'
+
+
+def test_invalidate_prefix_matches_tuple_keys_everywhere(tmp_path):
+    worker_a, worker_b = _workers(tmp_path)
+    for key in [('ldap://a', 'dc=x', 'f1'), ('ldap://a', 'dc=y', 'f1'), ('ldap://b', 'dc=x', 'f1')]:
+        worker_b.set(key, 'v')
+
+    worker_a.invalidate_prefix((None, 'dc=x'))
+
+    assert worker_b.get(('ldap://a', 'dc=x', 'f1')) is None
+    assert worker_b.get(('ldap://b', 'dc=x', 'f1')) is None
+    assert worker_b.get(('ldap://a', 'dc=y', 'f1')) == 'v'
+
+
+def test_replaced_log_drops_everything_once(tmp_path, monkeypatch):
+    import cache
+    monkeypatch.setattr(cache, 'GENERATION_LOG_MAX_BYTES', 64)
+    worker_a, worker_b = _workers(tmp_path)
+    worker_b.set('keep', 'old')
+    log = tmp_path / 'cache.generation'
+    worker_a.invalidate_keys(['other'])
+    while log.stat().st_size:  # the append that passes the limit replaces the log
+        worker_a.invalidate_keys(['other'])
+
+    assert worker_b.get('keep') is None
+    worker_b.set('keep', 'new')
+    assert worker_b.get('keep') == 'new'
+
+
+def test_max_bytes_evicts_least_recently_used():
+    cache = TTLCache(ttl=60, max_bytes=10, sizer=len)
+    cache.set('a', 'xxxx')
+    cache.set('b', 'yyyy')
+    cache.get('a')
+    cache.set('c', 'zzzz')
+    assert cache.get('b') is None
+    assert cache.get('a') == 'xxxx'
+    assert cache.get('c') == 'zzzz'
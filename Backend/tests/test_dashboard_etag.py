@@ -0,0 +1,135 @@
+import pytest
+
+PANELS = [{'id': 'cpu', 'title': 'CPU'}, {'id': 'mem', 'title': 'Memory'}]
+
+
+@pytest.fixture
+def headers(make_user, auth_header):
+    return auth_header(make_user())
+
+
+@pytest.fixture
+def saved(client, headers):
+    response = client.post('/app/dashboard', headers=headers,
+                           json={'panels': PANELS, 'pinned_panels': [], 'dashboard_layouts': {}})
+    assert response.status_code == 200
+    return response
+
+
+def test_get_sends_etag_and_answers_if_none_match(client, headers, saved):
+    response = client.get('/app/dashboard', headers=headers)
+    etag = response.headers['ETag']
+    assert response.status_code == 200
+    assert etag == saved.headers['ETag']
+    assert [p['id'] for p in response.json['panels']] == ['cpu', 'mem']
+
+    cached = client.get('/app/dashboard', headers={**headers, 'If-None-Match': etag})
+    assert cached.status_code == 304
+    assert cached.data == b''
+
+
+def test_etag_changes_with_every_write(client, headers, saved):
+    before = saved.headers['ETag']
+    patched = client.patch('/app/dashboard', headers=headers,
+                           json=[{'op': 'replace', 'path': '/panels/0/title', 'value': 'Load'}])
+    assert patched.status_code == 200
+    assert patched.headers['ETag'] != before
+    assert client.get('/app/dashboard', headers={**headers, 'If-None-Match': before}).status_code == 200
+
+
+def test_patch_with_current_if_match_applies(client, headers, saved):
+    response = client.patch('/app/dashboard', headers={**headers, 'If-Match': saved.headers['ETag']},
+                            json=[{'op': 'remove', 'path': '/panels/1'}])
+    assert response.status_code == 200
+    assert [p['id'] for p in client.get('/app/dashboard', headers=headers).json['panels']] == ['cpu']
+
+
+def test_patch_with_stale_if_match_is_rejected(client, headers, saved):
+    stale = saved.headers['ETag']
+    first = client.patch('/app/dashboard', headers={**headers, 'If-Match': stale},
+                         json=[{'op': 'remove', 'path': '/panels/1'}])
+    assert first.status_code == 200
+
+    second = client.patch('/app/dashboard', headers={**headers, 'If-Match': stale},
+                          json=[{'op': 'remove', 'path': '/panels/0'}])
+    assert second.status_code == 412
+    assert second.headers['ETag'] == first.headers['ETag']
+    # The rejected patch changed nothing
+    assert [p['id'] for p in client.get('/app/dashboard', headers=headers).json['panels']] == ['cpu']
+
+
+def test_patch_with_stale_version_arg_is_rejected(client, headers, saved):
+    version = saved.json['version']
+    response = client.patch(f'/app/dashboard?version={version - 1}', headers=headers,
+                            json=[{'op': 'remove', 'path': '/panels/0'}])
+    assert response.status_code == 412
+    assert response.json['version'] == version
+
+
+def test_if_match_without_dashboard_is_rejected(client, headers):
+    response = client.patch('/app/dashboard', headers={**headers, 'If-Match': '"d1v1"'},
+                            json=[{'op': 'add', 'path': '/panels/-', 'value': {'id': 'cpu'}}])
+    assert response.status_code == 412
+
+
+def test_patch_returns_only_the_delta(client, headers, saved):
+    response = client.patch('/app/dashboard', headers=headers, json=[
+        {'op': 'replace', 'path': '/panels/1/title', 'value': 'RAM'},
+        {'op': 'add', 'path': '/panels/-', 'value': {'id': 'disk'}},
+        {'op': 'remove', 'path': '/panels/0'},
+        {'op': 'test', 'path': '/pinned_panels', 'value': []},
+    ])
+    assert response.status_code == 200
+    assert response.json['applied'] == 4
+    assert response.json['changed'] == {'panels': {
+        'upserted': [{'id': 'mem', 'title': 'RAM'}, {'id': 'disk'}],
+        'removed': ['cpu'],
+    }}
+
+
+def test_patch_delta_reports_reordering_and_layouts(client, headers, saved):
+    response = client.patch('/app/dashboard', headers=headers, json=[
+        {'op': 'move', 'from': '/panels/1', 'path': '/panels/0'},
+        {'op': 'add', 'path': '/dashboard_layouts/lg', 'value': [{'i': 'cpu', 'x': 0}]},
+    ])
+    assert response.json['changed'] == {
+        'dashboard_layouts': {'lg': [{'i': 'cpu', 'x': 0}]},
+        'panels': {'upserted': [], 'removed': [], 'order': ['mem', 'cpu']},
+    }
+
+
+def test_patch_without_effect_changes_nothing(client, headers, saved):
+    response = client.patch('/app/dashboard', headers=headers,
+                            json=[{'op': 'test', 'path': '/panels/0/id', 'value': 'cpu'}])
+    assert response.json['changed'] == {}
+    assert response.headers['ETag'] == saved.headers['ETag']
+
+
+def test_failed_patch_op_applies_nothing(client, headers, saved):
+    response = client.patch('/app/dashboard', headers=headers, json=[
+        {'op': 'remove', 'path': '/panels/0'},
+        {'op': 'remove', 'path': '/panels/7'},
+    ])
+    assert response.status_code == 422
+    assert response.json['index'] == 1
+    assert client.get('/app/dashboard', headers=headers).headers['ETag'] == saved.headers['ETag']
+
+
+def test_concurrent_save_is_a_conflict(client, headers, saved, monkeypatch):
+    from extensions import db
+    from models import DashboardPanel
+    replace = DashboardPanel.replace
+
+    def replace_after_another_save(dashboard_id, kind, panels):
+        # Another request bumps the version between our read and our write
+        db.session.execute(db.text('UPDATE dashboard SET version = version + 1 WHERE id = :id'),
+                           {'id': dashboard_id})
+        monkeypatch.setattr(DashboardPanel, 'replace', replace)
+        return replace(dashboard_id, kind, panels)
+    monkeypatch.setattr(DashboardPanel, 'replace', replace_after_another_save)
+
+    response = client.post('/app/dashboard', headers=headers,
+                           json={'panels': PANELS[:1], 'pinned_panels': [], 'dashboard_layouts': {}})
+    assert response.status_code == 409
+    assert response.json['version'] == saved.json['version']
+    assert response.headers['ETag'] == saved.headers['ETag']
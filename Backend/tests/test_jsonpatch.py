@@ -0,0 +1,102 @@
+import pytest
+
+from jsonpatch import JsonPatchConflict, JsonPatchError, apply_patch, parse_pointer, touched_roots
+
+DOC = {'panels': [{'id': 'a'}, {'id': 'b'}], 'layout': {'w': 1}}
+
+
+@pytest.mark.parametrize('operations, expected', [
+    ([{'op': 'add', 'path': '/layout/h', 'value': 2}],
+     {'panels': [{'id': 'a'}, {'id': 'b'}], 'layout': {'w': 1, 'h': 2}}),
+    ([{'op': 'add', 'path': '/panels/0', 'value': {'id': 'z'}}],
+     {'panels': [{'id': 'z'}, {'id': 'a'}, {'id': 'b'}], 'layout': {'w': 1}}),
+    ([{'op': 'add', 'path': '/panels/-', 'value': {'id': 'c'}}],
+     {'panels': [{'id': 'a'}, {'id': 'b'}, {'id': 'c'}], 'layout': {'w': 1}}),
+    ([{'op': 'add', 'path': '/panels/2', 'value': {'id': 'c'}}],
+     {'panels': [{'id': 'a'}, {'id': 'b'}, {'id': 'c'}], 'layout': {'w': 1}}),
+    ([{'op': 'remove', 'path': '/panels/0'}],
+     {'panels': [{'id': 'b'}], 'layout': {'w': 1}}),
+    ([{'op': 'remove', 'path': '/layout/w'}],
+     {'panels': [{'id': 'a'}, {'id': 'b'}], 'layout': {}}),
+    ([{'op': 'replace', 'path': '/panels/1/id', 'value': 'B'}],
+     {'panels': [{'id': 'a'}, {'id': 'B'}], 'layout': {'w': 1}}),
+    ([{'op': 'move', 'from': '/panels/0', 'path': '/panels/-'}],
+     {'panels': [{'id': 'b'}, {'id': 'a'}], 'layout': {'w': 1}}),
+    ([{'op': 'move', 'from': '/layout/w', 'path': '/layout/width'}],
+     {'panels': [{'id': 'a'}, {'id': 'b'}], 'layout': {'width': 1}}),
+    ([{'op': 'copy', 'from': '/panels/0', 'path': '/panels/-'}],
+     {'panels': [{'id': 'a'}, {'id': 'b'}, {'id': 'a'}], 'layout': {'w': 1}}),
+    ([{'op': 'test', 'path': '/panels/1', 'value': {'id': 'b'}}], DOC),
+    ([{'op': 'replace', 'path': '', 'value': {'x': 1}}], {'x': 1}),
+])
+def test_operations(operations, expected):
+    assert apply_patch(DOC, operations) == expected
+
+
+def test_input_document_is_never_modified():
+    before = {'panels': [{'id': 'a'}]}
+    apply_patch(before, [{'op': 'replace', 'path': '/panels/0/id', 'value': 'b'}])
+    assert before == {'panels': [{'id': 'a'}]}
+
+
+def test_copied_values_are_independent():
+    result = apply_patch({'a': {'n': 1}}, [{'op': 'copy', 'from': '/a', 'path': '/b'},
+                                           {'op': 'replace', 'path': '/b/n', 'value': 2}])
+    assert result == {'a': {'n': 1}, 'b': {'n': 2}}
+
+
+def test_pointer_escapes():
+    assert parse_pointer('/a~1b/c~0d/~01') == ['a/b', 'c~d', '~1']
+    doc = {'a/b': 1, 'c~d': 2}
+    assert apply_patch(doc, [{'op': 'replace', 'path': '/a~1b', 'value': 3},
+                             {'op': 'remove', 'path': '/c~0d'}]) == {'a/b': 3}
+
+
+@pytest.mark.parametrize('operation', [
+    {'op': 'remove', 'path': '/missing'},
+    {'op': 'remove', 'path': '/panels/2'},
+    {'op': 'add', 'path': '/panels/3', 'value': 1},
+    {'op': 'add', 'path': '/panels/01', 'value': 1},
+    {'op': 'add', 'path': '/panels/x', 'value': 1},
+    {'op': 'remove', 'path': '/panels/-'},
+    {'op': 'add', 'path': '/missing/child', 'value': 1},
+    {'op': 'add', 'path': '/layout/w/deeper', 'value': 1},
+    {'op': 'add', 'path': 'panels', 'value': 1},
+    {'op': 'add', 'path': '/layout/h'},
+    {'op': 'remove', 'path': ''},
+    {'op': 'move', 'from': '/layout', 'path': '/layout/inner'},
+    {'op': 'copy', 'from': '/nothing', 'path': '/x'},
+    {'op': 'frobnicate', 'path': '/x'},
+    'not an operation',
+])
+def test_invalid_operations_are_rejected(operation):
+    with pytest.raises(JsonPatchError):
+        apply_patch(DOC, [operation])
+
+
+def test_patch_must_be_a_list():
+    with pytest.raises(JsonPatchError):
+        apply_patch(DOC, {'op': 'remove', 'path': '/layout'})
+
+
+def test_failed_test_op_is_a_conflict():
+    with pytest.raises(JsonPatchConflict) as raised:
+        apply_patch(DOC, [{'op': 'test', 'path': '/layout/w', 'value': 2}])
+    assert raised.value.index == 0
+
+
+def test_failure_applies_nothing_and_names_the_operation():
+    document = {'panels': [{'id': 'a'}]}
+    with pytest.raises(JsonPatchError) as raised:
+        apply_patch(document, [{'op': 'add', 'path': '/panels/-', 'value': {'id': 'b'}},
+                               {'op': 'remove', 'path': '/panels/5'}])
+    assert raised.value.index == 1
+    assert str(raised.value).startswith('Operation 1:')
+    assert document == {'panels': [{'id': 'a'}]}
+
+
+def test_touched_roots():
+    assert touched_roots([{'op': 'move', 'from': '/panels/0', 'path': '/pinned_panels/-'},
+                          {'op': 'replace', 'path': '/dashboard_layouts', 'value': {}}]) == \
+        {'panels', 'pinned_panels', 'dashboard_layouts'}
+    assert touched_roots([{'op': 'replace', 'path': '', 'value': {}}]) is None
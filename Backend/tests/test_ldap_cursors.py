@@ -0,0 +1,126 @@
+import pytest
+
+import ldappool
+from ldappool import LDAPCursorExpired
+from routes.ldap import _checkout_page, _ldap_stream_pages, _search_one_page
+
+PAGES = {None: (['u1', 'u2'], 'c1'), 'c1': (['u3', 'u4'], 'c2'), 'c2': (['u5'], None)}
+
+
+class FakePool:
+    def __init__(self):
+        self.out = 0
+        self.released = []
+
+    def acquire(self):
+        self.out += 1
+        return object()
+
+    def release(self, conn, broken=False):
+        self.out -= 1
+        self.released.append(broken)
+
+
+class Timer:
+    outcome = None
+
+    def finish(self, outcome):
+        self.outcome = outcome
+
+
+@pytest.fixture
+def pool(monkeypatch):
+    abandoned = []
+    monkeypatch.setattr(ldappool, 'search_page', lambda conn, base, flt, attrs, size, cookie=None: PAGES[cookie])
+    monkeypatch.setattr(ldappool, 'abandon_paged_search', lambda conn, base, flt, cookie: abandoned.append(cookie))
+    monkeypatch.setattr(ldappool.pools, 'cursors', ldappool.CursorRegistry(ttl=60, max_per_pool=5))
+    fake = FakePool()
+    fake.abandoned = abandoned
+    return fake
+
+
+def _stream(pool, token=None):
+    conn, cookie, pending = _checkout_page(pool, token)
+    pages = _ldap_stream_pages(pool, conn, 'dc=x', '(uid=*)', ['uid'], 2, cookie, 'q', Timer(),
+                               token=token, pending=pending)
+    next(pages)
+    return pages
+
+
+def _users(batch):
+    return [payload for event, payload in batch if event == 'user']
+
+
+def _cursor(batch):
+    return [payload for event, payload in batch if event == 'page'][0]['cursor']
+
+
+def test_full_stream_releases_the_connection(pool):
+    batches = list(_stream(pool))
+    assert [u for batch in batches for u in _users(batch)] == ['u1', 'u2', 'u3', 'u4', 'u5']
+    assert batches[-1] == [('end', {'status': 'success', 'count': 5})]
+    assert pool.out == 0
+    assert len(ldappool.pools.cursors) == 0
+
+
+def test_closed_before_first_batch_releases(pool):
+    pages = _stream(pool)
+    pages.close()
+    assert pool.out == 0
+    assert len(ldappool.pools.cursors) == 0
+
+
+def test_first_page_never_delivered_releases_and_abandons(pool):
+    pages = _stream(pool)
+    first = next(pages)
+    assert _cursor(first) is not None
+    pages.close()  # the write of the first page failed
+    assert pool.out == 0
+    assert pool.abandoned == ['c1']
+    assert len(ldappool.pools.cursors) == 0
+
+
+def test_missed_page_is_pinned_to_the_delivered_cursor(pool):
+    pages = _stream(pool)
+    first = next(pages)
+    next(pages)  # asking again confirms the first page arrived; the second never does
+    pages.close()
+    assert pool.out == 1
+    token = _cursor(first).split('.', 1)[1]
+
+    resumed = list(_stream(pool, token))
+    assert [u for batch in resumed for u in _users(batch)] == ['u3', 'u4', 'u5']
+    assert pool.out == 0
+    assert len(ldappool.pools.cursors) == 0
+
+
+def test_resume_closed_early_can_be_retried_with_the_same_cursor(pool):
+    pages = _stream(pool)
+    first = next(pages)
+    next(pages)
+    pages.close()
+    token = _cursor(first).split('.', 1)[1]
+
+    _stream(pool, token).close()
+    assert pool.out == 1
+    resumed = _stream(pool, token)
+    assert _users(next(resumed)) == ['u3', 'u4']
+    resumed.close()
+
+
+def test_single_page_request_takes_the_missed_page(pool):
+    pages = _stream(pool)
+    first = next(pages)
+    next(pages)
+    pages.close()
+    token = _cursor(first).split('.', 1)[1]
+
+    conn, cookie, pending = _checkout_page(pool, token)
+    users, next_token = _search_one_page(pool, conn, 'dc=x', '(uid=*)', ['uid'], 2, cookie, pending)
+    assert users == ['u3', 'u4']
+    conn, cookie, pending = _checkout_page(pool, next_token)
+    users, next_token = _search_one_page(pool, conn, 'dc=x', '(uid=*)', ['uid'], 2, cookie, pending)
+    assert (users, next_token) == (['u5'], None)
+    assert pool.out == 0
+    with pytest.raises(LDAPCursorExpired):
+        _checkout_page(pool, token)
@@ -0,0 +1,167 @@
+import json
+
+import pytest
+from sqlalchemy import create_engine, inspect, text
+
+import migrations
+
+# Schema as the last release before migrations.py left it: db.create_all()
+# at import plus the ad-hoc dashboard_layouts ALTER
+LEGACY_SCHEMA = [
+    'CREATE TABLE user (id INTEGER PRIMARY KEY, email VARCHAR(120) NOT NULL UNIQUE, username VARCHAR(120),'
+    ' password_hash TEXT NOT NULL, user_group TEXT, otp_secret VARCHAR(32), is_2fa_enabled BOOLEAN,'
+    ' _2fa_completed BOOLEAN)',
+    'CREATE TABLE dashboard (id INTEGER PRIMARY KEY, user_id INTEGER NOT NULL REFERENCES user (id),'
+    ' panels TEXT NOT NULL, pinned_panels TEXT, created_at DATETIME, updated_at DATETIME)',
+    'ALTER TABLE dashboard ADD COLUMN dashboard_layouts TEXT',
+    'CREATE TABLE server (id INTEGER PRIMARY KEY, hostname VARCHAR(255) NOT NULL UNIQUE, bmc_ip VARCHAR(255),'
+    ' auth_method VARCHAR(32) NOT NULL, ssh_key TEXT, root_password_hash TEXT, state VARCHAR(32) NOT NULL,'
+    ' created_at DATETIME, updated_at DATETIME)',
+]
+
+
+@pytest.fixture
+def database(tmp_path):
+    uri = f'sqlite:///{tmp_path}/migrate.db'
+    engine = create_engine(uri)
+    yield uri, engine
+    engine.dispose()
+
+
+def _version(engine):
+    with engine.connect() as conn:
+        return migrations.current_version(conn)
+
+
+def _snapshot(engine):
+    with engine.connect() as conn:
+        return {
+            'columns': {t: sorted(c['name'] for c in inspect(conn).get_columns(t))
+                        for t in inspect(conn).get_table_names()},
+            'panels': conn.execute(text('SELECT dashboard_id, kind, panel_id, position, config '
+                                        'FROM dashboard_panel ORDER BY id')).all(),
+            'dashboards': conn.execute(text('SELECT id, panels, pinned_panels, version FROM dashboard')).all(),
+        }
+
+
+def _user_indexes(engine):
+    # {name: unique}; inspect() skips expression indexes on SQLite
+    with engine.connect() as conn:
+        return {row[1]: row[2] for row in conn.execute(text("PRAGMA index_list('user')"))}
+
+
+def _model_metadata():
+    from models import db  # importing models registers its tables
+    return db.metadata
+
+
+def _indexes(conn, table):
+    # PRAGMA rather than inspect(): it also lists expression indexes
+    return {row[1] for row in conn.execute(text(f"PRAGMA index_list('{table}')"))
+            if not row[1].startswith('sqlite_autoindex')}
+
+
+def test_empty_database_upgrades_once(database):
+    uri, engine = database
+    assert migrations.upgrade(uri) == migrations.latest_version()
+    assert _version(engine) == migrations.latest_version()
+    before = _snapshot(engine)
+
+    assert migrations.upgrade(uri) == 0
+    assert _version(engine) == migrations.latest_version()
+    assert _snapshot(engine) == before
+
+
+def test_legacy_database_upgrades_from_version_zero(database):
+    uri, engine = database
+    panels = [{'id': 'cpu', 'w': 4}, {'id': 'cpu', 'w': 8}, {'title': 'no id'}, {'id': 'mem'}]
+    with engine.begin() as conn:
+        for statement in LEGACY_SCHEMA:
+            conn.execute(text(statement))
+        conn.execute(text("INSERT INTO user (id, email, password_hash, user_group) "
+                          "VALUES (1, 'a@example.com', 'x', 'admin')"))
+        conn.execute(text("INSERT INTO dashboard (id, user_id, panels, pinned_panels) VALUES (1, 1, :p, :pin)"),
+                     {'p': json.dumps(panels), 'pin': json.dumps([{'id': 'mem'}])})
+        conn.execute(text("INSERT INTO server (hostname, auth_method, state) VALUES ('legacy-host', 'ssh-key', 'Up')"))
+
+    assert migrations.upgrade(uri) == migrations.latest_version()
+
+    snapshot = _snapshot(engine)
+    assert {'check_interval', 'last_checked_at', 'last_latency_ms'} <= set(snapshot['columns']['server'])
+    assert 'version' in snapshot['columns']['dashboard']
+    assert {'dashboard_panel', 'server_state_history'} <= set(snapshot['columns'])
+    # First copy of a duplicated id wins; id-less entries are dropped
+    assert [(kind, panel_id, position, json.loads(config)) for _, kind, panel_id, position, config
+            in snapshot['panels']] == [('panel', 'cpu', 0, {'id': 'cpu', 'w': 4}),
+                                       ('panel', 'mem', 1, {'id': 'mem'}),
+                                       ('pinned', 'mem', 0, {'id': 'mem'})]
+    assert snapshot['dashboards'] == [(1, '[]', None, 2)]
+    with engine.connect() as conn:
+        assert conn.execute(text('SELECT hostname, state FROM server')).all() == [('legacy-host', 'Up')]
+
+    assert migrations.upgrade(uri) == 0
+    assert _version(engine) == migrations.latest_version()
+    assert _snapshot(engine) == snapshot
+
+
+def test_migrated_schema_matches_the_models(database):
+    uri, engine = database
+    migrations.upgrade(uri)
+    metadata = _model_metadata()
+    with engine.connect() as conn:
+        assert set(inspect(conn).get_table_names()) == set(metadata.tables) | {'schema_version'}
+        for name, table in metadata.tables.items():
+            columns = {c['name']: c['nullable'] for c in inspect(conn).get_columns(name)}
+            assert columns == {c.name: c.nullable for c in table.columns}, name
+            assert _indexes(conn, name) == {index.name for index in table.indexes}, name
+
+
+def test_create_all_baseline_without_version_table(database):
+    # Databases created by the app itself before schema_version existed
+    uri, engine = database
+    with engine.begin() as conn:
+        _model_metadata().create_all(conn)
+
+    assert migrations.upgrade(uri) == migrations.latest_version()
+    assert migrations.upgrade(uri) == 0
+    assert _version(engine) == migrations.latest_version()
+
+
+def test_failed_migration_records_no_version(database, monkeypatch):
+    uri, engine = database
+    migrations.upgrade(uri)
+
+    def broken(conn):
+        # A data change: pysqlite commits DDL on its own, so only DML shows the rollback
+        conn.execute(text("INSERT INTO server (hostname, auth_method, state) VALUES ('half-done', 'ssh-key', 'Up')"))
+        raise RuntimeError('boom')
+    monkeypatch.setattr(migrations, 'MIGRATIONS', [*migrations.MIGRATIONS,
+                                                   (migrations.latest_version() + 1, 'Broken', broken)])
+
+    with pytest.raises(RuntimeError):
+        migrations.upgrade(uri)
+    with engine.connect() as conn:
+        assert migrations.current_version(conn) == migrations.latest_version() - 1
+        assert conn.execute(text('SELECT COUNT(*) FROM server')).scalar() == 0
+
+
+def test_case_duplicate_usernames_do_not_block_the_upgrade(database, capsys):
+    uri, engine = database
+    with engine.begin() as conn:
+        for statement in LEGACY_SCHEMA:
+            conn.execute(text(statement))
+        conn.execute(text("INSERT INTO user (id, email, username, password_hash) VALUES "
+                          "(1, 'b1@example.com', 'Bob', 'x'), (2, 'b2@example.com', 'bob', 'x'), "
+                          "(3, 'c@example.com', 'carol', 'x')"))
+
+    assert migrations.upgrade(uri) == migrations.latest_version()
+
+    assert "Username 'bob' is shared by users [1, 2]" in capsys.readouterr().out
+    assert _user_indexes(engine)['ix_user_username_lower'] == 0
+    assert migrations.upgrade(uri) == 0
+
+
+def test_username_index_is_unique_without_duplicates(database):
+    uri, engine = database
+    migrations.upgrade(uri)
+    assert _user_indexes(engine)['ix_user_username_lower'] == 1
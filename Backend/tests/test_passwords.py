@@ -0,0 +1,170 @@
+import threading
+
+import pytest
+from werkzeug.security import check_password_hash, generate_password_hash
+
+import passwords
+from passwords import HashPoolBusy, PasswordHasher
+
+
+@pytest.fixture
+def make_hasher(monkeypatch):
+    hashers = []
+
+    def make(**settings):
+        for name, value in settings.items():
+            monkeypatch.setenv(name, str(value))
+        hasher = PasswordHasher()
+        hashers.append(hasher)
+        return hasher
+    yield make
+    for hasher in hashers:
+        hasher.shutdown()
+
+
+@pytest.fixture
+def blocking_hash(monkeypatch):
+    """Make inline hashing wait until release.set(); started is set once a job runs."""
+    started, release = threading.Event(), threading.Event()
+    real = passwords._hash
+
+    def slow(password, method):
+        started.set()
+        release.wait(5)
+        return real(password, method)
+    monkeypatch.setattr(passwords, '_hash', slow)
+    yield started, release
+    release.set()
+
+
+@pytest.mark.parametrize('method, stored, expected', [
+    ('pbkdf2:sha256:1000', 'pbkdf2:sha256:1000', False),
+    ('pbkdf2:sha256:1000', 'pbkdf2:sha256:2000', True),
+    ('pbkdf2:sha256:1000', 'scrypt:32768:8:1', True),
+    ('scrypt', 'scrypt:32768:8:1', False),
+    ('scrypt', 'scrypt:16384:8:1', False),
+    ('scrypt', 'pbkdf2:sha256:1000', True),
+    ('scrypt:32768:8:1', 'scrypt:16384:8:1', True),
+])
+def test_needs_rehash(make_hasher, method, stored, expected):
+    hasher = make_hasher(PASSWORD_HASH_WORKERS=0, PASSWORD_HASH_METHOD=method)
+    assert hasher.needs_rehash(generate_password_hash('pw', method=stored)) is expected
+
+
+def test_hash_uses_the_configured_method(make_hasher):
+    hasher = make_hasher(PASSWORD_HASH_WORKERS=0, PASSWORD_HASH_METHOD='pbkdf2:sha256:1200')
+    pwhash = hasher.hash('pw')
+    assert pwhash.startswith('pbkdf2:sha256:1200$')
+    assert hasher.verify(pwhash, 'pw') and not hasher.verify(pwhash, 'other')
+    assert not hasher.needs_rehash(pwhash)
+
+
+def test_hash_many_keeps_order_and_bounds_outstanding_jobs(make_hasher):
+    hasher = make_hasher(PASSWORD_HASH_WORKERS=0, PASSWORD_HASH_QUEUE=3, PASSWORD_HASH_WAIT=5)
+    running, peak = [0], [0]
+    lock = threading.Lock()
+
+    def track(event, op, _value):
+        with lock:
+            running[0] += {'started': 1, 'finished': -1}.get(event, 0)
+            peak[0] = max(peak[0], running[0])
+    hasher.add_listener(track)
+
+    secrets = [f'password-{i}' for i in range(10)]
+    hashes = hasher.hash_many(secrets)
+    assert [check_password_hash(h, s) for h, s in zip(hashes, secrets)] == [True] * 10
+    assert 1 <= peak[0] <= 3
+    assert hasher.stats()['hash']['count'] == 10
+    assert hasher.hash_many([]) == []
+
+
+def test_full_queue_rejects_with_hash_pool_busy(make_hasher, blocking_hash):
+    started, release = blocking_hash
+    hasher = make_hasher(PASSWORD_HASH_WORKERS=0, PASSWORD_HASH_QUEUE=1, PASSWORD_HASH_WAIT=0.05)
+    events = []
+    hasher.add_listener(lambda event, op, value: events.append((event, op, value)))
+
+    holder = threading.Thread(target=hasher.hash, args=('first',))
+    holder.start()
+    assert started.wait(5)
+    with pytest.raises(HashPoolBusy) as raised:
+        hasher.hash('second')
+    assert raised.value.retry_after == 1
+    assert ('rejected', 'hash', 'capacity') in events
+    assert (hasher.stats()['rejected'], hasher.stats()['in_flight']) == (1, 1)
+
+    release.set()
+    holder.join(5)
+    # The slot is free again
+    assert hasher.verify(hasher.hash('third'), 'third')
+    assert hasher.stats()['in_flight'] == 0
+
+
+def test_process_pool_hashes_and_verifies(make_hasher):
+    hasher = make_hasher(PASSWORD_HASH_WORKERS=1, PASSWORD_HASH_METHOD='pbkdf2:sha256:1000')
+    pwhash = hasher.hash('pw')
+    assert hasher.verify(pwhash, 'pw')
+    assert hasher.stats()['verify']['count'] == 1
+
+
+@pytest.fixture
+def saturate(monkeypatch):
+    """Take every slot of the app's hasher."""
+    def take():
+        slots = threading.BoundedSemaphore(1)
+        slots.acquire()
+        monkeypatch.setattr(passwords.hasher, '_slots', slots)
+        monkeypatch.setattr(passwords.hasher, 'wait', 0.01)
+    return take
+
+
+def test_login_sheds_load_with_503_when_hashing_is_busy(client, make_user, saturate):
+    make_user('busy@example.com')
+    saturate()
+    response = client.post('/app/login', json={'email': 'busy@example.com', 'password': 'secret-password'})
+    assert response.status_code == 503
+    assert response.headers['Retry-After'] == '1'
+    assert 'capacity' in response.json['error']
+
+
+def test_server_with_root_password_gets_503_when_hashing_is_busy(client, saturate):
+    saturate()
+    response = client.post('/api/servers', json={'hostname': 'db-1', 'auth_method': 'root-password',
+                                                 'root_password': 'pw'})
+    assert response.status_code == 503
+    assert client.get('/api/servers').json['servers'] == []
+
+
+def _stored_hash(app, user_id):
+    from extensions import db
+    from models import User
+    with app.app_context():
+        return db.session.get(User, user_id).password_hash
+
+
+def test_login_upgrades_an_outdated_hash(app, client, make_user, monkeypatch):
+    user_id = make_user('old@example.com')
+    assert _stored_hash(app, user_id).startswith('pbkdf2:sha256:1000$')
+    monkeypatch.setattr(passwords.hasher, 'method', 'pbkdf2:sha256:1100')
+
+    login = {'email': 'old@example.com', 'password': 'secret-password'}
+    assert client.post('/app/login', json=login).status_code == 200
+    upgraded = _stored_hash(app, user_id)
+    assert upgraded.startswith('pbkdf2:sha256:1100$')
+
+    assert client.post('/app/login', json=login).status_code == 200
+    assert _stored_hash(app, user_id) == upgraded
+
+
+def test_login_succeeds_when_the_rehash_is_refused(app, client, make_user, monkeypatch):
+    user_id = make_user('old@example.com')
+    before = _stored_hash(app, user_id)
+    monkeypatch.setattr(passwords.hasher, 'method', 'pbkdf2:sha256:1100')
+
+    def busy(_password):
+        raise HashPoolBusy('Password hashing is at capacity, try again shortly')
+    monkeypatch.setattr(passwords.hasher, 'hash', busy)
+
+    response = client.post('/app/login', json={'email': 'old@example.com', 'password': 'secret-password'})
+    assert response.status_code == 200
+    assert _stored_hash(app, user_id) == before
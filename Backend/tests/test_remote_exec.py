@@ -0,0 +1,81 @@
+import json
+
+import pytest
+
+import routes.remote_exec as remote_exec
+
+
+@pytest.fixture
+def admin(make_user, auth_header):
+    return auth_header(make_user('admin@example.com', group='admin'))
+
+
+@pytest.fixture
+def servers(app):
+    from extensions import db
+    from models import ServerHost
+    with app.app_context():
+        hosts = [ServerHost(hostname=f'node-{i}', auth_method='ssh-key', ssh_key='KEY') for i in range(3)]
+        db.session.add_all(hosts)
+        db.session.commit()
+        return [host.id for host in hosts]
+
+
+@pytest.fixture
+def executors(monkeypatch):
+    """Record the pool size of every fan-out and answer for the hosts without SSH."""
+    sizes = []
+    real = remote_exec.ThreadPoolExecutor
+
+    def executor(max_workers, **kwargs):
+        sizes.append(max_workers)
+        return real(max_workers=max_workers, **kwargs)
+
+    def fake_exec(target, *_args):
+        return {'server_id': target['id'], 'hostname': target['hostname'], 'status': 'success'}
+    monkeypatch.setattr(remote_exec, 'ThreadPoolExecutor', executor)
+    monkeypatch.setattr(remote_exec, '_exec_on_host', fake_exec)
+    return sizes
+
+
+def _records(response):
+    return [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+
+
+def test_exec_requires_an_admin(client, make_user, auth_header, servers):
+    body = {'command': 'uptime', 'ids': servers}
+    assert client.post('/api/servers/exec', json=body).status_code == 401
+    viewer = auth_header(make_user('viewer@example.com', group='viewer'))
+    assert client.post('/api/servers/exec', json=body, headers=viewer).status_code == 403
+
+
+@pytest.mark.parametrize('ids', [None, [], 'all'])
+def test_exec_requires_explicit_ids(client, admin, ids):
+    response = client.post('/api/servers/exec', json={'command': 'uptime', 'ids': ids}, headers=admin)
+    assert response.status_code == 400
+
+
+@pytest.mark.parametrize('concurrency', [0, -1, 1.5, '8', 'many', True, None])
+def test_bad_concurrency_is_rejected(client, admin, servers, executors, concurrency):
+    response = client.post('/api/servers/exec', headers=admin,
+                           json={'command': 'uptime', 'ids': servers, 'concurrency': concurrency})
+    assert response.status_code == 400
+    assert response.json['error'] == 'concurrency must be a positive integer'
+    assert executors == []
+
+
+def test_concurrency_is_capped(client, admin, servers, executors, monkeypatch):
+    monkeypatch.setattr(remote_exec, 'FANOUT_CONCURRENCY', 2)
+    response = client.post('/api/servers/exec', headers=admin,
+                           json={'command': 'uptime', 'ids': servers, 'concurrency': 100000})
+    records = _records(response)
+    assert executors == [2]
+    assert len(records) == 4
+    assert (records[-1]['hosts'], records[-1]['success']) == (3, 3)
+
+
+def test_concurrency_defaults_to_the_cap_and_never_exceeds_the_hosts(client, admin, servers, executors):
+    client.post('/api/servers/exec', headers=admin, json={'command': 'uptime', 'ids': servers}).get_data()
+    client.post('/api/servers/exec', headers=admin,
+                json={'command': 'uptime', 'ids': servers, 'concurrency': 1}).get_data()
+    assert executors == [3, 1]
@@ -0,0 +1,126 @@
+import datetime
+
+import jwt
+
+from security import SECRET_KEY
+
+
+def _bearer(token):
+    return {'Authorization': f'Bearer {token}'}
+
+
+def test_token_required_rejects_missing_token(client):
+    response = client.get('/app/user')
+    assert response.status_code == 401
+    assert response.json['error'] == 'Token is missing!'
+
+
+def test_token_required_rejects_non_bearer_header(client, make_user, auth_header):
+    token = auth_header(make_user())['Authorization'].split(' ')[1]
+    response = client.get('/app/user', headers={'Authorization': f'Token {token}'})
+    assert response.status_code == 401
+
+
+def test_token_required_rejects_bad_signature(client, make_user):
+    user_id = make_user()
+    token = jwt.encode({'user_id': user_id}, 'not-the-key', algorithm='HS256')
+    response = client.get('/app/user', headers=_bearer(token))
+    assert response.status_code == 401
+    assert response.json['error'] == 'Invalid token!'
+
+
+def test_token_required_rejects_expired_token(client, make_user):
+    user_id = make_user()
+    expired = datetime.datetime.now(datetime.UTC) - datetime.timedelta(minutes=1)
+    token = jwt.encode({'user_id': user_id, 'exp': expired}, SECRET_KEY, algorithm='HS256')
+    response = client.get('/app/user', headers=_bearer(token))
+    assert response.status_code == 401
+    assert response.json['error'] == 'Token has expired!'
+
+
+def test_token_required_accepts_valid_token(client, make_user, auth_header):
+    headers = auth_header(make_user(group='viewer'))
+    response = client.get('/app/user', headers=headers)
+    assert response.status_code == 200
+    assert response.json['user_group'] == 'viewer'
+
+
+def test_token_for_deleted_user_is_rejected(app, client, make_user, auth_header):
+    from extensions import db
+    from models import User
+    user_id = make_user()
+    headers = auth_header(user_id)
+    assert client.get('/app/user', headers=headers).status_code == 200
+    with app.app_context():
+        db.session.delete(db.session.get(User, user_id))
+        db.session.commit()
+    response = client.get('/app/user', headers=headers)
+    assert response.status_code == 401
+    assert response.json['error'] == 'User not found'
+
+
+def test_admin_required(client, make_user, auth_header):
+    viewer = auth_header(make_user('viewer@example.com', group='viewer'))
+    admin = auth_header(make_user('admin@example.com', group='admin'))
+    assert client.get('/api/auth/password-hashing').status_code == 401
+    assert client.get('/api/auth/password-hashing', headers=viewer).status_code == 403
+    assert client.get('/api/auth/password-hashing', headers=admin).status_code == 200
+
+
+def test_group_change_invalidates_cached_claims(app, client, make_user, auth_header):
+    from extensions import db
+    from models import User
+    user_id = make_user(group='viewer')
+    headers = auth_header(user_id)
+    # Caches the viewer claims
+    assert client.get('/api/auth/password-hashing', headers=headers).status_code == 403
+    with app.app_context():
+        db.session.get(User, user_id).set_user_group('admin')
+        db.session.commit()
+    assert client.get('/api/auth/password-hashing', headers=headers).status_code == 200
+
+
+def test_user_change_drops_only_that_users_claims(app, client, make_user, auth_header):
+    from extensions import db
+    from models import User
+    from security import claims_cache
+    alice = make_user('alice@example.com')
+    bob = make_user('bob@example.com')
+    for user_id in (alice, bob):
+        assert client.get('/app/user', headers=auth_header(user_id)).status_code == 200
+    with app.app_context():
+        db.session.get(User, alice).set_user_group('admin')
+        db.session.commit()
+    assert claims_cache.get(alice) is None
+    assert claims_cache.get(bob)['email'] == 'bob@example.com'
+
+
+def test_password_rehash_keeps_cached_claims(app, client, make_user, auth_header):
+    from extensions import db
+    from models import User
+    from security import claims_cache
+    user_id = make_user()
+    assert client.get('/app/user', headers=auth_header(user_id)).status_code == 200
+    with app.app_context():
+        db.session.get(User, user_id).set_password('another-password')
+        db.session.commit()
+    assert claims_cache.get(user_id) is not None
+
+
+def test_username_change_drops_old_and_new_identity(app, make_user):
+    from extensions import db
+    from models import User
+    from security import _identity_cache, find_user
+    user_id = make_user('carol@example.com')
+    other = make_user('dave@example.com')
+    with app.app_context():
+        db.session.get(User, user_id).set_username('Caz')
+        db.session.commit()
+        assert find_user('caz').id == user_id
+        assert find_user('dave@example.com').id == other
+        db.session.get(User, user_id).set_username('carol')
+        db.session.commit()
+        assert _identity_cache.get('caz') is None
+        assert _identity_cache.get('dave@example.com') == other
+        assert find_user('caz') is None
+        assert find_user('CAROL').id == user_id
@@ -0,0 +1,91 @@
+import datetime
+
+import pytest
+from sqlalchemy import event
+
+
+@pytest.fixture
+def add_host(app):
+    from extensions import db
+    from models import ServerHost
+
+    def add(hostname, state='Up'):
+        with app.app_context():
+            host = ServerHost(hostname=hostname, auth_method='ssh-key', state=state)
+            db.session.add(host)
+            db.session.commit()
+            return host.id
+    return add
+
+
+@pytest.fixture
+def add_history(app):
+    from extensions import db
+    from models import ServerStateHistory
+
+    def add(server_id, *rows):
+        """rows are (hours ago, state, transition) tuples."""
+        now = datetime.datetime.utcnow()
+        with app.app_context():
+            db.session.add_all(ServerStateHistory(server_id=server_id, state=state, transition=transition,
+                                                  checked_at=now - datetime.timedelta(hours=hours_ago))
+                               for hours_ago, state, transition in rows)
+            db.session.commit()
+    return add
+
+
+def test_uptime_covers_the_whole_window_not_just_the_page(client, add_host, add_history):
+    server_id = add_host('flappy')
+    # Up at the window start, Down for the first half, Up again, then hourly samples
+    add_history(server_id, (30, 'Up', True), (10, 'Down', True), (5, 'Up', True),
+                *[(hours, 'Up', False) for hours in (4, 3, 2, 1)])
+    response = client.get(f'/api/servers/{server_id}/history', query_string={'hours': 10, 'limit': 2})
+    assert response.status_code == 200
+    assert len(response.json['history']) == 2
+    assert response.json['uptime_pct'] == pytest.approx(50, abs=0.1)
+
+
+def test_uptime_starts_at_the_first_row_without_earlier_history(client, add_host, add_history):
+    server_id = add_host('new-host')
+    add_history(server_id, (4, 'Down', True), (3, 'Up', False), (1, 'Up', True))
+    response = client.get(f'/api/servers/{server_id}/history', query_string={'hours': 24, 'limit': 1})
+    assert response.json['uptime_pct'] == pytest.approx(25, abs=0.1)
+
+
+def test_uptime_without_history_is_null(client, add_host):
+    server_id = add_host('silent')
+    assert client.get(f'/api/servers/{server_id}/history').json['uptime_pct'] is None
+
+
+def test_outside_changes_are_recorded_with_one_history_query(app, add_host, add_history, monkeypatch):
+    from extensions import db
+    from models import ServerHost, ServerStateHistory
+    scheduler = app.extensions['health_scheduler']
+    monkeypatch.setattr(scheduler, '_hosts', {})
+    recorded = add_host('already-recorded')
+    missing = add_host('missing-row')
+    unchanged = add_host('unchanged')
+    with app.app_context():
+        scheduler._reload(0)
+        for server_id in (recorded, missing):
+            db.session.get(ServerHost, server_id).state = 'Down'
+        db.session.commit()
+    # A manual refresh already wrote the transition for this one
+    add_history(recorded, (0, 'Down', True))
+
+    statements = []
+
+    def capture(_conn, _cursor, statement, *_):
+        statements.append(statement)
+    with app.app_context():
+        engine = db.engine
+        event.listen(engine, 'before_cursor_execute', capture)
+        try:
+            scheduler._reload(1)
+        finally:
+            event.remove(engine, 'before_cursor_execute', capture)
+        rows = db.session.query(ServerStateHistory.server_id, ServerStateHistory.state).all()
+
+    assert sorted(rows) == sorted([(recorded, 'Down'), (missing, 'Down')])
+    assert unchanged not in {server_id for server_id, _ in rows}
+    assert sum(s.lstrip().startswith('SELECT') and 'server_state_history' in s for s in statements) == 1
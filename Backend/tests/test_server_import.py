@@ -0,0 +1,184 @@
+import io
+
+import pytest
+
+import routes.servers as servers_routes
+from passwords import hasher
+
+
+@pytest.fixture
+def sweeps(monkeypatch):
+    """Capture the background probe sweeps instead of pinging the imported hosts."""
+    submitted = []
+
+    class Sweeper:
+        def submit(self, fn, app, targets):
+            submitted.append(targets)
+    monkeypatch.setattr(servers_routes, '_import_sweeper', Sweeper())
+    return submitted
+
+
+@pytest.fixture
+def stored(app):
+    from models import ServerHost
+
+    def rows():
+        with app.app_context():
+            return {host.hostname: host for host in ServerHost.query.all()}
+    return rows
+
+
+@pytest.fixture
+def add_server(app):
+    from extensions import db
+    from models import ServerHost
+
+    def add(hostname):
+        with app.app_context():
+            db.session.add(ServerHost(hostname=hostname, auth_method='ssh-key', state='Up'))
+            db.session.commit()
+    return add
+
+
+def _statuses(response):
+    return [(r['hostname'], r['status']) for r in response.json['results']]
+
+
+def test_json_array_creates_pending_servers(client, sweeps, stored):
+    response = client.post('/api/servers/import', json=[
+        {'hostname': ' web-1 ', 'auth_method': 'ssh-key', 'ssh_key': 'KEY\n', 'check_interval': 30},
+        {'hostname': 'db-1', 'auth_method': 'root-password', 'root_password': 'hunter2', 'bmc_ip': '10.0.0.9'},
+    ])
+    assert response.status_code == 200
+    assert _statuses(response) == [('web-1', 'created'), ('db-1', 'created')]
+    assert response.json['summary'] == {'created': 2}
+
+    hosts = stored()
+    assert (hosts['web-1'].state, hosts['web-1'].ssh_key, hosts['web-1'].check_interval) == ('Pending', 'KEY', 30)
+    assert hosts['db-1'].bmc_ip == '10.0.0.9'
+    assert hasher.verify(hosts['db-1'].root_password_hash, 'hunter2')
+    assert sweeps == [[(hosts['web-1'].id, 'web-1'), (hosts['db-1'].id, 'db-1')]]
+
+
+def test_servers_wrapper_object_is_accepted(client, sweeps):
+    response = client.post('/api/servers/import',
+                           json={'servers': [{'hostname': 'web-1', 'auth_method': 'ssh-key'}]})
+    assert _statuses(response) == [('web-1', 'created')]
+
+
+def test_csv_body_normalises_headers_and_values(client, sweeps, stored):
+    body = ('Hostname , AUTH_METHOD,check_interval,rack\n'
+            'web-1, ssh-key ,60,A1\n'
+            'web-2,ssh-key,soon,A2\n')
+    response = client.post('/api/servers/import', data=body, content_type='text/csv')
+    assert response.status_code == 200
+    assert response.json['results'] == [
+        {'row': 0, 'hostname': 'web-1', 'status': 'created', 'id': stored()['web-1'].id},
+        {'row': 1, 'hostname': 'web-2', 'status': 'invalid',
+         'error': 'check_interval must be an integer of at least 5 seconds'},
+    ]
+    assert stored()['web-1'].check_interval == 60
+
+
+CSV_WITH_BOM = '\ufeffhostname,auth_method,root_password\ndb-1,root-password,s3cret\n'.encode('utf-8')
+
+
+@pytest.mark.parametrize('upload', [True, False])
+def test_csv_with_byte_order_mark(client, sweeps, stored, upload):
+    if upload:
+        response = client.post('/api/servers/import', data={'file': (io.BytesIO(CSV_WITH_BOM), 'servers.csv')},
+                               content_type='multipart/form-data')
+    else:
+        response = client.post('/api/servers/import', data=CSV_WITH_BOM, content_type='text/csv')
+    assert _statuses(response) == [('db-1', 'created')]
+    assert hasher.verify(stored()['db-1'].root_password_hash, 's3cret')
+
+
+def test_duplicates_and_existing_hosts_are_reported_not_created(client, sweeps, stored, add_server):
+    add_server('old-1')
+    response = client.post('/api/servers/import', json=[
+        {'hostname': 'new-1', 'auth_method': 'ssh-key'},
+        {'hostname': 'new-1', 'auth_method': 'root-password', 'root_password': 'x'},
+        {'hostname': 'old-1', 'auth_method': 'ssh-key'},
+    ])
+    assert _statuses(response) == [('new-1', 'created'), ('new-1', 'duplicate'), ('old-1', 'exists')]
+    assert response.json['summary'] == {'created': 1, 'duplicate': 1, 'exists': 1}
+    # The first copy wins
+    assert stored()['new-1'].auth_method == 'ssh-key'
+    assert stored()['old-1'].state == 'Up'
+
+
+def test_invalid_rows_do_not_stop_the_rest(client, sweeps, stored):
+    response = client.post('/api/servers/import', json=[
+        'web-0',
+        {'hostname': 'web-1'},
+        {'hostname': 'web-2', 'auth_method': 'telnet'},
+        {'hostname': 'web-3', 'auth_method': 'root-password'},
+        {'hostname': 'web-4', 'auth_method': 'ssh-key'},
+    ])
+    assert response.status_code == 200
+    results = response.json['results']
+    assert [r['status'] for r in results] == ['invalid', 'invalid', 'invalid', 'invalid', 'created']
+    assert [r.get('error') for r in results[:4]] == [
+        'Each server must be an object',
+        'hostname and auth_method are required',
+        'Invalid auth_method',
+        'root_password required for root-password auth',
+    ]
+    assert response.json['message'] == 'Imported 1 of 5 servers'
+    assert set(stored()) == {'web-4'}
+
+
+def test_failed_batch_only_fails_its_own_rows(client, sweeps, stored, monkeypatch):
+    monkeypatch.setattr(servers_routes, 'IMPORT_BATCH_SIZE', 2)
+    insert = servers_routes._insert_server_batch
+
+    def insert_or_fail(batch):
+        if batch[0]['hostname'] == 'web-3':
+            raise RuntimeError('disk full')
+        return insert(batch)
+    monkeypatch.setattr(servers_routes, '_insert_server_batch', insert_or_fail)
+
+    response = client.post('/api/servers/import',
+                           json=[{'hostname': f'web-{i}', 'auth_method': 'ssh-key'} for i in range(1, 6)])
+    assert [r['status'] for r in response.json['results']] == ['created', 'created', 'error', 'error', 'created']
+    assert response.json['results'][2]['error'] == 'Database error: disk full'
+    assert set(stored()) == {'web-1', 'web-2', 'web-5'}
+    assert [hostname for _, hostname in sweeps[0]] == ['web-1', 'web-2', 'web-5']
+
+
+def test_host_created_concurrently_is_reported_as_existing(app, client, sweeps, stored, monkeypatch):
+    from extensions import db
+    hash_many = hasher.hash_many
+
+    def hash_many_then_race(passwords):
+        # Another request creates web-2 after the existence check, before our insert
+        with app.app_context(), db.engine.begin() as conn:
+            conn.execute(db.text("INSERT INTO server (hostname, auth_method, state) VALUES ('web-2', 'ssh-key', 'Up')"))
+        return hash_many(passwords)
+    monkeypatch.setattr(hasher, 'hash_many', hash_many_then_race)
+
+    response = client.post('/api/servers/import',
+                           json=[{'hostname': f'web-{i}', 'auth_method': 'ssh-key'} for i in range(1, 4)])
+    assert _statuses(response) == [('web-1', 'created'), ('web-2', 'exists'), ('web-3', 'created')]
+    assert stored()['web-2'].state == 'Up'
+
+
+@pytest.mark.parametrize('kwargs', [
+    {'json': {'hostname': 'web-1'}},
+    {'data': 'not json', 'content_type': 'application/json'},
+    {'data': b'hostname\n\xff\xfe\n', 'content_type': 'text/csv'},
+])
+def test_unreadable_import_is_rejected(client, sweeps, kwargs):
+    response = client.post('/api/servers/import', **kwargs)
+    assert response.status_code == 400
+    assert response.json['error'].startswith('Could not read import')
+
+
+def test_import_size_is_capped(client, sweeps, stored, monkeypatch):
+    monkeypatch.setattr(servers_routes, 'IMPORT_MAX_ROWS', 2)
+    response = client.post('/api/servers/import',
+                           json=[{'hostname': f'web-{i}', 'auth_method': 'ssh-key'} for i in range(3)])
+    assert response.status_code == 413
+    assert stored() == {}
+    assert sweeps == []
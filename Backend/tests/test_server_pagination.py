@@ -0,0 +1,84 @@
+import datetime
+
+import pytest
+
+BASE = datetime.datetime(2024, 1, 1)
+
+
+@pytest.fixture
+def add_servers(app):
+    from extensions import db
+    from models import ServerHost
+
+    def add(*specs):
+        """specs are (hostname, minutes after BASE, state) tuples; returns the new ids."""
+        with app.app_context():
+            hosts = [ServerHost(hostname=hostname, auth_method='ssh-key', state=state,
+                                created_at=BASE + datetime.timedelta(minutes=minutes))
+                     for hostname, minutes, state in specs]
+            db.session.add_all(hosts)
+            db.session.commit()
+            return [host.id for host in hosts]
+    return add
+
+
+def _walk(client, **args):
+    hostnames, pages, cursor = [], 0, None
+    while True:
+        query = dict(args, **({'cursor': cursor} if cursor else {}))
+        response = client.get('/api/servers', query_string=query)
+        assert response.status_code == 200
+        hostnames += [s['hostname'] for s in response.json['servers']]
+        pages += 1
+        cursor = response.json['next_cursor']
+        if cursor is None:
+            return hostnames, pages
+
+
+def test_pages_are_newest_first_without_gaps_or_repeats(client, add_servers):
+    add_servers(*[(f'host-{i:02d}', i, 'Up') for i in range(7)])
+    hostnames, pages = _walk(client, limit=3)
+    assert hostnames == [f'host-{i:02d}' for i in reversed(range(7))]
+    assert pages == 3
+
+
+def test_equal_created_at_is_ordered_by_id(client, add_servers):
+    # Same timestamp on every row: only the id half of the key separates them
+    add_servers(*[(f'tie-{i}', 0, 'Up') for i in range(5)])
+    hostnames, _ = _walk(client, limit=2)
+    assert hostnames == [f'tie-{i}' for i in reversed(range(5))]
+
+
+def test_last_full_page_has_no_next_cursor(client, add_servers):
+    add_servers(*[(f'host-{i}', i, 'Up') for i in range(4)])
+    response = client.get('/api/servers', query_string={'limit': 4})
+    assert len(response.json['servers']) == 4
+    assert response.json['next_cursor'] is None
+
+
+def test_rows_added_after_the_first_page_do_not_shift_later_pages(client, add_servers):
+    add_servers(*[(f'host-{i}', i, 'Up') for i in range(4)])
+    first = client.get('/api/servers', query_string={'limit': 2}).json
+    add_servers(('newer', 100, 'Up'))
+    rest = client.get('/api/servers', query_string={'limit': 2, 'cursor': first['next_cursor']}).json
+    assert [s['hostname'] for s in first['servers'] + rest['servers']] == ['host-3', 'host-2', 'host-1', 'host-0']
+
+
+def test_filters_apply_across_pages(client, add_servers):
+    add_servers(*[(f'up-{i}', i, 'Up') for i in range(3)], *[(f'down-{i}', 10 + i, 'Down') for i in range(3)])
+    hostnames, _ = _walk(client, limit=1, state='Up')
+    assert hostnames == ['up-2', 'up-1', 'up-0']
+    hostnames, _ = _walk(client, limit=2, hostname='down-')
+    assert hostnames == ['down-2', 'down-1', 'down-0']
+
+
+def test_fields_selects_only_requested_columns(client, add_servers):
+    add_servers(('host-a', 0, 'Up'))
+    response = client.get('/api/servers', query_string={'fields': 'hostname,state'})
+    assert response.json['servers'] == [{'hostname': 'host-a', 'state': 'Up'}]
+    assert client.get('/api/servers', query_string={'fields': 'ssh_key'}).status_code == 400
+
+
+@pytest.mark.parametrize('query', [{'cursor': 'not-a-cursor'}, {'limit': 0}])
+def test_bad_arguments_are_rejected(client, query):
+    assert client.get('/api/servers', query_string=query).status_code == 400
@@ -0,0 +1,215 @@
+import contextlib
+import os
+import signal
+import sys
+import textwrap
+import threading
+import time
+
+import pytest
+
+from sshpool import SSHConnectError, SSHError, SSHPool, SSHPoolBusy
+
+# Stand-ins for ssh and sshpass. The "master" (-M) creates its control path
+# and waits; a client (-S) checks the master is there and runs the remote
+# command locally. Every start is logged so tests can count handshakes.
+FAKE_SSH = '''
+import os, shlex, signal, sys, time
+args = sys.argv[1:]
+ctl = args[args.index('-S') + 1]
+with open(os.environ['FAKE_SSH_LOG'], 'a') as log:
+    log.write(('master ' if '-M' in args else 'client ') + ' '.join(args) + '\\n')
+if '-M' in args:
+    if os.environ.get('SSHPASS', os.environ['FAKE_SSH_PASSWORD']) != os.environ['FAKE_SSH_PASSWORD']:
+        sys.stderr.write('Permission denied (password).\\n')
+        sys.exit(255)
+    signal.signal(signal.SIGTERM, lambda *_: sys.exit(0))
+    open(ctl, 'w').close()
+    while True:
+        time.sleep(1)
+if not os.path.exists(ctl):
+    sys.stderr.write('Control socket connect: No such file or directory\\n')
+    sys.exit(255)
+# The pool wraps commands in `bash -lc`; run them without this machine's login profile
+shell, flag, command = shlex.split(args[-1])
+assert (shell, flag) == ('bash', '-lc')
+os.execvp('bash', ['bash', '--noprofile', '--norc', '-c', command])
+'''
+
+FAKE_SSHPASS = '''
+import os, sys
+assert sys.argv[1] == '-e' and 'SSHPASS' in os.environ
+os.execv(sys.executable, [sys.executable] + sys.argv[2:])
+'''
+
+
+def _script(path, source):
+    path.write_text(f'#!{sys.executable}\n' + textwrap.dedent(source))
+    path.chmod(0o755)
+    return str(path)
+
+
+@pytest.fixture
+def log(tmp_path):
+    return tmp_path / 'ssh.log'
+
+
+@pytest.fixture
+def make_pool(tmp_path, log, monkeypatch):
+    monkeypatch.setenv('FAKE_SSH_LOG', str(log))
+    monkeypatch.setenv('FAKE_SSH_PASSWORD', 'right')
+    monkeypatch.setenv('SSH_BINARY', _script(tmp_path / 'ssh', FAKE_SSH))
+    monkeypatch.setenv('SSHPASS_BINARY', _script(tmp_path / 'sshpass', FAKE_SSHPASS))
+    monkeypatch.setenv('SSH_POOL_DIR', str(tmp_path))
+    pools = []
+
+    def make(**settings):
+        for name, value in settings.items():
+            monkeypatch.setenv(name, str(value))
+        pool = SSHPool()
+        pools.append(pool)
+        return pool
+    yield make
+    for pool in pools:
+        pool.close_all()
+
+
+def _starts(log):
+    lines = log.read_text().splitlines() if log.exists() else []
+    return sum(line.startswith('master ') for line in lines), sum(line.startswith('client ') for line in lines)
+
+
+def _master(pool):
+    (master,) = pool._masters.values()
+    return master
+
+
+def test_commands_reuse_one_master(make_pool, log):
+    pool = make_pool()
+    assert pool.run('host-a', 'root', 'echo one', key='KEY') == 'one\n'
+    assert pool.run('host-a', 'root', 'echo two', key='KEY') == 'two\n'
+    assert _starts(log) == (1, 2)
+
+
+def test_each_credential_gets_its_own_master(make_pool, log):
+    pool = make_pool()
+    pool.run('host-a', 'root', 'true', key='KEY-1')
+    pool.run('host-a', 'root', 'true', key='KEY-2')
+    pool.run('host-b', 'root', 'true', key='KEY-1')
+    assert _starts(log) == (3, 3)
+    assert len(pool._masters) == 3
+
+
+def test_password_goes_through_sshpass_environment(make_pool, log):
+    pool = make_pool()
+    assert pool.run('host-a', 'root', 'echo ok', password='right') == 'ok\n'
+    assert 'right' not in log.read_text()
+    with pytest.raises(SSHConnectError) as raised:
+        pool.run('host-b', 'root', 'echo ok', password='wrong')
+    assert 'Permission denied' in raised.value.stderr
+
+
+def test_remote_failure_raises_with_stderr(make_pool):
+    pool = make_pool()
+    with pytest.raises(SSHError) as raised:
+        pool.run('host-a', 'root', 'echo broken >&2; exit 3', key='KEY')
+    assert raised.value.returncode == 3
+    assert raised.value.stderr == 'broken'
+
+
+def test_sessions_per_host_are_capped(make_pool):
+    pool = make_pool(SSH_POOL_MAX_SESSIONS=2, SSH_POOL_WAIT=0.2)
+    with contextlib.ExitStack() as held:
+        held.enter_context(pool.session('host-a', 'root', key='KEY'))
+        held.enter_context(pool.session('host-a', 'root', key='KEY'))
+        started = time.monotonic()
+        with pytest.raises(SSHPoolBusy):
+            pool.run('host-a', 'root', 'true', key='KEY')
+        assert time.monotonic() - started < 2
+        # The cap is per host
+        assert pool.run('host-b', 'root', 'echo free', key='KEY') == 'free\n'
+    assert pool.run('host-a', 'root', 'echo again', key='KEY') == 'again\n'
+
+
+def test_waiting_command_gets_the_released_session(make_pool):
+    pool = make_pool(SSH_POOL_MAX_SESSIONS=1, SSH_POOL_WAIT=5)
+    results = []
+    with pool.session('host-a', 'root', key='KEY'):
+        waiter = threading.Thread(target=lambda: results.append(pool.run('host-a', 'root', 'echo later', key='KEY')))
+        waiter.start()
+        time.sleep(0.2)
+        assert results == []
+    waiter.join(5)
+    assert results == ['later\n']
+
+
+def test_idle_masters_are_reaped_and_restarted(make_pool, log):
+    pool = make_pool(SSH_POOL_IDLE_TIMEOUT=0.1)
+    pool.run('host-a', 'root', 'true', key='KEY')
+    master = _master(pool)
+    ctl_path, key_file = master.ctl_path, master.key_file
+    time.sleep(0.15)
+
+    pool.reap_idle()
+
+    assert master.proc is None
+    assert not os.path.exists(ctl_path)
+    assert not os.path.exists(key_file)
+    pool.run('host-a', 'root', 'true', key='KEY')
+    assert _starts(log) == (2, 2)
+
+
+def test_busy_master_is_not_reaped(make_pool):
+    pool = make_pool(SSH_POOL_IDLE_TIMEOUT=0)
+    with pool.session('host-a', 'root', key='KEY'):
+        pool.reap_idle()
+        assert _master(pool).alive()
+
+
+def test_dead_master_is_replaced(make_pool, log):
+    pool = make_pool()
+    pool.run('host-a', 'root', 'true', key='KEY')
+    master = _master(pool)
+    os.kill(master.proc.pid, signal.SIGKILL)
+    master.proc.wait()
+    assert pool.run('host-a', 'root', 'echo back', key='KEY') == 'back\n'
+    assert _starts(log)[0] == 2
+
+
+def test_stream_yields_lines_and_exit_status(make_pool):
+    pool = make_pool()
+    stream = pool.stream('host-a', 'root', 'printf "a\\nb\\nc"; echo oops >&2; exit 4', key='KEY')
+    assert [line for batch in stream.lines() for line in batch] == ['a', 'b', 'c']
+    assert (stream.returncode, stream.stderr, stream.truncated, stream.timed_out) == (4, 'oops', False, False)
+    assert _master(pool).active == 0
+
+
+def test_stream_stops_at_byte_cap(make_pool):
+    pool = make_pool()
+    stream = pool.stream('host-a', 'root', 'yes 0123456789 | head -n 100000', key='KEY', max_bytes=25)
+    lines = [line for batch in stream.lines() for line in batch]
+    assert stream.truncated
+    assert stream.bytes_read == 25
+    assert lines == ['0123456789', '0123456789', '012']
+    assert _master(pool).active == 0
+
+
+def test_stream_times_out_and_kills_the_command(make_pool):
+    pool = make_pool()
+    started = time.monotonic()
+    stream = pool.stream('host-a', 'root', 'echo start; sleep 30; echo never', key='KEY', timeout=0.5)
+    lines = [line for batch in stream.lines() for line in batch]
+    assert lines == ['start']
+    assert stream.timed_out
+    assert time.monotonic() - started < 5
+    assert stream.proc.poll() is not None
+
+
+def test_consumer_leaving_early_frees_the_session(make_pool):
+    pool = make_pool(SSH_POOL_MAX_SESSIONS=1, SSH_POOL_WAIT=0.5)
+    stream = pool.stream('host-a', 'root', 'while true; do echo tick; sleep 0.05; done', key='KEY')
+    batches = stream.lines()
+    assert next(batches)
+    batches.close()
+    assert stream.proc.poll() is not None
+    assert pool.run('host-a', 'root', 'echo free', key='KEY') == 'free\n'
@@ -3,7 +3,10 @@ export interface ServerRecord {
   hostname: string;
   bmc_ip?: string;
   auth_method: 'ssh-key' | 'root-password';
-  state: 'Up' | 'Down' | 'Unconfigured';
+  state: 'Up' | 'Down' | 'Pending' | 'Unconfigured';
+  check_interval?: number | null;
+  last_checked_at?: string | null;
+  last_latency_ms?: number | null;
   created_at?: string;
   updated_at?: string;
 }
@@ -20,10 +23,32 @@ async function parse<T>(res: Response): Promise<T> {
   return data as T;
 }
 
-export async function fetchServers(): Promise<ServerRecord[]> {
-  const res = await fetch(`${BASE}/api/servers`);
-  const data = await parse<{servers: ServerRecord[]}>(res);
-  return data.servers;
+export interface ServerPage {
+  servers: ServerRecord[];
+  next_cursor: string | null;
+}
+
+export interface ServerQuery {
+  limit?: number;
+  cursor?: string | null;
+  state?: ServerRecord['state'];
+  auth_method?: ServerRecord['auth_method'];
+  hostname?: string;
+  fields?: (keyof ServerRecord)[];
+}
+
+/** One newest-first page of the inventory; pass next_cursor back for the next page. */
+export async function fetchServers(query: ServerQuery = {}): Promise<ServerPage> {
+  const params = new URLSearchParams();
+  if (query.limit) params.set('limit', String(query.limit));
+  if (query.cursor) params.set('cursor', query.cursor);
+  if (query.state) params.set('state', query.state);
+  if (query.auth_method) params.set('auth_method', query.auth_method);
+  if (query.hostname) params.set('hostname', query.hostname);
+  if (query.fields?.length) params.set('fields', query.fields.join(','));
+  const qs = params.toString();
+  const res = await fetch(`${BASE}/api/servers${qs ? `?${qs}` : ''}`);
+  return parse<ServerPage>(res);
 }
 
 export async function createServer(payload: {
@@ -42,6 +67,12 @@ export async function createServer(payload: {
   return data.server;
 }
 
+export async function fetchServer(id: number): Promise<ServerRecord> {
+  const res = await fetch(`${BASE}/api/servers/${id}`);
+  const data = await parse<{server: ServerRecord}>(res);
+  return data.server;
+}
+
 export async function deleteServer(id: number): Promise<void> {
   const res = await fetch(`${BASE}/api/servers/${id}`, { method: 'DELETE' });
   await parse(res);
@@ -51,4 +82,27 @@ export async function refreshServer(id: number): Promise<ServerRecord> {
   const res = await fetch(`${BASE}/api/servers/${id}/refresh`, { method: 'POST' });
   const data = await parse<{server: ServerRecord}>(res);
   return data.server;
-}
\ No newline at end of file
+}
+
+export interface RefreshResult {
+  id: number;
+  hostname: string;
+  reachable: boolean;
+  latency_ms: number;
+  previous_state: ServerRecord['state'];
+  state: ServerRecord['state'];
+}
+
+export async function refreshServers(filter: {
+  ids?: number[];
+  state?: ServerRecord['state'];
+  hostname?: string;
+} = {}): Promise<RefreshResult[]> {
+  const res = await fetch(`${BASE}/api/servers/refresh`, {
+    method: 'POST',
+    headers: { 'Content-Type': 'application/json' },
+    body: JSON.stringify(filter)
+  });
+  const data = await parse<{results: RefreshResult[]}>(res);
+  return data.results;
+}
@@ -0,0 +1,71 @@
+export interface SessionData {
+  user: {
+    user_id: number;
+    email: string;
+    username: string | null;
+    user_group: string | null;
+  };
+  '2fa': {
+    is_2fa_enabled: boolean;
+    '2fa_completed': boolean;
+  };
+  dashboard: {
+    panels: any[];
+    pinned_panels: any[];
+    dashboard_layouts: Record<string, any>;
+    updated_at: string | null;
+  };
+}
+
+const CACHE_KEY = 'session_cache';
+
+interface CachedSession {
+  token: string;
+  etag: string;
+  data: SessionData;
+}
+
+function readCache(token: string): CachedSession | null {
+  try {
+    const cached = JSON.parse(localStorage.getItem(CACHE_KEY) || 'null') as CachedSession | null;
+    return cached && cached.token === token ? cached : null;
+  } catch {
+    return null;
+  }
+}
+
+// Concurrent callers (ProtectedRoute, DashboardContext) share one request
+let inflight: Promise<SessionData | null> | null = null;
+
+/**
+ * Load user group, 2FA state and dashboard config in one round trip.
+ * Revalidates with If-None-Match, so an unchanged session costs a 304.
+ * Resolves to null when there is no valid token.
+ */
+export function fetchSession(): Promise<SessionData | null> {
+  if (inflight) return inflight;
+  inflight = (async () => {
+    const token = localStorage.getItem('token');
+    if (!token) return null;
+
+    const cached = readCache(token);
+    const headers: Record<string, string> = { Authorization: `Bearer ${token}` };
+    if (cached) headers['If-None-Match'] = cached.etag;
+
+    const res = await fetch('/app/session', { headers, cache: 'no-store' });
+    if (res.status === 304 && cached) return cached.data;
+    if (!res.ok) {
+      localStorage.removeItem(CACHE_KEY);
+      return null;
+    }
+    const data = (await res.json()) as SessionData;
+    const etag = res.headers.get('ETag');
+    if (etag) {
+      localStorage.setItem(CACHE_KEY, JSON.stringify({ token, etag, data }));
+    }
+    return data;
+  })().finally(() => {
+    inflight = null;
+  });
+  return inflight;
+}
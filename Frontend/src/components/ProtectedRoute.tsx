@@ -1,51 +1,12 @@
 import axios from "axios";
 import React, { useEffect, useState } from "react";
 import { Navigate, useNavigate } from "react-router-dom";
+import { fetchSession, SessionData } from "../api/session";
 
 interface ProtectedRouteProps {
   children: React.ReactNode;
 }
 
-const fetchUserGroup = async (): Promise<string | null> => {
-  const token = localStorage.getItem("token");
-  if (!token) return null;
-
-  try {
-    const response = await axios.get("/app/user", {
-      headers: {
-        Authorization: `Bearer ${token}`,
-      },
-    });
-    return response.data.user_group;
-  } catch (err) {
-    console.error("Token validation failed:", err);
-    return null;
-  }
-};
-
-const fetch2FAStatus = async (): Promise<{
-  is2FARequired: boolean;
-  is2FACompleted: boolean;
-} | null> => {
-  const token = localStorage.getItem("token");
-  if (!token) return null;
-
-  try {
-    const response = await axios.get("/app/2fa-status", {
-      headers: {
-        Authorization: `Bearer ${token}`,
-      },
-    });
-    return {
-      is2FARequired: response.data.is_2fa_enabled,
-      is2FACompleted: response.data["2fa_completed"],
-    };
-  } catch (err) {
-    console.error("Failed to fetch 2FA status:", err);
-    return null;
-  }
-};
-
 const ProtectedRoute = ({ children }: ProtectedRouteProps) => {
   const [isAuthorized, setIsAuthorized] = useState<boolean | null>(null);
   const navigate = useNavigate();
@@ -62,24 +23,23 @@ const ProtectedRoute = ({ children }: ProtectedRouteProps) => {
       // Set token in axios globally
       axios.defaults.headers.common["Authorization"] = `Bearer ${token}`;
 
-      // Set User Group
-      const group = await fetchUserGroup();
-      if (!group) {
-        setIsAuthorized(false);
-        return;
+      // User group and 2FA status in one (usually 304) request
+      let sessionData: SessionData | null = null;
+      try {
+        sessionData = await fetchSession();
+      } catch (err) {
+        console.error("Session validation failed:", err);
       }
-      localStorage.setItem("user_group", group);
-
-      // Check 2FA status
-      const twoFAStatus = await fetch2FAStatus();
-      if (!twoFAStatus) {
+      const group = sessionData?.user.user_group;
+      if (!sessionData || !group) {
         setIsAuthorized(false);
         return;
       }
+      localStorage.setItem("user_group", group);
 
       if (
-        twoFAStatus.is2FARequired &&
-        !twoFAStatus.is2FACompleted &&
+        sessionData["2fa"].is_2fa_enabled &&
+        !sessionData["2fa"]["2fa_completed"] &&
         window.location.pathname !== "/2fa"
       ) {
         navigate("/2fa");
@@ -6,6 +6,7 @@ import React, {
   ReactNode,
   useEffect,
 } from "react";
+import { fetchSession } from "../api/session";
 import { GrafanaPanelConfig } from "../components/GrafanaDashboard";
 
 interface DashboardContextType {
@@ -87,13 +88,22 @@ export const DashboardProvider: React.FC<DashboardProviderProps> = ({
     );
   }, [pinnedPanels]);
 
-  // Load pinned panels when the context is first created
+  // Load pinned panels when the context is first created, reusing the
+  // session bootstrap request instead of a separate /app/dashboard call
   useEffect(() => {
     if (!isInitialized) {
-      refreshPinnedPanels();
       setIsInitialized(true);
+      fetchSession()
+        .then((sessionData) => {
+          if (sessionData) {
+            setPinnedPanels(sessionData.dashboard.pinned_panels || []);
+          }
+        })
+        .catch((error) => {
+          console.error("DashboardContext: Failed to load session:", error);
+        });
     }
-  }, [refreshPinnedPanels, isInitialized]);
+  }, [isInitialized]);
 
   const addPinnedPanel = useCallback((panel: GrafanaPanelConfig) => {
     setPinnedPanels((prev) => {
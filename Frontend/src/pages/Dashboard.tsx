@@ -95,25 +95,14 @@ function Dashboard() {
         }
       });
 
-      // Get current dashboard data first
-      const response = await axios.get('/app/dashboard', {
-        headers: {
-          'Authorization': `Bearer ${token}`
-        }
-      });
-
-      const currentPanels = response.data.panels || [];
-      const currentPinnedPanels = response.data.pinned_panels || [];
-
-      // Save the complete dashboard with layouts
-      await axios.post('/app/dashboard', {
-        panels: currentPanels,
-        pinned_panels: currentPinnedPanels,
-        dashboard_layouts: dashboardLayouts
-      }, {
+      // Only the layouts changed: send them as a JSON Patch instead of
+      // re-reading and re-posting the whole dashboard
+      await axios.patch('/app/dashboard', [
+        { op: 'replace', path: '/dashboard_layouts', value: dashboardLayouts }
+      ], {
         headers: {
           'Authorization': `Bearer ${token}`,
-          'Content-Type': 'application/json'
+          'Content-Type': 'application/json-patch+json'
         }
       });
 
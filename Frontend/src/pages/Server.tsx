@@ -24,13 +24,14 @@ import {
 } from '@mui/material';
 import React, { useEffect, useState } from 'react';
 import { FiPlus, FiRefreshCcw, FiTrash2 } from 'react-icons/fi';
-import { createServer, deleteServer, fetchServers, refreshServer, ServerRecord } from '../api/servers';
+import { createServer, deleteServer, fetchServer, fetchServers, refreshServer, ServerRecord } from '../api/servers';
 import Header from '../components/Header';
 import Sidebar from '../components/Sidebar';
 
 const Server: React.FC = () => {
   const [dialogOpen, setDialogOpen] = useState(false);
   const [servers, setServers] = useState<ServerRecord[]>([]);
+  const [nextCursor, setNextCursor] = useState<string | null>(null);
   const [loading, setLoading] = useState(false);
   const [submitting, setSubmitting] = useState(false);
   const [hostname, setHostname] = useState('');
@@ -40,19 +41,38 @@ const Server: React.FC = () => {
   const [rootPassword, setRootPassword] = useState('');
   const [error, setError] = useState<string | null>(null);
 
+  const loadPage = async (cursor: string | null = null) => {
+    setLoading(true);
+    try {
+      const page = await fetchServers({ cursor });
+      setServers(prev => cursor ? [...prev, ...page.servers] : page.servers);
+      setNextCursor(page.next_cursor);
+    } catch (e: any) {
+      setError(e.message);
+    } finally {
+      setLoading(false);
+    }
+  };
+
   useEffect(() => {
-    (async () => {
-      setLoading(true);
+    loadPage();
+  }, []);
+
+  // New servers start Pending while the backend runs the first probe
+  const pollPending = async (id: number, attempts = 10) => {
+    for (let i = 0; i < attempts; i++) {
+      await new Promise(resolve => setTimeout(resolve, 1000));
       try {
-        const list = await fetchServers();
-        setServers(list);
-      } catch (e: any) {
-        setError(e.message);
-      } finally {
-        setLoading(false);
+        const updated = await fetchServer(id);
+        if (updated.state !== 'Pending') {
+          setServers(prev => prev.map(s => s.id === id ? updated : s));
+          return;
+        }
+      } catch {
+        return; // deleted meanwhile
       }
-    })();
-  }, []);
+    }
+  };
 
   const resetForm = () => {
     setHostname('');
@@ -76,6 +96,7 @@ const Server: React.FC = () => {
       setServers(prev => [server, ...prev]);
       setDialogOpen(false);
       resetForm();
+      if (server.state === 'Pending') pollPending(server.id);
     } catch (e: any) {
       setError(e.message);
     } finally {
@@ -107,6 +128,7 @@ const Server: React.FC = () => {
     switch (state) {
       case 'Up': return 'success';
       case 'Down': return 'error';
+      case 'Pending': return 'warning';
       default: return 'default';
     }
   };
@@ -133,7 +155,7 @@ const Server: React.FC = () => {
                 </TableRow>
               </TableHead>
               <TableBody>
-                {loading && (
+                {loading && servers.length === 0 && (
                   <TableRow>
                     <TableCell colSpan={5} align="center" sx={{ py:4 }}>Loading...</TableCell>
                   </TableRow>
@@ -170,6 +192,13 @@ const Server: React.FC = () => {
               </TableBody>
             </Table>
           </TableContainer>
+          {nextCursor && (
+            <Box display="flex" justifyContent="center" mt={2}>
+              <Button variant="outlined" disabled={loading} onClick={() => loadPage(nextCursor)}>
+                {loading ? 'Loading...' : 'Load more'}
+              </Button>
+            </Box>
+          )}
         </Box>
       </div>
 